@@ -1,43 +1,157 @@
+import atexit
+import hmac
 import io
 import datetime
+import functools
+import itertools
+import json
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os import environ as env
 import os
-from anyio import Path
-import pypdf
-import PyPDF2
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
-from flask import Flask, jsonify, request, make_response
+from pathlib import Path
+from typing import BinaryIO
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, make_response, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from dotenv import find_dotenv, load_dotenv
 from elevenlabs import ElevenLabsModule
-from google import genai
+from idempotency import idempotent, mark_degraded, replay_with
+from singleflight import SingleFlight, request_key
+from hedging import HedgedCaller
+from cache import TTLCache, digest
+from archive import get_archive
+from audio_formats import (
+    Rendition,
+    default_rendition,
+    negotiate,
+    rendition_key,
+    speech_cache,
+    supported_types,
+)
+from chat_schema import (
+    SCHEMA_ATTRIBUTE,
+    SCHEMA_VERSION,
+    chat_history_update,
+    normalize_chat_history,
+    schema_current,
+)
+from memory import MEMORY_ATTRIBUTE, ConversationMemory
+from notes import extract_sections, merge_sections, prune_sections, render_notes
+from plan_scheduler import (
+    DEFAULT_ACTIVE_DAYS as DEFAULT_PLAN_ACTIVE_DAYS,
+    DEFAULT_CONCURRENCY as DEFAULT_PLAN_CONCURRENCY,
+    DEFAULT_HOURS as DEFAULT_PLAN_HOURS,
+    DEFAULT_MAX_PLANS,
+    PLANS_ATTRIBUTE,
+    WeeklyPlanScheduler,
+    parse_hours,
+    plan_freshness,
+)
+from prompt_cache import (
+    DEFAULT_MIN_CHARS as DEFAULT_PREFIX_MIN_CHARS,
+    DEFAULT_TTL_SECONDS as DEFAULT_PREFIX_TTL_SECONDS,
+    GeminiPrefixStore,
+    LocalPrefixStore,
+    PrefixCache,
+)
+from search_index import DEFAULT_INDEX_DIR, SearchIndex
+from speech_prefetch import SpeechPrefetcher
+from usage import (
+    DEFAULT_BUCKET_SECONDS,
+    DEFAULT_USAGE_DB,
+    configure_ledger,
+    metered,
+    note_usage,
+    record_usage,
+    usage_ledger,
+    usage_quotas,
+    usage_scope,
+)
+from uploads import SpooledUploadRequest, bounded_upload, iter_chunks, upload_max_bytes
+from write_behind import (DEFAULT_COMPACT_BYTES, DEFAULT_MAX_ATTEMPTS, DEFAULT_WAL_PATH,
+                          WriteBehindBuffer)
+from storage_codec import (
+    CODEC_ATTRIBUTE,
+    CONTEXT_BLOB,
+    FORMAT_ZLIB_JSON,
+    codec_enabled,
+    decode_item,
+    decode_value,
+    encode_value,
+)
+
+# boto3, google.genai and the PDF libraries are imported on first use; they
+# dominate import time and most requests never touch the PDF path.
 
 ENV_FILE = find_dotenv()
 if ENV_FILE:
     load_dotenv(ENV_FILE)
 
-app = Flask(__name__)
-client = genai.Client(api_key=env.get("GEMINI_API_KEY"))
-allowed_origins = [
-    origin.strip()
-    for origin in (env.get("ALLOWED_ORIGINS") or "http://localhost:3001,http://localhost:5173").split(",")
-    if origin.strip()
-]
-CORS(app, resources={r"/*": {"origins": allowed_origins}}, supports_credentials=True)
-app.secret_key = env.get("APP_SECRET_KEY")
+api = Blueprint("api", __name__)
 PRIMARY_KEY = "ElectronincTeachingAssistantMaterialID"
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-table = dynamodb.Table('ETA')
+
+@functools.cache
+def _gemini_client():
+    from google import genai
+
+    return genai.Client(api_key=env.get("GEMINI_API_KEY"))
+
+
+@functools.cache
+def _table():
+    import boto3
+
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
+    return dynamodb.Table('ETA')
+
+
+@functools.cache
+def _lease_table():
+    # Scheduler leases live apart from the user table, so exports, schema
+    # migrations and scans of ETA never see them.
+    import boto3
+
+    dynamodb = boto3.resource('dynamodb', region_name=env.get("AWS_REGION") or 'us-east-2')
+    return dynamodb.Table(env.get("WEEKLY_PLAN_LEASE_TABLE") or 'ETALeases')
+
+
+gemini_flight = SingleFlight()
+GEMINI_HEDGE_MODEL = env.get("GEMINI_HEDGE_MODEL") or None
+HOT_MESSAGE_LIMIT = int(env.get("THREAD_HOT_MESSAGES") or 40)
+ARCHIVE_BATCH = int(env.get("THREAD_ARCHIVE_BATCH") or 10)
+# While the archive keeps failing, a thread may hold this many messages
+# before it is truncated anyway, so the user item cannot grow without bound.
+HARD_MESSAGE_LIMIT = 2 * HOT_MESSAGE_LIMIT
+# Threads per user that keep structured NotesSections in the user item.
+NOTES_MAX_THREADS = int(env.get("NOTES_MAX_THREADS") or 8)
+generation_cache = TTLCache(
+    max_entries=int(env.get("GENERATION_CACHE_MAX_ENTRIES") or 512),
+    ttl_seconds=float(env.get("GENERATION_CACHE_TTL_SECONDS") or 1800),
+)
+PROMPT_CACHE_STORES = {"gemini": lambda: GeminiPrefixStore(_gemini_client), "local": LocalPrefixStore}
+_prompt_cache_store = (env.get("PROMPT_CACHE") or "none").strip().lower()
+prompt_cache = (
+    PrefixCache(
+        PROMPT_CACHE_STORES[_prompt_cache_store](),
+        ttl_seconds=float(env.get("PROMPT_CACHE_TTL_SECONDS") or DEFAULT_PREFIX_TTL_SECONDS),
+        min_chars=int(env.get("PROMPT_CACHE_MIN_CHARS") or DEFAULT_PREFIX_MIN_CHARS),
+    )
+    if _prompt_cache_store in PROMPT_CACHE_STORES
+    else None
+)
 
 
 def _fetch_latest_user_item(eta_id: str) -> tuple[dict | None, str | None]:
     if not eta_id:
         return None, None
 
-    response = table.query(
+    from boto3.dynamodb.conditions import Key
+
+    response = _table().query(
         KeyConditionExpression=Key(PRIMARY_KEY).eq(eta_id),
         ScanIndexForward=False,
         Limit=1,
@@ -46,14 +160,25 @@ def _fetch_latest_user_item(eta_id: str) -> tuple[dict | None, str | None]:
     if not items:
         return None, None
 
-    item = items[0]
+    item = _load_item(items[0])
     return item, item.get("UploadDate")
 
 
+def _fetch_latest_user_items(eta_ids: list[str], workers: int) -> dict[str, dict | None]:
+    # Items are keyed by (ETA id, UploadDate) and only the id is known, so
+    # BatchGetItem does not apply; each user is one Limit=1 query, run in parallel.
+    unique = list(dict.fromkeys(eta_ids))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique) or 1))) as executor:
+        items = executor.map(lambda eta_id: _fetch_latest_user_item(eta_id)[0], unique)
+        return dict(zip(unique, items))
+
+
 def _scan_for_user_by(field_name: str, value: str) -> tuple[dict | None, str | None]:
     if not value:
         return None, None
 
+    from boto3.dynamodb.conditions import Attr
+
     scan_kwargs = {
         "FilterExpression": Attr(field_name).eq(value),
     }
@@ -62,10 +187,10 @@ def _scan_for_user_by(field_name: str, value: str) -> tuple[dict | None, str | N
     while True:
         if last_evaluated_key:
             scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
-        response = table.scan(**scan_kwargs)
+        response = _table().scan(**scan_kwargs)
         items = response.get("Items", [])
         if items:
-            item = items[0]
+            item = _load_item(items[0])
             return item, item.get("UploadDate")
         last_evaluated_key = response.get("LastEvaluatedKey")
         if not last_evaluated_key:
@@ -78,86 +203,82 @@ def _to_iso_timestamp() -> str:
     return datetime.datetime.now(datetime.timezone.utc).isoformat()
 
 
-def _normalize_message_entry(entry) -> dict | None:
-    if isinstance(entry, dict):
-        role = entry.get("role") or entry.get("Role")
-        content = entry.get("content") or entry.get("message") or entry.get("text")
-        timestamp = entry.get("timestamp") or entry.get("created_at")
-    elif isinstance(entry, (list, tuple)) and entry:
-        role = entry[0] if len(entry) > 0 else None
-        content = entry[1] if len(entry) > 1 else None
-        timestamp = entry[2] if len(entry) > 2 else None
-    else:
-        return None
+def _write_chat_history(eta_id: str, upload_date: str, chat_history: list[dict]):
+    _table().update_item(
+        Key={
+            PRIMARY_KEY: eta_id,
+            "UploadDate": upload_date,
+        },
+        **chat_history_update(chat_history),
+    )
 
-    content = (content or "").strip()
-    if not content:
-        return None
 
-    role = (role or "assistant").strip().lower()
-    if role not in {"assistant", "user", "system"}:
-        role = "assistant" if role.startswith("assist") else "user"
+def _chat_history(item: dict) -> list[dict]:
+    # Items at the current schema version were normalized when written.
+    if schema_current(item):
+        return item.get("ChatHistory") or []
+    return normalize_chat_history(item.get("ChatHistory", []))
 
-    return {
-        "role": role,
-        "content": content,
-        "timestamp": timestamp or _to_iso_timestamp(),
-    }
 
+def _persist_chat_history(eta_id: str, upload_date: str, chat_history: list[dict]):
+    # With write-behind on, the write is logged locally and flushed in the
+    # background; reads go through _load_item so they see it immediately.
+    if write_behind:
+        write_behind.enqueue(eta_id, upload_date, chat_history)
+        return
+    _write_chat_history(eta_id, upload_date, chat_history)
+
+
+def _load_item(raw: dict | None) -> dict | None:
+    item = decode_item(raw)
+    if item and write_behind:
+        pending = write_behind.pending(item.get(PRIMARY_KEY), item.get("UploadDate"))
+        if pending is not None:
+            item["ChatHistory"] = pending
+            item[SCHEMA_ATTRIBUTE] = SCHEMA_VERSION
+    return item
 
-def _migrate_thread_messages(thread: dict) -> list:
-    messages = thread.get("Messages")
-    if isinstance(messages, list) and messages:
-        return messages
-
-    user_msgs = thread.get("User") or []
-    assistant_msgs = thread.get("Assistant") or []
-    migrated: list = []
-    max_len = max(len(user_msgs), len(assistant_msgs))
-    for idx in range(max_len):
-        if idx < len(user_msgs):
-            migrated.append(("user", user_msgs[idx]))
-        if idx < len(assistant_msgs):
-            migrated.append(("assistant", assistant_msgs[idx]))
-    return migrated
-
-
-def _normalize_thread(thread: dict, fallback_index: int = 0) -> dict:
-    thread = dict(thread or {})
-    chat_id = str(thread.get("ChatID") or fallback_index)
-    messages = _migrate_thread_messages(thread)
-    normalized_messages: list[dict] = []
-    for entry in messages or []:
-        normalized = _normalize_message_entry(entry)
-        if normalized:
-            normalized_messages.append(normalized)
-
-    thread["ChatID"] = chat_id
-    thread["Messages"] = normalized_messages
-    thread.setdefault("Title", f"Session {fallback_index + 1}")
-    thread.setdefault("CreatedAt", thread.get(
-        "CreatedAt") or _to_iso_timestamp())
-    return thread
-
-
-def _normalize_chat_history(chat_history: list | None) -> list[dict]:
-    normalized = []
-    for index, thread in enumerate(chat_history or []):
-        if not isinstance(thread, dict):
-            continue
-        normalized.append(_normalize_thread(thread, index))
-    return normalized
 
+def _compact_context(key: dict, attributes: dict):
+    """Fold plain `Context` entries appended with list_append into `ContextBlob`.
 
-def _persist_chat_history(eta_id: str, upload_date: str, chat_history: list[dict]):
-    table.update_item(
-        Key={
-            PRIMARY_KEY: eta_id,
-            "UploadDate": upload_date,
-        },
-        UpdateExpression="SET ChatHistory = :chats",
-        ExpressionAttributeValues={":chats": chat_history},
-    )
+    The update is conditional on neither attribute having moved since
+    `attributes` was read, so a concurrent append is never lost; the losing
+    writer simply leaves compaction to the next append.
+    """
+    pending = attributes.get("Context") or []
+    if not pending:
+        return
+    from botocore.exceptions import ClientError
+
+    previous_blob = attributes.get(CONTEXT_BLOB)
+    compacted = (decode_value(previous_blob) or []) if previous_blob is not None else []
+    values = {
+        ":blob": encode_value(compacted + list(pending)),
+        ":codec": FORMAT_ZLIB_JSON,
+        ":pending": len(pending),
+    }
+    condition = "size(#ctx) = :pending AND "
+    if previous_blob is None:
+        condition += "attribute_not_exists(#blob)"
+    else:
+        condition += "#blob = :previous"
+        values[":previous"] = previous_blob
+    try:
+        _table().update_item(
+            Key=key,
+            UpdateExpression="SET #blob = :blob, #codec = :codec REMOVE #ctx",
+            ConditionExpression=condition,
+            ExpressionAttributeNames={
+                "#ctx": "Context",
+                "#blob": CONTEXT_BLOB,
+                "#codec": CODEC_ATTRIBUTE,
+            },
+            ExpressionAttributeValues=values,
+        )
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
 
 
 def _append_message(thread: dict, role: str, content: str):
@@ -169,6 +290,45 @@ def _append_message(thread: dict, role: str, content: str):
     })
 
 
+def _trim_thread(eta_id: str, thread: dict):
+    """Keep at most HOT_MESSAGE_LIMIT messages in the thread item.
+
+    Older messages move to the archive tier in batches of ARCHIVE_BATCH so a
+    segment is written once per few exchanges rather than on every call.
+    They leave the thread only once the archive has accepted them; if the
+    write fails they stay and the next trim tries again, up to
+    HARD_MESSAGE_LIMIT, past which the thread is truncated as without an
+    archive.
+    """
+    messages = thread.get("Messages") or []
+    if len(messages) <= HOT_MESSAGE_LIMIT:
+        return
+
+    archive = get_archive()
+    if archive is None:
+        thread["Messages"] = messages[-HOT_MESSAGE_LIMIT:]
+        return
+
+    keep = max(HOT_MESSAGE_LIMIT - ARCHIVE_BATCH, 1)
+    overflow = messages[:-keep]
+    try:
+        archive.append_segment(eta_id, str(thread.get("ChatID")), overflow)
+    except Exception as exc:
+        if len(messages) > HARD_MESSAGE_LIMIT:
+            current_app.logger.error(
+                "Archiving %d messages failed and the thread is over %d messages, "
+                "dropping %d: %s", len(overflow), HARD_MESSAGE_LIMIT,
+                len(messages) - HOT_MESSAGE_LIMIT, exc, exc_info=True)
+            thread["Messages"] = messages[-HOT_MESSAGE_LIMIT:]
+            return
+        current_app.logger.error(
+            "Archiving %d messages failed, keeping them in the thread: %s",
+            len(overflow), exc, exc_info=True)
+        return
+    thread["Messages"] = messages[-keep:]
+    thread["ArchivedMessages"] = int(thread.get("ArchivedMessages") or 0) + len(overflow)
+
+
 def _create_user_record(name: str, email: str, auth0_sub: str | None = None) -> dict:
     eta_id = str(uuid.uuid4())
     upload_date = _to_iso_timestamp()
@@ -180,25 +340,447 @@ def _create_user_record(name: str, email: str, auth0_sub: str | None = None) ->
         "ChatHistory": [],
         "Context": [],
         "Uploads": [],
+        SCHEMA_ATTRIBUTE: SCHEMA_VERSION,
     }
     if auth0_sub:
         item["Auth0Sub"] = auth0_sub
 
-    response = table.put_item(Item=item)
+    response = _table().put_item(Item=item)
     status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
     if status_code != 200:
         raise RuntimeError("Failed to store user")
     return item
 
 
-def extract_text_from_pdf(file_bytes: bytes) -> tuple[str, dict]:
-    """Extract UTF-8 text from a PDF binary payload.
+def _generate_content(model: str, contents: list, prefix: str | None = None,
+                      prefix_scope: tuple = (), call_class: str = "chat"):
+    """Call Gemini with `contents`, optionally after a stable `prefix`.
+
+    With a prefix cache the prefix goes out as a cached-content handle keyed
+    by `prefix_scope` (ETA id first); otherwise it is prepended to the first
+    part so the prompt is unchanged. `call_class` picks the deadline and
+    hedging policy (see GEMINI_CALL_CLASSES).
+    """
+    hedger = gemini_hedges[call_class]
+    if prefix and not prompt_cache:
+        first, *rest = contents
+        parts = first["parts"]
+        contents = [dict(first, parts=[{"text": f"{prefix}\n\n{parts[0]['text']}"}, *parts[1:]]), *rest]
+        prefix = None
+
+    # Identical (model, prompt) requests already in flight share one upstream call.
+    def call(name: str):
+        def run():
+            config = dict(
+                prompt_cache.config(name, prefix, *prefix_scope) if prefix else {},
+                # Abandoned hedge losers are cut off at the deadline rather than left running.
+                http_options={"timeout": int(hedger.deadline * 1000)},
+            )
+            return _gemini_client().models.generate_content(model=name, contents=contents, config=config)
+        return run
+
+    backup = call(GEMINI_HEDGE_MODEL or model) if hedger.hedge else None
+    started = time.monotonic()
+    response, ran = gemini_flight.execute(
+        request_key(model, [prefix, contents] if prefix else contents),
+        lambda: hedger.call(call(model), backup),
+    )
+    try:
+        output_chars = sum(len(part.text or "") for part in response.candidates[0].content.parts)
+    except Exception:
+        output_chars = 0
+    # Callers coalesced onto another request's call made no upstream call.
+    note_usage(
+        upstream_calls=1 if ran else 0,
+        upstream_ms=(time.monotonic() - started) * 1000 if ran else 0,
+        prompt_chars=len(prefix or "") + sum(
+            len(part.get("text") or "") for entry in contents for part in entry.get("parts", [])),
+        output_chars=output_chars,
+    )
+    return response
+
+
+def _generate_text(prompt: str, call_class: str = "chat") -> str:
+    response = _generate_content(
+        model="gemini-2.5-flash",
+        contents=[
+            {
+                "role": "user",
+                "parts": [{"text": prompt}],
+            }
+        ],
+        call_class=call_class,
+    )
+    candidate = response.candidates[0]
+    return "".join(part.text for part in candidate.content.parts).strip()
+
+
+def _is_truthy(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Each class of Gemini call keeps its own latency window, hedge delay,
+# deadline and worker pool, so slow PDF summaries neither stretch the chat
+# hedge delay nor tie up the workers chat requests run on.
+GEMINI_CALL_CLASSES = ("chat", "practice", "weekly_plan", "memory", "upload_summary")
+
+
+def _gemini_hedger(call_class: str) -> HedgedCaller:
+    prefix = f"GEMINI_{call_class.upper()}_"
+    if call_class == "upload_summary":
+        # Whole documents routinely take longer than a chat reply; a hedge
+        # would only pay for the same summary twice.
+        deadline = env.get(prefix + "DEADLINE_SECONDS") or 300
+        hedge = env.get(prefix + "HEDGE") or "0"
+    else:
+        deadline = env.get(prefix + "DEADLINE_SECONDS") or env.get("GEMINI_DEADLINE_SECONDS") or 60
+        hedge = env.get(prefix + "HEDGE") or env.get("GEMINI_HEDGE") or "0"
+    return HedgedCaller(
+        percentile=float(env.get("GEMINI_HEDGE_PERCENTILE") or 0.95),
+        initial_delay=float(env.get("GEMINI_HEDGE_INITIAL_DELAY_SECONDS") or 4),
+        min_delay=float(env.get("GEMINI_HEDGE_MIN_DELAY_SECONDS") or 0.5),
+        max_delay=float(env.get("GEMINI_HEDGE_MAX_DELAY_SECONDS") or 15),
+        deadline=float(deadline),
+        workers=int(env.get("GEMINI_WORKERS_PER_CLASS") or 16),
+        hedge=_is_truthy(hedge),
+    )
+
+
+gemini_hedges = {name: _gemini_hedger(name) for name in GEMINI_CALL_CLASSES}
+
+
+MEMORY_ENABLED = _is_truthy(env.get("CONVERSATION_MEMORY") or "1")
+conversation_memory = ConversationMemory(
+    lambda: _table(),
+    lambda prompt: _generate_text(prompt, "memory"),
+    PRIMARY_KEY,
+    recent_messages=int(env.get("MEMORY_RECENT_MESSAGES") or 6),
+    summary_batch=int(env.get("MEMORY_SUMMARY_BATCH") or 4),
+    max_threads=int(env.get("MEMORY_MAX_THREADS") or 20),
+)
+
+
+def _thread_memory(item: dict, thread: dict) -> dict | None:
+    if not MEMORY_ENABLED:
+        return None
+    return (item.get(MEMORY_ATTRIBUTE) or {}).get(str(thread.get("ChatID")))
+
+
+# Built by create_app() when CHAT_WRITE_BEHIND is on. Building it replays
+# the log and starts the flush thread, so it never happens at import, and
+# only once: a single process may own the log.
+write_behind: WriteBehindBuffer | None = None
+_write_behind_lock = threading.Lock()
+
+
+def _start_write_behind(wal_path: Path):
+    global write_behind
+    with _write_behind_lock:
+        if write_behind is not None:
+            return
+        write_behind = WriteBehindBuffer(
+            _write_chat_history,
+            wal_path,
+            flush_delay=float(env.get("CHAT_WRITE_BEHIND_DELAY_MS") or 50) / 1000,
+            compact_bytes=int(env.get("CHAT_WRITE_BEHIND_COMPACT_BYTES") or DEFAULT_COMPACT_BYTES),
+            max_attempts=int(env.get("CHAT_WRITE_BEHIND_MAX_ATTEMPTS") or DEFAULT_MAX_ATTEMPTS),
+        )
+        atexit.register(write_behind.flush)
+
+
+def _persona_voice(module: ElevenLabsModule, persona: str) -> str:
+    # The front-end sends persona ids ("study-buddy"); PERSONAS keys use spaces.
+    _, voice_id = module.resolve_persona((persona or "").replace("-", " "), "")
+    return voice_id
+
+
+def _speech_audio(text: str, voice_id: str, rendition: Rendition) -> tuple[bytes, str]:
+    """Return `(audio, rendition_key)`, rendering only on a cache miss."""
+    key = rendition_key(text, voice_id, rendition)
+    cached = speech_cache.get(key)
+    if cached is not None:
+        return cached[0], key
+    module = ElevenLabsModule()
+    module.load_env()
+    started = time.monotonic()
+    audio = module.elevenlabs_speech(text, voice_id=voice_id, output_format=rendition.output_format,
+                                     mimetype=rendition.mimetype)
+    note_usage(upstream_calls=1, upstream_ms=(time.monotonic() - started) * 1000,
+               audio_bytes=len(audio))
+    speech_cache.set(key, (audio, rendition.mimetype))
+    return audio, key
+
+
+def _render_speech(text: str, voice_id: str) -> tuple[bytes, str]:
+    # Speculative renders use the rendition a plain request negotiates to.
+    audio, _ = _speech_audio(text, voice_id, default_rendition())
+    module = ElevenLabsModule()
+    module.load_env()
+    return audio, module.reply_emotion(text)
+
+
+def _metered_audio(chunks, eta_id: str, key: str | None = None, mimetype: str = "audio/mpeg"):
+    # Streamed audio is produced after the request has been accounted; a
+    # stream that runs to the end is kept as a cached rendition too.
+    sent = 0
+    received = []
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            received.append(chunk)
+            yield chunk
+        if key:
+            speech_cache.set(key, (b"".join(received), mimetype))
+    finally:
+        record_usage(eta_id, "voice", audio_bytes=sent)
+
+
+def _audio_response(audio: bytes, mimetype: str, key: str) -> Response:
+    response = make_response(audio)
+    response.headers["Content-Type"] = mimetype
+    response.headers["Content-Location"] = f"{request.script_root}/voice-response/audio/{key}"
+    return response
+
+
+def _streamed_audio_response(module: ElevenLabsModule, text: str, voice_id: str, eta_id: str,
+                             rendition: Rendition) -> Response:
+    key = rendition_key(text, voice_id, rendition)
+    response = Response(
+        _metered_audio(module.elevenlabs_speech_pipelined(
+            text, voice_id=voice_id, output_format=rendition.output_format),
+            eta_id, key, rendition.mimetype),
+        mimetype=rendition.mimetype,
+    )
+    response.headers["Content-Location"] = f"{request.script_root}/voice-response/audio/{key}"
+    return response
+
+
+speech_prefetch = (
+    SpeechPrefetcher(
+        _render_speech,
+        workers=int(env.get("SPECULATIVE_TTS_WORKERS") or 2),
+        max_pending=int(env.get("SPECULATIVE_TTS_MAX_PENDING") or 8),
+        ttl_seconds=float(env.get("SPECULATIVE_TTS_TTL_SECONDS") or 600),
+    )
+    if _is_truthy(env.get("SPECULATIVE_TTS"))
+    else None
+)
+SPECULATIVE_TTS_WAIT = float(env.get("SPECULATIVE_TTS_WAIT_SECONDS") or 10)
+
+
+SEARCH_ENABLED = _is_truthy(env.get("SEARCH_INDEX") or "1")
+# How often /search re-reads the user item to pick up writes handled by other
+# instances; this instance's own writes are indexed as they happen.
+SEARCH_RESYNC_SECONDS = float(env.get("SEARCH_RESYNC_SECONDS") or 300)
+search_index = SearchIndex(Path(env.get("SEARCH_INDEX_DIR") or DEFAULT_INDEX_DIR))
+
+
+def _index_for_search(eta_id: str, *, thread: dict | None = None, context: list | None = None):
+    # The index is derived data: a failure here must never fail the request,
+    # and /search catches up from DynamoDB within SEARCH_RESYNC_SECONDS.
+    if not SEARCH_ENABLED:
+        return
+    try:
+        if thread is not None:
+            search_index.index_thread(eta_id, thread)
+        if context:
+            search_index.index_context(eta_id, context)
+    except Exception as exc:
+        current_app.logger.warning("Search indexing failed: %s", exc, exc_info=True)
+
+
+def _history_text(item: dict, thread: dict, window: int) -> str:
+    return conversation_memory.history_text(
+        thread.get("Messages", []), _thread_memory(item, thread), window)
+
+
+def _context_version(context: list | None) -> str:
+    # Context is append-only, so its length plus the newest entry's timestamp
+    # changes whenever anything is added.
+    if not context:
+        return "0"
+    latest = context[-1]
+    stamp = latest.get("uploaded_at") if isinstance(latest, dict) else str(latest)
+    return f"{len(context)}:{stamp}"
+
+
+def _generation_cache_key(route: str, persona: str, user_request: str,
+                          window: list[dict], context: list | None) -> str:
+    return digest(
+        route,
+        persona,
+        user_request,
+        [(entry["role"], entry["content"]) for entry in window],
+        _context_version(context),
+    )
+
+
+def _lookup_generation(route: str, persona: str, user_request: str, messages: list[dict],
+                       window_size: int, context: list | None) -> tuple[str | None, bool]:
+    """Return `(cached_output, already_in_thread)` for a generate-* route.
+
+    A repeat click sees the previous result appended to the thread, so the
+    window just before that message is checked as well.
+    """
+    key = _generation_cache_key(
+        route, persona, user_request, messages[-window_size:], context)
+    cached = generation_cache.get(key)
+    if cached is not None:
+        return cached, False
+
+    if messages and messages[-1]["role"] == "assistant":
+        previous_key = _generation_cache_key(
+            route, persona, user_request, messages[:-1][-window_size:], context)
+        cached = generation_cache.get(previous_key)
+        if cached is not None and cached == messages[-1]["content"]:
+            return cached, True
+    return None, False
+
+
+PRACTICE_DEFAULT_REQUEST = "Prepare a short set of practice problems that reinforce the key concepts we've discussed."
+
+
+def _append_generated(eta_id: str, thread: dict, content: str) -> bool:
+    if not content:
+        return False
+    _append_message(thread, "assistant", content)
+    _trim_thread(eta_id, thread)
+    thread["UpdatedAt"] = _to_iso_timestamp()
+    return True
+
+
+def _practice_problems(eta_id: str, item: dict, thread: dict, persona: str,
+                       user_request: str, refresh: bool) -> tuple[str, bool, bool]:
+    """Generate practice problems for `thread`.
+
+    Returns `(text, cached, append)`, where `append` says whether `text` is
+    not yet the thread's last message. The thread is left untouched so a
+    batch can add the results to a fresh read of the user. Gemini errors
+    propagate.
+    """
+    context = item.get("Context", [])
+    messages = thread.get("Messages", [])
+    if not refresh:
+        cached, in_thread = _lookup_generation(
+            "practice", persona, user_request, messages, 12, context)
+        if cached is not None:
+            return cached, True, not in_thread
+    cache_key = _generation_cache_key(
+        "practice", persona, user_request, messages[-12:], context)
+
+    history_text = _history_text(item, thread, 12)
+
+    context_snippets = []
+    for ctx in context or []:
+        if isinstance(ctx, dict):
+            snippet = ctx.get("summary") or ctx.get("content")
+        else:
+            snippet = str(ctx)
+        if snippet:
+            context_snippets.append(str(snippet))
+    context_text = "\n".join(context_snippets)
+
+    prompt = (
+        "You are an educational assistant crafting targeted practice problems.\n"
+        "Use the conversation history and context below to generate concise, solvable problems. "
+        "Provide numbered problems and keep explanations short unless requested otherwise.\n\n"
+        f"Conversation history:\n{history_text or 'No prior conversation.'}\n\n"
+        f"Context:\n{context_text or 'No additional context provided.'}\n\n"
+        f"User request: {user_request}\n"
+        "Respond with the practice problems only."
+    )
+
+    assistant_message = _generate_text(prompt, "practice")
+    if assistant_message:
+        generation_cache.set(cache_key, assistant_message)
+    return assistant_message, False, bool(assistant_message)
+
+
+def _weekly_plan_prompt(item: dict, thread: dict) -> str:
+    history_text = _history_text(item, thread, 16)
+
+    context_lines = []
+    for ctx in item.get("Context") or []:
+        if isinstance(ctx, dict):
+            snippet = ctx.get("summary") or ctx.get("content")
+        else:
+            snippet = str(ctx)
+        if snippet:
+            context_lines.append(str(snippet))
+    context_text = "\n".join(context_lines)
+
+    return (
+        "You are an educational assistant creating a concise yet actionable weekly study plan.\n"
+        "Consider the learner's recent conversation and their stored context to produce a plan covering seven days. "
+        "Each day should include focus topics, estimated time, and a quick rationale. "
+        "Keep the tone encouraging and organized with clear headings.\n\n"
+        f"Conversation history:\n{history_text or 'No recent conversation available.'}\n\n"
+        f"Context:\n{context_text or 'No additional context provided.'}\n\n"
+        "Deliver the weekly plan now."
+    )
+
+
+def _weekly_plan_freshness(item: dict, thread: dict) -> str:
+    return plan_freshness(thread, _context_version(item.get("Context")))
+
+
+def _precomputed_weekly_plan(item: dict, thread: dict) -> str | None:
+    # Plans written by the off-peak scheduler; stale once the thread or the
+    # context has moved on since.
+    stored = (item.get(PLANS_ATTRIBUTE) or {}).get(str(thread.get("ChatID"))) or {}
+    if stored.get("content") and stored.get("freshness") == _weekly_plan_freshness(item, thread):
+        return stored["content"]
+    return None
+
+
+def _scheduled_weekly_plan(item: dict, thread: dict) -> str:
+    eta_id = item.get(PRIMARY_KEY)
+    with usage_scope() as usage:
+        try:
+            return _generate_text(_weekly_plan_prompt(item, thread), "weekly_plan")
+        finally:
+            record_usage(eta_id, "weekly_plan_scheduled", requests=1, **usage)
+
+
+def _scheduler_item(raw: dict) -> dict:
+    item = _load_item(raw)
+    # Normalizing a legacy history stamps fresh timestamps each time, so its
+    # freshness marker would never match; such users are planned once migrated.
+    if not schema_current(item):
+        item["ChatHistory"] = []
+    return item
 
-    Returns a `(text, debug)` tuple so callers can inspect why extraction
-    succeeded or failed.
+
+# Started by create_app() when WEEKLY_PLAN_SCHEDULE is on; constructing it
+# starts nothing.
+weekly_plan_scheduler = WeeklyPlanScheduler(
+    lambda: _table(),
+    _scheduler_item,
+    _scheduled_weekly_plan,
+    _weekly_plan_freshness,
+    PRIMARY_KEY,
+    hours=parse_hours(env.get("WEEKLY_PLAN_HOURS") or DEFAULT_PLAN_HOURS),
+    active_days=float(env.get("WEEKLY_PLAN_ACTIVE_DAYS") or DEFAULT_PLAN_ACTIVE_DAYS),
+    concurrency=int(env.get("WEEKLY_PLAN_CONCURRENCY") or DEFAULT_PLAN_CONCURRENCY),
+    segments=int(env.get("WEEKLY_PLAN_SCAN_SEGMENTS") or 1),
+    max_plans=int(env.get("WEEKLY_PLAN_MAX_PLANS") or DEFAULT_MAX_PLANS),
+    lease_table_getter=lambda: _lease_table(),
+)
+
+
+def extract_text_from_pdf(source: bytes | BinaryIO) -> tuple[str, dict]:
+    """Extract UTF-8 text from a PDF binary payload or seekable binary file.
+
+    Every extractor reads from the same stream, so an upload spooled to disk
+    is never copied into memory wholesale. Returns a `(text, debug)` tuple so
+    callers can inspect why extraction succeeded or failed.
     """
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    stream.seek(0, io.SEEK_END)
     debug: dict[str, object] = {
-        "size_bytes": len(file_bytes),
+        "size_bytes": stream.tell(),
         "pypdf": None,
         "pypdf_pages": 0,
         "pypdf_error": None,
@@ -213,9 +795,12 @@ def extract_text_from_pdf(file_bytes: bytes) -> tuple[str, dict]:
     collected_text: list[str] = []
 
     try:
+        import pypdf
+
         debug["pypdf"] = "available"
         try:
-            reader = pypdf.PdfReader(io.BytesIO(file_bytes))
+            stream.seek(0)
+            reader = pypdf.PdfReader(stream)
             debug["pypdf_pages"] = len(reader.pages)
             for page in reader.pages:
                 extracted = page.extract_text() or ""
@@ -232,10 +817,12 @@ def extract_text_from_pdf(file_bytes: bytes) -> tuple[str, dict]:
         return "\n".join(collected_text), debug
 
     try:
+        import PyPDF2
 
         debug["pypdf2"] = "available"
         try:
-            reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+            stream.seek(0)
+            reader = PyPDF2.PdfReader(stream)
             debug["pypdf2_pages"] = len(reader.pages)
             for page in reader.pages:
                 extracted = page.extract_text() or ""
@@ -253,12 +840,12 @@ def extract_text_from_pdf(file_bytes: bytes) -> tuple[str, dict]:
 
     # Fallback: simple text extraction from literal strings in content stream.
     try:
-        data = file_bytes.decode("latin-1", errors="ignore")
         literals = []
         buffer = []
         escaping = False
         recording = False
-        for char in data:
+        for char in itertools.chain.from_iterable(
+                chunk.decode("latin-1") for chunk in iter_chunks(stream)):
             if char == "(" and not recording:
                 recording = True
                 buffer = []
@@ -286,7 +873,72 @@ def extract_text_from_pdf(file_bytes: bytes) -> tuple[str, dict]:
     return "", debug
 
 
-@app.route("/generate-user", methods=["POST"])
+@api.errorhandler(RequestEntityTooLarge)
+def upload_too_large(_exc):
+    return jsonify({"error": f"File too large (limit {upload_max_bytes()} bytes)"}), 413
+
+
+@api.route("/metrics/gemini", methods=["GET"])
+def gemini_metrics():
+    return jsonify({
+        "coalescing": gemini_flight.stats(),
+        "generation_cache": generation_cache.stats(),
+        "hedging": {name: hedger.stats() for name, hedger in gemini_hedges.items()},
+        "prompt_cache": prompt_cache.stats() if prompt_cache else None,
+        "weekly_plan_scheduler": weekly_plan_scheduler.stats() if weekly_plan_scheduler.started else None,
+    }), 200
+
+
+def _admin_authorized() -> bool:
+    # Admin routes stay closed until ADMIN_TOKEN is configured.
+    token = env.get("ADMIN_TOKEN")
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get("X-Admin-Token") or "", token)
+
+
+def _epoch_arg(name: str) -> int | None:
+    value = (request.args.get(name) or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp())
+
+
+@api.route("/usage/report", methods=["GET"])
+def usage_report():
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    ledger = usage_ledger()
+    if not ledger:
+        return jsonify({"error": "Usage ledger is disabled"}), 404
+    try:
+        since, until = _epoch_arg("since"), _epoch_arg("until")
+        limit = min(int(request.args.get("limit") or 500), 5000)
+    except ValueError:
+        return jsonify({"error": "since/until must be epoch seconds or ISO timestamps"}), 400
+
+    by_bucket = (request.args.get("granularity") or "").strip().lower() == "bucket"
+    rows = ledger.report(
+        eta_id=(request.args.get("eta_id") or request.args.get("etaId") or "").strip() or None,
+        route=(request.args.get("route") or "").strip() or None,
+        since=since,
+        until=until,
+        by_bucket=by_bucket,
+        limit=limit,
+    )
+    for row in rows:
+        if "bucket" in row:
+            row["bucket"] = datetime.datetime.fromtimestamp(
+                row["bucket"], datetime.timezone.utc).isoformat()
+    return jsonify({"bucket_seconds": ledger.bucket_seconds, "rows": rows}), 200
+
+
+@api.route("/generate-user", methods=["POST"])
 def generate_new_user():
     try:
         data = request.get_json(force=True, silent=True)
@@ -311,37 +963,32 @@ def generate_new_user():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/get-user/<eta_id>", methods=["GET"])
+@api.route("/get-user/<eta_id>", methods=["GET"])
 def get_user(eta_id):
     try:
         upload_date = request.args.get("upload_date")
 
         if upload_date:
-            response = table.get_item(
+            response = _table().get_item(
                 Key={
                     PRIMARY_KEY: eta_id,
                     'UploadDate': upload_date,
                 }
             )
-            item = response.get("Item")
+            item = _load_item(response.get("Item"))
             if not item:
                 return jsonify({"error": "User not found"}), 404
             return jsonify(item), 200
 
-        response = table.query(
-            KeyConditionExpression=Key(PRIMARY_KEY).eq(eta_id),
-            ScanIndexForward=False,
-            Limit=1,
-        )
-        items = response.get("Items", [])
-        if not items:
+        item, _ = _fetch_latest_user_item(eta_id)
+        if not item:
             return jsonify({"error": "User not found"}), 404
-        return jsonify(items[0]), 200
+        return jsonify(item), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/user/sync", methods=["POST"])
+@api.route("/user/sync", methods=["POST"])
 def sync_user():
     try:
         data = request.get_json(force=True, silent=True) or {}
@@ -381,7 +1028,7 @@ def sync_user():
                     ", ".join(f"{key} = :{key}" for key in update_fields)
                 expression_values = {
                     f":{key}": value for key, value in update_fields.items()}
-                table.update_item(
+                _table().update_item(
                     Key={
                         PRIMARY_KEY: eta_id,
                         "UploadDate": upload_date,
@@ -392,13 +1039,11 @@ def sync_user():
                 item.update(update_fields)
 
         eta_id = item[PRIMARY_KEY]
-        normalized_history = _normalize_chat_history(
-            item.get("ChatHistory", []))
-        if normalized_history != item.get("ChatHistory"):
-            _persist_chat_history(eta_id, upload_date, normalized_history)
-            item["ChatHistory"] = normalized_history
-        else:
-            item["ChatHistory"] = normalized_history
+        if not schema_current(item):
+            # Legacy item the migration has not reached yet: upgrade it now.
+            item["ChatHistory"] = normalize_chat_history(item.get("ChatHistory", []))
+            _persist_chat_history(eta_id, upload_date, item["ChatHistory"])
+            item[SCHEMA_ATTRIBUTE] = SCHEMA_VERSION
 
         payload = {
             "user": item,
@@ -410,7 +1055,9 @@ def sync_user():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/upload-context", methods=["POST"])
+@api.route("/upload-context", methods=["POST"])
+@bounded_upload
+@metered("upload")
 def upload_context():
     try:
         if 'file' not in request.files:
@@ -423,8 +1070,7 @@ def upload_context():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({"error": "Unsupported file type"}), 400
 
-        pdf_content = file.read()
-        pdf_text, debug = extract_text_from_pdf(pdf_content)
+        pdf_text, debug = extract_text_from_pdf(file.stream)
         pdf_text = pdf_text.strip()
         if not pdf_text:
             return jsonify({"error": "Failed to extract text from PDF", "debug": debug}), 500
@@ -438,7 +1084,7 @@ def upload_context():
                 "Summarize in a manner that is concise and doesnt use any bullet points or decorative formatting. "
                 "The summary should be in plain text format with no spaces or newlines."
             )
-            response = client.models.generate_content(
+            response = _generate_content(
                 model="gemini-2.5-flash",
                 contents=[
                     {
@@ -449,11 +1095,14 @@ def upload_context():
                         ],
                     }
                 ],
+                call_class="upload_summary",
             )
             candidate = response.candidates[0]
             summary_text = "".join(
                 part.text for part in candidate.content.parts).strip() or pdf_text
         except Exception as exc:  # pragma: no cover - diagnostic
+            current_app.logger.warning(
+                "Summarising the upload failed, storing the extracted text: %s", exc)
             debug.setdefault("summary_error", str(exc))
 
         upload_date = (request.form.get("uploadDate") or "").strip()
@@ -461,19 +1110,21 @@ def upload_context():
         if upload_date:
             key = {PRIMARY_KEY: eta_id, 'UploadDate': upload_date}
         else:
-            latest = table.query(
-                KeyConditionExpression=Key(PRIMARY_KEY).eq(eta_id),
-                ScanIndexForward=False,
-                Limit=1,
-            )
-            items = latest.get("Items", [])
-            if not items:
+            latest, upload_date = _fetch_latest_user_item(eta_id)
+            if not latest:
                 return jsonify({"error": "User not found for provided etaId"}), 404
-            upload_date = items[0]['UploadDate']
             key = {PRIMARY_KEY: eta_id, 'UploadDate': upload_date}
 
-        table.update_item(
+        context_entry = {
+            'type': 'pdf',
+            'filename': file.filename,
+            'summary': summary_text.strip(),
+            'uploaded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'debug': debug,
+        }
+        result = _table().update_item(
             Key=key,
+            ReturnValues="ALL_NEW" if codec_enabled() else "NONE",
             UpdateExpression=(
                 "SET #ctx = list_append(if_not_exists(#ctx, :empty), :ctx_value), "
                 "#uploads = list_append(if_not_exists(#uploads, :empty), :upload_value)"
@@ -484,20 +1135,19 @@ def upload_context():
             },
             ExpressionAttributeValues={
                 ':empty': [],
-                ':ctx_value': [{
-                    'type': 'pdf',
-                    'filename': file.filename,
-                    'summary': summary_text.strip(),
-                    'uploaded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                    'debug': debug,
-                }],
+                ':ctx_value': [context_entry],
                 ':upload_value': [{
                     'filename': file.filename,
-                    'size_bytes': len(pdf_content),
+                    'size_bytes': debug["size_bytes"],
                     'uploaded_at': datetime.datetime.now(datetime.timezone.utc).isoformat()
                 }],
             }
         )
+        if codec_enabled():
+            _compact_context(key, result.get("Attributes") or {})
+        if prompt_cache:
+            prompt_cache.invalidate(eta_id)
+        _index_for_search(eta_id, context=[context_entry])
 
         return jsonify({
             "message": "Context uploaded successfully",
@@ -505,33 +1155,29 @@ def upload_context():
             "upload_date": upload_date,
             # "debug": debug,
         }), 200
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"File too large (limit {upload_max_bytes()} bytes)"}), 413
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/get-context/<eta_id>", methods=["GET"])
+@api.route("/get-context/<eta_id>", methods=["GET"])
 def get_context(eta_id):
     try:
         upload_date = request.args.get("upload_date")
 
         if not upload_date:
-            latest = table.query(
-                KeyConditionExpression=Key(PRIMARY_KEY).eq(eta_id),
-                ScanIndexForward=False,
-                Limit=1,
-            )
-            items = latest.get("Items", [])
-            if not items:
+            latest, upload_date = _fetch_latest_user_item(eta_id)
+            if not latest:
                 return jsonify({"error": "User not found"}), 404
-            upload_date = items[0]['UploadDate']
 
-        response = table.get_item(
+        response = _table().get_item(
             Key={
                 PRIMARY_KEY: eta_id,
                 'UploadDate': upload_date,
             }
         )
-        item = response.get("Item")
+        item = _load_item(response.get("Item"))
         if not item:
             return jsonify({"error": "User not found"}), 404
 
@@ -541,7 +1187,7 @@ def get_context(eta_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/thread/create_chat_thread", methods=["POST"])
+@api.route("/thread/create_chat_thread", methods=["POST"])
 def create_chat_thread():
     try:
         data = request.get_json(force=True, silent=True) or {}
@@ -554,7 +1200,7 @@ def create_chat_thread():
         if not item:
             return jsonify({"error": "User not found"}), 404
 
-        chat_history = _normalize_chat_history(item.get("ChatHistory", []))
+        chat_history = _chat_history(item)
         proposed_chat_id = str(
             data.get("chatID") or data.get("chatId") or uuid.uuid4())
         existing_ids = {thread["ChatID"] for thread in chat_history}
@@ -570,12 +1216,13 @@ def create_chat_thread():
         }
         chat_history.append(new_thread)
         _persist_chat_history(eta_id, upload_date, chat_history)
+        _index_for_search(eta_id, thread=new_thread)
         return jsonify({"thread": new_thread}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/thread/get_chat_thread/", methods=["GET"])
+@api.route("/thread/get_chat_thread/", methods=["GET"])
 def get_chat_thread():
     try:
         eta_id = (request.args.get(PRIMARY_KEY) or request.args.get("eta_id")
@@ -589,8 +1236,8 @@ def get_chat_thread():
         if not item:
             return jsonify({"error": "User not found"}), 404
 
-        chat_history = _normalize_chat_history(item.get("ChatHistory", []))
-        if chat_history != item.get("ChatHistory"):
+        chat_history = _chat_history(item)
+        if not schema_current(item):
             _persist_chat_history(eta_id, upload_date, chat_history)
 
         for thread in chat_history:
@@ -601,10 +1248,80 @@ def get_chat_thread():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@api.route("/thread/archive", methods=["GET"])
+def get_archived_messages():
+    try:
+        eta_id = (request.args.get(PRIMARY_KEY) or request.args.get("eta_id")
+                  or request.args.get("etaId") or "").strip()
+        chat_id = (request.args.get("chatID") or
+                   request.args.get("chatId") or "").strip()
+        if not eta_id or not chat_id:
+            return jsonify({"error": "Missing etaId or chatID parameter"}), 400
+
+        try:
+            before = request.args.get("before")
+            before = int(before) if before not in (None, "") else None
+            limit = min(max(int(request.args.get("limit") or 2), 1), 20)
+        except ValueError:
+            return jsonify({"error": "before and limit must be integers"}), 400
+
+        archive = get_archive()
+        if archive is None:
+            return jsonify({"messages": [], "next_before": None}), 200
+
+        segments, next_before = archive.read_segments(eta_id, chat_id, before, limit)
+        messages = [message for _, segment in segments for message in segment]
+        return jsonify({
+            "messages": messages,
+            "next_before": next_before,
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/search", methods=["GET"])
+def search_user_content():
+    try:
+        eta_id = (request.args.get(PRIMARY_KEY) or request.args.get("eta_id")
+                  or request.args.get("etaId") or "").strip()
+        query = (request.args.get("q") or request.args.get("query") or "").strip()
+        if not eta_id or not query:
+            return jsonify({"error": "Missing etaId or q parameter"}), 400
+        if not SEARCH_ENABLED:
+            return jsonify({"error": "Search is disabled"}), 404
+
+        try:
+            page = max(int(request.args.get("page") or 1), 1)
+            page_size = min(max(int(request.args.get("page_size") or 20), 1), 100)
+        except ValueError:
+            return jsonify({"error": "page and page_size must be integers"}), 400
+
+        if search_index.sync_due(eta_id, SEARCH_RESYNC_SECONDS):
+            item, _ = _fetch_latest_user_item(eta_id)
+            if not item:
+                return jsonify({"error": "User not found"}), 404
+            # Legacy threads have no stored timestamps yet; they are indexed
+            # by the write that migrates them (login runs /sync_user).
+            history = (item.get("ChatHistory") or []) if schema_current(item) else []
+            search_index.sync_user(eta_id, history, item.get("Context", []))
+        results, total = search_index.search(
+            eta_id, query, limit=page_size, offset=(page - 1) * page_size)
+        return jsonify({
+            "results": results,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "has_more": page * page_size < total,
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Queries user message to model, then asks model for assistant response and adds both to thread
 
 
-@app.route("/thread/add_message", methods=["POST"])
+@api.route("/thread/add_message", methods=["POST"])
+@idempotent
+@metered("chat")
 def add_message_to_thread():
     try:
         data = request.get_json(force=True, silent=True) or {}
@@ -622,7 +1339,7 @@ def add_message_to_thread():
         if not item:
             return jsonify({"error": "User not found"}), 404
 
-        chat_history = _normalize_chat_history(item.get("ChatHistory", []))
+        chat_history = _chat_history(item)
         thread = next(
             (t for t in chat_history if str(t.get("ChatID")) == chat_id), None)
 
@@ -640,12 +1357,7 @@ def add_message_to_thread():
 
         _append_message(thread, "user", message)
 
-        recent_messages = thread["Messages"][-12:]
-        history_lines = []
-        for entry in recent_messages:
-            speaker = "User" if entry["role"] == "user" else "Assistant"
-            history_lines.append(f"{speaker}: {entry['content']}")
-        history_text = "\n".join(history_lines)
+        history_text = _history_text(item, thread, 12)
 
         context_snippets = []
         for ctx in context or []:
@@ -657,10 +1369,14 @@ def add_message_to_thread():
                 context_snippets.append(str(snippet))
         context_text = "\n".join(context_snippets)
 
-        full_prompt = (
+        # The persona and context block only change with the persona or an
+        # upload, so they form a prefix that can be cached upstream.
+        prompt_prefix = (
             f"{persona_prompt}\n\n"
             "Relevant context (you may reference this if it helps):\n"
-            f"{context_text or 'No additional context has been provided.'}\n\n"
+            f"{context_text or 'No additional context has been provided.'}"
+        )
+        prompt_tail = (
             "Conversation so far:\n"
             f"{history_text}\n\n"
             "Respond as the assistant to the final user message, in a way that aligns with your persona. "
@@ -668,29 +1384,48 @@ def add_message_to_thread():
         )
 
         try:
-            response = client.models.generate_content(
+            response = _generate_content(
                 model="gemini-2.5-flash",
                 contents=[
                     {
                         "role": "user",
-                        "parts": [{"text": full_prompt}],
+                        "parts": [{"text": prompt_tail}],
                     }
                 ],
+                prefix=prompt_prefix,
+                prefix_scope=(eta_id, persona_prompt, _context_version(context)),
             )
             candidate = response.candidates[0]
             assistant_message = "".join(
                 part.text for part in candidate.content.parts).strip()
         except Exception as exc:  # pragma: no cover - API fallback
-            app.logger.warning(
+            current_app.logger.warning(
                 "Gemini generation failed: %s", exc, exc_info=True)
             assistant_message = "I'm sorry, I couldn't process that just yet. Could you try rephrasing or asking again?"
+            mark_degraded()
 
         if assistant_message:
             _append_message(thread, "assistant", assistant_message)
 
-        thread["Messages"] = thread["Messages"][-40:]
+        if MEMORY_ENABLED:
+            # Scheduled before trimming so archived turns still reach the summary.
+            conversation_memory.schedule(
+                eta_id, upload_date, chat_id, list(thread["Messages"]),
+                _thread_memory(item, thread))
+            conversation_memory.prune(
+                eta_id, upload_date, item.get(MEMORY_ATTRIBUTE),
+                {str(entry.get("ChatID")) for entry in chat_history})
+        _trim_thread(eta_id, thread)
         thread["UpdatedAt"] = _to_iso_timestamp()
         _persist_chat_history(eta_id, upload_date, chat_history)
+        _index_for_search(eta_id, thread=thread)
+
+        if speech_prefetch and assistant_message:
+            module = ElevenLabsModule()
+            module.load_env()
+            speech_prefetch.submit(
+                eta_id, chat_id, thread["Messages"][-1]["timestamp"],
+                assistant_message, _persona_voice(module, persona))
 
         payload = {
             "thread": thread,
@@ -701,14 +1436,16 @@ def add_message_to_thread():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/thread/generate_ai_response", methods=["POST"])
+@api.route("/thread/generate_ai_response", methods=["POST"])
 def generate_ai_response():
     return jsonify({
         "error": "This endpoint has been replaced by /thread/add_message."
     }), 410
 
 
-@app.route("/generate-practice-problems", methods=["POST"])
+@api.route("/generate-practice-problems", methods=["POST"])
+@idempotent
+@metered("practice")
 def generate_practice_problems():
     try:
         payload = request.get_json(silent=True) or {}
@@ -717,6 +1454,8 @@ def generate_practice_problems():
         chat_id = (payload.get("chatID") or payload.get("chatId") or
                    request.form.get("chatID") or request.form.get("chatId") or "").strip()
         message = (payload.get("message") or request.form.get("message") or "").strip()
+        persona = (payload.get("persona") or request.form.get("persona") or "").strip().lower()
+        refresh = _is_truthy(payload.get("refresh") or request.args.get("refresh"))
 
         if not eta_id or not chat_id:
             return jsonify({"error": "Missing required fields"}), 400
@@ -725,74 +1464,217 @@ def generate_practice_problems():
         if not item:
             return jsonify({"error": "User not found"}), 404
 
-        chat_history = _normalize_chat_history(item.get("ChatHistory", []))
-        context = item.get("Context", [])
+        chat_history = _chat_history(item)
         thread = next(
             (t for t in chat_history if str(t.get("ChatID")) == chat_id), None)
         if not thread:
             return jsonify({"error": "Chat thread not found"}), 404
 
-        history_lines = []
-        for entry in thread.get("Messages", [])[-12:]:
-            speaker = "User" if entry["role"] == "user" else "Assistant"
-            history_lines.append(f"{speaker}: {entry['content']}")
-        history_text = "\n".join(history_lines)
-
-        context_snippets = []
-        for ctx in context or []:
-            if isinstance(ctx, dict):
-                snippet = ctx.get("summary") or ctx.get("content")
-            else:
-                snippet = str(ctx)
-            if snippet:
-                context_snippets.append(str(snippet))
-        context_text = "\n".join(context_snippets)
-
-        user_request = message or "Prepare a short set of practice problems that reinforce the key concepts we've discussed."
-        prompt = (
-            "You are an educational assistant crafting targeted practice problems.\n"
-            "Use the conversation history and context below to generate concise, solvable problems. "
-            "Provide numbered problems and keep explanations short unless requested otherwise.\n\n"
-            f"Conversation history:\n{history_text or 'No prior conversation.'}\n\n"
-            f"Context:\n{context_text or 'No additional context provided.'}\n\n"
-            f"User request: {user_request}\n"
-            "Respond with the practice problems only."
-        )
-
+        user_request = message or PRACTICE_DEFAULT_REQUEST
         try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[
-                    {
-                        "role": "user",
-                        "parts": [{"text": prompt}],
-                    }
-                ],
-            )
-            candidate = response.candidates[0]
-            assistant_message = "".join(
-                part.text for part in candidate.content.parts).strip()
+            assistant_message, cached, append = _practice_problems(
+                eta_id, item, thread, persona, user_request, refresh)
+            changed = append and _append_generated(eta_id, thread, assistant_message)
         except Exception as exc:
-            app.logger.warning(
+            current_app.logger.warning(
                 "Gemini practice generation failed: %s", exc, exc_info=True)
             assistant_message = "I wasn't able to generate practice problems right now. Please try again shortly."
+            mark_degraded()
+            cached = False
+            changed = _append_generated(eta_id, thread, assistant_message)
 
-        if assistant_message:
-            _append_message(thread, "assistant", assistant_message)
-            thread["Messages"] = thread["Messages"][-40:]
-            thread["UpdatedAt"] = _to_iso_timestamp()
+        if changed:
             _persist_chat_history(eta_id, upload_date, chat_history)
+            _index_for_search(eta_id, thread=thread)
 
         return jsonify({
             "message": "Practice problems generated successfully",
             "practice_problems": assistant_message,
             "thread": thread,
+            "cached": cached,
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/generate-weekly-plan", methods=["POST"])
+PRACTICE_BATCH_MAX_ITEMS = int(env.get("PRACTICE_BATCH_MAX_ITEMS") or 200)
+PRACTICE_BATCH_CONCURRENCY = int(env.get("PRACTICE_BATCH_CONCURRENCY") or 4)
+
+
+def _batch_practice_item(app: Flask, eta_id: str, item: dict, thread: dict, persona: str,
+                         user_request: str, refresh: bool) -> dict:
+    # Runs on a worker thread: quota and usage are per user, as on the
+    # single-thread route, and nothing shared is modified.
+    retry_after = usage_quotas.acquire(eta_id, "practice")
+    if retry_after:
+        record_usage(eta_id, "practice", rejected=1)
+        return {"status": 429, "error": "Usage quota exceeded",
+                "retry_after": max(1, int(retry_after + 0.999))}
+    with app.app_context(), usage_scope() as usage:
+        try:
+            text, cached, append = _practice_problems(
+                eta_id, item, thread, persona, user_request, refresh)
+        except Exception as exc:
+            app.logger.warning("Gemini practice generation failed: %s", exc, exc_info=True)
+            record_usage(eta_id, "practice", requests=1, errors=1, **usage)
+            return {"status": 502, "error": "Practice generation failed"}
+    record_usage(eta_id, "practice", requests=1, **usage)
+    return {"status": 200, "practice_problems": text, "cached": cached, "append": append}
+
+
+def _persist_generated(eta_id: str, additions: list[tuple[str, str]]) -> list[dict]:
+    """Append generated `(chat_id, text)` messages to a fresh read of the
+    user and persist it, so messages added while a batch was generating are
+    kept. Returns the threads that changed."""
+    item, upload_date = _fetch_latest_user_item(eta_id)
+    if not item:
+        return []
+    chat_history = _chat_history(item)
+    threads = {str(thread.get("ChatID")): thread for thread in chat_history}
+    changed = [
+        threads[chat_id] for chat_id, text in additions
+        if chat_id in threads and _append_generated(eta_id, threads[chat_id], text)
+    ]
+    if changed:
+        _persist_chat_history(eta_id, upload_date, chat_history)
+        for thread in changed:
+            _index_for_search(eta_id, thread=thread)
+    return changed
+
+
+@api.route("/generate-practice-problems/batch", methods=["POST"])
+def generate_practice_problems_batch():
+    """Generate practice problems for many `(etaId, chatID)` threads.
+
+    Users are read once each, generations run PRACTICE_BATCH_CONCURRENCY at
+    a time, and every user's results are added to a fresh read of their
+    chat history once their last thread finishes. Results stream back as
+    NDJSON in completion order. If the client goes away, generations that
+    have not started are cancelled and finished ones are still saved.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    payload = request.get_json(silent=True) or {}
+    entries = payload.get("items")
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    if len(entries) > PRACTICE_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {PRACTICE_BATCH_MAX_ITEMS} items per batch"}), 400
+
+    default_message = str(payload.get("message") or "").strip()
+    default_persona = str(payload.get("persona") or "").strip().lower()
+    refresh = _is_truthy(payload.get("refresh") or request.args.get("refresh"))
+    requested = []
+    for index, entry in enumerate(entries):
+        entry = entry if isinstance(entry, dict) else {}
+        requested.append({
+            "index": index,
+            "eta_id": str(entry.get(PRIMARY_KEY) or entry.get("eta_id") or entry.get("etaId") or "").strip(),
+            "chatID": str(entry.get("chatID") or entry.get("chatId") or "").strip(),
+            "message": str(entry.get("message") or "").strip() or default_message,
+            "persona": str(entry.get("persona") or "").strip().lower() or default_persona,
+        })
+    app = current_app._get_current_object()
+
+    def results():
+        counts = {"succeeded": 0, "failed": 0, "unsaved_users": 0}
+
+        def line(entry: dict, **result) -> str:
+            counts["succeeded" if result.get("status") == 200 else "failed"] += 1
+            result = {key: value for key, value in result.items() if key != "append"}
+            return json.dumps({"type": "result", "index": entry["index"], "eta_id": entry["eta_id"],
+                               "chatID": entry["chatID"], **result}) + "\n"
+
+        valid = [entry for entry in requested if entry["eta_id"] and entry["chatID"]]
+        for entry in requested:
+            if entry not in valid:
+                yield line(entry, status=400, error="Missing required fields")
+        items = _fetch_latest_user_items(
+            [entry["eta_id"] for entry in valid], PRACTICE_BATCH_CONCURRENCY)
+
+        users: dict[str, dict] = {}
+        jobs = []
+        for entry in valid:
+            item = items.get(entry["eta_id"])
+            if not item:
+                yield line(entry, status=404, error="User not found")
+                continue
+            user = users.get(entry["eta_id"])
+            if user is None:
+                item["ChatHistory"] = _chat_history(item)
+                user = users[entry["eta_id"]] = {
+                    "item": item, "remaining": 0, "additions": [], "threads": set()}
+            thread = next((t for t in item["ChatHistory"]
+                           if str(t.get("ChatID")) == entry["chatID"]), None)
+            if not thread:
+                yield line(entry, status=404, error="Chat thread not found")
+                continue
+            if entry["chatID"] in user["threads"]:
+                # Two generations appending to one thread would race.
+                yield line(entry, status=409, error="Thread appears more than once in the batch")
+                continue
+            user["threads"].add(entry["chatID"])
+            user["remaining"] += 1
+            jobs.append((entry, thread))
+
+        def persist(eta_id: str) -> dict:
+            additions, users[eta_id]["additions"] = users[eta_id]["additions"], []
+            try:
+                with app.app_context():
+                    changed = _persist_generated(eta_id, additions)
+            except Exception as exc:
+                app.logger.error("Persisting batch practice problems failed: %s", exc, exc_info=True)
+                counts["unsaved_users"] += 1
+                return {"type": "persisted", "eta_id": eta_id, "status": 500,
+                        "error": "Saving the chat history failed"}
+            return {"type": "persisted", "eta_id": eta_id, "status": 200, "threads": len(changed)}
+
+        def collect(entry: dict, result: dict) -> bool:
+            """Queue a result for saving; True once its user has no more
+            threads running."""
+            user = users[entry["eta_id"]]
+            user["remaining"] -= 1
+            if result.get("append"):
+                user["additions"].append((entry["chatID"], result["practice_problems"]))
+            return not user["remaining"] and bool(user["additions"])
+
+        executor = ThreadPoolExecutor(max_workers=max(1, PRACTICE_BATCH_CONCURRENCY))
+        futures = {
+            executor.submit(
+                _batch_practice_item, app, entry["eta_id"], users[entry["eta_id"]]["item"],
+                thread, entry["persona"], entry["message"] or PRACTICE_DEFAULT_REQUEST, refresh,
+            ): entry
+            for entry, thread in jobs
+        }
+        handled = set()
+        try:
+            for future in as_completed(futures):
+                entry = futures[future]
+                handled.add(future)
+                result = future.result()
+                # Queued before the line goes out, in case the client is gone.
+                save = collect(entry, result)
+                yield line(entry, **result)
+                if save:
+                    yield json.dumps(persist(entry["eta_id"])) + "\n"
+        finally:
+            # Reached early when the client disconnects: skip work that has
+            # not started and save everything that was generated.
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, entry in futures.items():
+                if future not in handled and not future.cancelled() and not future.exception():
+                    collect(entry, future.result())
+            for eta_id, user in users.items():
+                if user["additions"]:
+                    persist(eta_id)
+
+        yield json.dumps({"type": "summary", "items": len(requested), **counts}) + "\n"
+
+    return Response(stream_with_context(results()), mimetype="application/x-ndjson")
+
+
+@api.route("/generate-weekly-plan", methods=["POST"])
+@metered("weekly_plan")
 def generate_weekly_plan():
     try:
         payload = request.get_json(silent=True) or {}
@@ -800,6 +1682,8 @@ def generate_weekly_plan():
                   request.form.get(PRIMARY_KEY) or request.form.get("etaId") or "").strip()
         chat_id = (payload.get("chatID") or payload.get("chatId") or
                    request.form.get("chatID") or request.form.get("chatId") or "").strip()
+        persona = (payload.get("persona") or request.form.get("persona") or "").strip().lower()
+        refresh = _is_truthy(payload.get("refresh") or request.args.get("refresh"))
         if not eta_id or not chat_id:
             return jsonify({"error": "Missing required fields"}), 400
 
@@ -807,7 +1691,7 @@ def generate_weekly_plan():
         if not item:
             return jsonify({"error": "User not found"}), 404
 
-        chat_history = _normalize_chat_history(item.get("ChatHistory", []))
+        chat_history = _chat_history(item)
         context = item.get("Context", [])
         thread = next(
             (t for t in chat_history if str(t.get("ChatID")) == chat_id), None)
@@ -815,66 +1699,79 @@ def generate_weekly_plan():
             return jsonify({"error": "Chat thread not found"}), 404
 
         messages = thread.get("Messages", [])
-        history_lines = []
-        for entry in messages[-16:]:
-            speaker = "User" if entry["role"] == "user" else "Assistant"
-            history_lines.append(f"{speaker}: {entry['content']}")
-        history_text = "\n".join(history_lines)
-
-        context_lines = []
-        for ctx in context or []:
-            if isinstance(ctx, dict):
-                snippet = ctx.get("summary") or ctx.get("content")
+        # Taken before anything is appended, which would change the window.
+        cache_key = _generation_cache_key(
+            "weekly-plan", persona, "", messages[-16:], context)
+        if not refresh:
+            cached = _precomputed_weekly_plan(item, thread)
+            precomputed, in_thread = cached is not None, False
+            if precomputed:
+                # Appending the plan makes it stale for the thread, so a
+                # repeat click has to find it in the generation cache.
+                generation_cache.set(cache_key, cached)
             else:
-                snippet = str(ctx)
-            if snippet:
-                context_lines.append(str(snippet))
-        context_text = "\n".join(context_lines)
-
-        prompt = (
-            "You are an educational assistant creating a concise yet actionable weekly study plan.\n"
-            "Consider the learner's recent conversation and their stored context to produce a plan covering seven days. "
-            "Each day should include focus topics, estimated time, and a quick rationale. "
-            "Keep the tone encouraging and organized with clear headings.\n\n"
-            f"Conversation history:\n{history_text or 'No recent conversation available.'}\n\n"
-            f"Context:\n{context_text or 'No additional context provided.'}\n\n"
-            "Deliver the weekly plan now."
-        )
+                cached, in_thread = _lookup_generation(
+                    "weekly-plan", persona, "", messages, 16, context)
+            if cached is not None:
+                if not in_thread:
+                    _append_message(thread, "assistant", cached)
+                    _trim_thread(eta_id, thread)
+                    thread["UpdatedAt"] = _to_iso_timestamp()
+                    _persist_chat_history(eta_id, upload_date, chat_history)
+                    _index_for_search(eta_id, thread=thread)
+                if precomputed:
+                    # Stale now that it is in the thread; the cache has it.
+                    weekly_plan_scheduler.forget(eta_id, upload_date, [chat_id])
+                return jsonify({
+                    "message": "Weekly plan generated successfully",
+                    "weekly_plan": cached,
+                    "thread": thread,
+                    "cached": True,
+                    "precomputed": precomputed,
+                }), 200
+        prompt = _weekly_plan_prompt(item, thread)
 
         try:
-            response = client.models.generate_content(
+            response = _generate_content(
                 model="gemini-2.5-flash",
                 contents=[
                     {
                         "role": "user",
                         "parts": [{"text": prompt}],
                     }
-                ]
+                ],
+                call_class="weekly_plan",
             )
             candidate = response.candidates[0]
             assistant_message = "".join(
                 part.text for part in candidate.content.parts).strip()
+            if assistant_message:
+                generation_cache.set(cache_key, assistant_message)
         except Exception as exc:
-            app.logger.warning(
+            current_app.logger.warning(
                 "Gemini weekly plan generation failed: %s", exc, exc_info=True)
             assistant_message = "I wasn't able to prepare the weekly plan just now. Please give it another go soon."
 
         if assistant_message:
             _append_message(thread, "assistant", assistant_message)
-            thread["Messages"] = thread["Messages"][-40:]
+            _trim_thread(eta_id, thread)
             thread["UpdatedAt"] = _to_iso_timestamp()
             _persist_chat_history(eta_id, upload_date, chat_history)
+            _index_for_search(eta_id, thread=thread)
 
         return jsonify({
             "message": "Weekly plan generated successfully",
             "weekly_plan": assistant_message,
             "thread": thread,
+            "cached": False,
+            "precomputed": False,
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/generate-notes", methods=["POST"])
+@api.route("/generate-notes", methods=["POST"])
+@metered("notes")
 def generate_notes():
     try:
         payload = request.get_json(silent=True) or {}
@@ -889,24 +1786,44 @@ def generate_notes():
         if not item:
             return jsonify({"error": "User not found"}), 404
 
-        chat_history = _normalize_chat_history(item.get("ChatHistory", []))
+        chat_history = _chat_history(item)
         chat_thread = next(
             (t for t in chat_history if str(t.get("ChatID")) == chat_id), None)
         if not chat_thread:
             return jsonify({"error": "Chat thread not found"}), 404
 
+        # Notes written before sections existed are rebuilt from scratch once.
+        sections = chat_thread.get("NotesSections")
+        cursor = (chat_thread.get("NotesCursor") or "") if sections is not None else ""
+        sections = sections or []
         assistant_messages = [
-            entry["content"] for entry in chat_thread.get("Messages", [])
+            entry for entry in chat_thread.get("Messages", [])
             if entry["role"] == "assistant"
         ]
 
-        if not assistant_messages:
+        if not assistant_messages and not sections:
             return jsonify({"error": "No messages found in chat thread"}), 404
 
-        notes = "\n\n".join(assistant_messages)
-        summary = notes[:3000]
+        new_messages = [
+            entry for entry in assistant_messages
+            if (entry.get("timestamp") or "") > cursor
+        ]
+        if not new_messages and chat_thread.get("Notes"):
+            return jsonify({
+                "message": "Notes generated successfully",
+                "notes": chat_thread["Notes"]
+            }), 200
+
+        for entry in new_messages:
+            sections = merge_sections(
+                sections, extract_sections(entry["content"], entry.get("timestamp") or ""))
+        summary = render_notes(sections)
         chat_thread["Notes"] = summary
+        chat_thread["NotesSections"] = sections
+        if new_messages:
+            chat_thread["NotesCursor"] = new_messages[-1].get("timestamp") or cursor
         chat_thread["UpdatedAt"] = _to_iso_timestamp()
+        prune_sections(chat_history, chat_id, NOTES_MAX_THREADS)
         _persist_chat_history(eta_id, upload_date, chat_history)
 
         return jsonify({
@@ -917,7 +1834,62 @@ def generate_notes():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/voice-response", methods=["POST"])
+def _speak_thread_message(eta_id: str, chat_id: str, thread: dict, message_timestamp: str,
+                          persona: str, pipelined: bool, rendition: Rendition):
+    """Voice an existing assistant message, from the speculative render when
+    one was prepared after /thread/add_message."""
+    message = next((
+        entry for entry in thread.get("Messages") or []
+        if entry["role"] == "assistant" and entry.get("timestamp") == message_timestamp
+    ), None)
+    if not message:
+        return jsonify({"error": "Message not found"}), 404
+
+    module = ElevenLabsModule()
+    module.load_env()
+    voice_id = _persona_voice(module, persona)
+    # Speculative renders are made in the default rendition only.
+    prefetched = speech_prefetch and (
+        rendition.output_format == default_rendition().output_format)
+    prepared = speech_prefetch.take(
+        eta_id, chat_id, message_timestamp, voice_id,
+        wait=SPECULATIVE_TTS_WAIT) if prefetched else None
+    key = rendition_key(message["content"], voice_id, rendition)
+    if prepared:
+        audio, animation = prepared
+        note_usage(audio_bytes=len(audio))
+        speech_cache.set(key, (audio, rendition.mimetype))
+        response = _audio_response(audio, rendition.mimetype, key)
+        response.headers["X-Speech-Prefetched"] = "true"
+    elif pipelined and rendition.streamable and speech_cache.get(key) is None:
+        animation = module.reply_emotion(message["content"])
+        response = _streamed_audio_response(module, message["content"], voice_id, eta_id, rendition)
+    else:
+        audio, key = _speech_audio(message["content"], voice_id, rendition)
+        animation = module.reply_emotion(message["content"])
+        response = _audio_response(audio, rendition.mimetype, key)
+    if animation:
+        response.headers["X-Animation"] = animation
+    return response
+
+
+@api.route("/voice-response/audio/<key>", methods=["GET"])
+def get_voice_audio(key):
+    """Replay a rendered clip named by a `/voice-response` Content-Location,
+    with Range support so players can seek and resume."""
+    cached = speech_cache.get(key)
+    if cached is None:
+        return jsonify({"error": "Audio not found or expired"}), 404
+    audio, mimetype = cached
+    response = Response(audio, mimetype=mimetype)
+    response.set_etag(key)
+    response.headers["Cache-Control"] = f"private, max-age={int(speech_cache.ttl_seconds)}, immutable"
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(audio))
+
+
+@api.route("/voice-response", methods=["POST"])
+@idempotent
+@metered("voice")
 def get_voice_response() -> bytes:
     payload = request.get_json(silent=True) or {}
     question = (payload.get("question") or "").strip()
@@ -926,27 +1898,37 @@ def get_voice_response() -> bytes:
               request.form.get(PRIMARY_KEY) or request.form.get("etaId") or "").strip()
     chat_id = (payload.get("chatID") or payload.get("chatId") or
                request.form.get("chatID") or request.form.get("chatId") or "").strip()
+    message_timestamp = (payload.get("message_timestamp") or
+                         payload.get("messageTimestamp") or "").strip()
 
     if not all([eta_id, chat_id]):
         return jsonify({"error": "Missing etaId or chat_id parameter"}), 400
+    try:
+        rendition = negotiate(request.accept_mimetypes,
+                              payload.get("quality") or request.args.get("quality"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if rendition is None:
+        return jsonify({"error": "Not acceptable", "supported": supported_types()}), 406
 
     item, _ = _fetch_latest_user_item(eta_id)
     if not item:
         return jsonify({"error": "User not found"}), 404
     
     item, upload_date = _fetch_latest_user_item(eta_id)
-    chat_history = _normalize_chat_history(item.get("ChatHistory", []))
+    chat_history = _chat_history(item)
     thread = next(
         (t for t in chat_history if str(t.get("ChatID")) == chat_id), None)
     if not thread:
         return jsonify({"error": "Chat thread not found"}), 404
 
+    pipelined = _is_truthy(payload.get("pipelined") or env.get("ELEVENLABS_PIPELINE"))
+    if message_timestamp:
+        return _speak_thread_message(eta_id, chat_id, thread, message_timestamp, persona, pipelined,
+                                     rendition)
+
     context = item.get("Context", [])
-    history_lines = []
-    for entry in thread.get("Messages", [])[-16:]:
-        speaker = "User" if entry["role"] == "user" else "Assistant"
-        history_lines.append(f"{speaker}: {entry['content']}")
-    history = "\n".join(history_lines)
+    history = _history_text(item, thread, 16)
 
     context_lines = []
     for ctx in context or []:
@@ -968,32 +1950,100 @@ def get_voice_response() -> bytes:
     system_prompt = "\n\n".join(
         part for part in [persona_prompt, history, context_string] if part)
 
+    started = time.monotonic()
     ans = module.gemini_reply(question, system_prompt=system_prompt)
-    animation = module.gemini_reply_emotion(ans)
-    table.update_item(
-        Key={
-            PRIMARY_KEY: eta_id,
-            "UploadDate": upload_date,
-        },
+    note_usage(upstream_calls=1, upstream_ms=(time.monotonic() - started) * 1000,
+               prompt_chars=len(system_prompt) + len(question), output_chars=len(ans))
+    animation = module.reply_emotion(ans)
+    context_key = {
+        PRIMARY_KEY: eta_id,
+        "UploadDate": upload_date,
+    }
+    context_entry = {
+        "type": "voice_reply",
+        "summary": ans,
+        "uploaded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    result = _table().update_item(
+        Key=context_key,
+        ReturnValues="ALL_NEW" if codec_enabled() else "NONE",
         UpdateExpression="SET #ctx = list_append(if_not_exists(#ctx, :empty), :new)",
         ExpressionAttributeNames={"#ctx": "Context"},
         ExpressionAttributeValues={
             ":empty": [],
-            ":new": [{
-                "type": "voice_reply",
-                "summary": ans,
-                "uploaded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-            }],
+            ":new": [context_entry],
         },
     )
-    voiceBytes = module.elevenlabs_speech(
-        ans, voice_id=persona_voice)
-    response = make_response(voiceBytes)
-    response.headers["Content-Type"] = "audio/mpeg"
+    if codec_enabled():
+        _compact_context(context_key, result.get("Attributes") or {})
+    if prompt_cache:
+        prompt_cache.invalidate(eta_id)
+    _index_for_search(eta_id, context=[context_entry])
+    if pipelined and rendition.streamable:
+        # A duplicate of this request replays the answer as plain audio
+        # instead of asking Gemini again and appending a second context entry.
+        replay_with(lambda: _voice_answer_response(ans, persona_voice, rendition, animation))
+        response = _streamed_audio_response(module, ans, persona_voice, eta_id, rendition)
+        if animation:
+            response.headers["X-Animation"] = animation
+        return response
+    return _voice_answer_response(ans, persona_voice, rendition, animation)
+
+
+def _voice_answer_response(answer: str, voice_id: str, rendition: Rendition,
+                           animation: str | None) -> Response:
+    voiceBytes, key = _speech_audio(answer, voice_id, rendition)
+    response = _audio_response(voiceBytes, rendition.mimetype, key)
     if animation:
         response.headers["X-Animation"] = animation
     return response
 
 
+def create_app(config: dict | None = None) -> Flask:
+    flask_app = Flask(__name__)
+    flask_app.config.update(
+        USAGE_LEDGER=_is_truthy(env.get("USAGE_LEDGER") or "1"),
+        USAGE_DB=env.get("USAGE_DB") or str(DEFAULT_USAGE_DB),
+        USAGE_BUCKET_SECONDS=int(env.get("USAGE_BUCKET_SECONDS") or DEFAULT_BUCKET_SECONDS),
+        WEEKLY_PLAN_SCHEDULE=_is_truthy(env.get("WEEKLY_PLAN_SCHEDULE")),
+        CHAT_WRITE_BEHIND=_is_truthy(env.get("CHAT_WRITE_BEHIND")),
+        CHAT_WRITE_BEHIND_WAL=env.get("CHAT_WRITE_BEHIND_WAL") or str(DEFAULT_WAL_PATH),
+    )
+    flask_app.config.update(config or {})
+    flask_app.request_class = SpooledUploadRequest
+    allowed_origins = [
+        origin.strip()
+        for origin in (env.get("ALLOWED_ORIGINS") or "http://localhost:3001,http://localhost:5173").split(",")
+        if origin.strip()
+    ]
+    CORS(flask_app, resources={r"/*": {"origins": allowed_origins}}, supports_credentials=True,
+         expose_headers=["X-Animation", "Content-Location"])
+    flask_app.secret_key = env.get("APP_SECRET_KEY")
+    flask_app.register_blueprint(api)
+    configure_ledger(
+        Path(flask_app.config["USAGE_DB"]) if flask_app.config["USAGE_LEDGER"] else None,
+        bucket_seconds=flask_app.config["USAGE_BUCKET_SECONDS"],
+    )
+    if flask_app.config["CHAT_WRITE_BEHIND"]:
+        _start_write_behind(Path(flask_app.config["CHAT_WRITE_BEHIND_WAL"]))
+    if flask_app.config["WEEKLY_PLAN_SCHEDULE"]:
+        weekly_plan_scheduler.start()
+    return flask_app
+
+
+_default_app: Flask | None = None
+
+
+def __getattr__(name: str):
+    # `app:app` for WSGI servers, built on first access so that importing
+    # this module (tests, scripts) starts no background work.
+    global _default_app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _default_app is None:
+        _default_app = create_app()
+    return _default_app
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(env.get("PORT", 3000)))
+    create_app().run(host="0.0.0.0", port=int(env.get("PORT", 3000)))
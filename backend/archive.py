@@ -0,0 +1,138 @@
+import functools
+import os
+import threading
+from os import environ as env
+from pathlib import Path
+
+from storage_codec import decode_value, encode_value
+
+DEFAULT_ARCHIVE_DIR = Path(__file__).with_name("archive_data")
+_SEGMENT_SUFFIX = ".seg"
+
+
+class LocalSegmentArchive:
+    """Archive trimmed messages as compressed segment files on local disk.
+
+    Layout: `<root>/<eta_id>/<chat_id>/<sequence>.seg`, one file per trim,
+    each holding the messages in chronological order. Sequence numbers only
+    grow, so newer segments sort last.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _thread_dir(self, eta_id: str, chat_id: str) -> Path:
+        # ids come from uuid4 / client input; keep them to one path component.
+        safe = [part.replace(os.sep, "_").replace("..", "_") for part in (eta_id, chat_id)]
+        return self.root.joinpath(*safe)
+
+    def _sequences(self, directory: Path) -> list[int]:
+        if not directory.is_dir():
+            return []
+        return sorted(
+            int(path.stem) for path in directory.glob(f"*{_SEGMENT_SUFFIX}")
+            if path.stem.isdigit()
+        )
+
+    def append_segment(self, eta_id: str, chat_id: str, messages: list[dict]) -> int:
+        directory = self._thread_dir(eta_id, chat_id)
+        with self._lock:
+            directory.mkdir(parents=True, exist_ok=True)
+            existing = self._sequences(directory)
+            sequence = (existing[-1] + 1) if existing else 0
+            target = directory / f"{sequence:08d}{_SEGMENT_SUFFIX}"
+            temporary = target.with_suffix(".tmp")
+            temporary.write_bytes(encode_value(messages))
+            os.replace(temporary, target)
+        return sequence
+
+    def read_segments(self, eta_id: str, chat_id: str, before: int | None,
+                      limit: int) -> tuple[list[tuple[int, list[dict]]], int | None]:
+        directory = self._thread_dir(eta_id, chat_id)
+        sequences = [seq for seq in self._sequences(directory) if before is None or seq < before]
+        selected = sequences[-limit:] if limit > 0 else []
+        segments = [
+            (seq, decode_value((directory / f"{seq:08d}{_SEGMENT_SUFFIX}").read_bytes()) or [])
+            for seq in selected
+        ]
+        has_more = len(sequences) > len(selected)
+        return segments, (selected[0] if has_more and selected else None)
+
+
+class DynamoSegmentArchive:
+    """Archive segments as items in a separate DynamoDB table.
+
+    The table needs a string partition key `ArchiveKey` (`<eta_id>#<chat_id>`)
+    and a numeric sort key `Segment`. SEGMENT is a DynamoDB reserved word, so
+    expressions refer to it through a placeholder.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    @functools.cached_property
+    def _table(self):
+        import boto3
+
+        region = env.get("AWS_REGION") or "us-east-2"
+        return boto3.resource("dynamodb", region_name=region).Table(self.table_name)
+
+    def append_segment(self, eta_id: str, chat_id: str, messages: list[dict]) -> int:
+        from boto3.dynamodb.conditions import Key
+
+        archive_key = f"{eta_id}#{chat_id}"
+        latest = self._table.query(
+            KeyConditionExpression=Key("ArchiveKey").eq(archive_key),
+            ScanIndexForward=False,
+            Limit=1,
+            ProjectionExpression="#s",
+            ExpressionAttributeNames={"#s": "Segment"},
+        ).get("Items", [])
+        sequence = int(latest[0]["Segment"]) + 1 if latest else 0
+        # The condition turns a racing writer's duplicate sequence into an
+        # error instead of a silent overwrite.
+        self._table.put_item(
+            Item={
+                "ArchiveKey": archive_key,
+                "Segment": sequence,
+                "Messages": encode_value(messages),
+                "Count": len(messages),
+            },
+            ConditionExpression="attribute_not_exists(#s)",
+            ExpressionAttributeNames={"#s": "Segment"},
+        )
+        return sequence
+
+    def read_segments(self, eta_id: str, chat_id: str, before: int | None,
+                      limit: int) -> tuple[list[tuple[int, list[dict]]], int | None]:
+        from boto3.dynamodb.conditions import Key
+
+        condition = Key("ArchiveKey").eq(f"{eta_id}#{chat_id}")
+        if before is not None:
+            condition = condition & Key("Segment").lt(before)
+        response = self._table.query(
+            KeyConditionExpression=condition,
+            ScanIndexForward=False,
+            Limit=max(limit, 1),
+        )
+        items = response.get("Items", [])
+        segments = [
+            (int(item["Segment"]), decode_value(item["Messages"]) or [])
+            for item in reversed(items)
+        ]
+        has_more = bool(response.get("LastEvaluatedKey"))
+        return segments, (segments[0][0] if has_more and segments else None)
+
+
+@functools.cache
+def get_archive():
+    # Opt-in: the DynamoDB table has to exist before trims can land in it.
+    # Local segments are lost with the container and not shared between
+    # instances, so they are only for a single instance with a persistent disk.
+    backend = (env.get("MESSAGE_ARCHIVE") or "none").strip().lower()
+    if backend in {"", "none", "off"}:
+        return None
+    if backend == "dynamodb":
+        return DynamoSegmentArchive(env.get("MESSAGE_ARCHIVE_TABLE") or "ETAArchive")
+    return LocalSegmentArchive(Path(env.get("MESSAGE_ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR))
@@ -0,0 +1,101 @@
+import logging
+from os import environ as env
+
+from werkzeug.datastructures import MIMEAccept
+
+from cache import TTLCache, digest
+
+QUALITIES = ("low", "medium", "high")
+DEFAULT_QUALITY = "high"
+DEFAULT_CACHE_ENTRIES = 64
+DEFAULT_CACHE_TTL_SECONDS = 1800
+
+logger = logging.getLogger(__name__)
+
+# ElevenLabs `output_format` per (content type, quality). "high" MP3 is the
+# provider default, so clients that ask for nothing get the same audio as before.
+_OUTPUT_FORMATS = {
+    "audio/mpeg": {"low": "mp3_22050_32", "medium": "mp3_44100_64", "high": "mp3_44100_128"},
+    "audio/ogg": {"low": "opus_48000_32", "medium": "opus_48000_64", "high": "opus_48000_128"},
+}
+# Offered in preference order. Accept matching compares parameters, so the
+# codecs-qualified and `audio/opus` spellings of Ogg/Opus are listed too.
+_OFFERED = ("audio/mpeg", "audio/ogg", "audio/ogg;codecs=opus", "audio/opus")
+
+
+class Rendition:
+    """One encoding of a speech clip: its ElevenLabs format and MIME type."""
+
+    __slots__ = ("mimetype", "quality", "output_format")
+
+    def __init__(self, mimetype: str, quality: str):
+        self.mimetype = mimetype
+        self.quality = quality
+        self.output_format = _OUTPUT_FORMATS[mimetype][quality]
+
+    @property
+    def streamable(self) -> bool:
+        # MP3 frames can be concatenated segment by segment; Ogg streams can't.
+        return self.mimetype == "audio/mpeg"
+
+
+DEFAULT_RENDITION = Rendition("audio/mpeg", DEFAULT_QUALITY)
+
+
+def configured_quality(value: str | None) -> str:
+    """Validate the server's default quality, falling back to DEFAULT_QUALITY.
+
+    A bad setting is the operator's mistake, so it is logged here once
+    rather than rejected on every request that relies on the default.
+    """
+    quality = (value or DEFAULT_QUALITY).strip().lower()
+    if quality not in QUALITIES:
+        logger.error("VOICE_DEFAULT_QUALITY=%r is not one of %s; using %r",
+                     value, ", ".join(QUALITIES), DEFAULT_QUALITY)
+        return DEFAULT_QUALITY
+    return quality
+
+
+default_quality = configured_quality(env.get("VOICE_DEFAULT_QUALITY"))
+
+
+def default_rendition() -> Rendition:
+    """What a client that asks for nothing gets: MP3 at `default_quality`."""
+    return Rendition("audio/mpeg", default_quality)
+
+
+def negotiate(accept: MIMEAccept, quality: str | None) -> Rendition | None:
+    """Pick the rendition for an `Accept` header and quality name.
+
+    A missing or wildcard `Accept` gets MP3. Returns None when nothing
+    offered is acceptable; raises ValueError for an unknown quality sent
+    by the client. Without one, `default_quality` applies.
+    """
+    if quality:
+        quality = quality.strip().lower()
+        if quality not in QUALITIES:
+            raise ValueError(f"quality must be one of {', '.join(QUALITIES)}")
+    else:
+        quality = default_quality
+    if not accept:
+        return Rendition("audio/mpeg", quality)
+    mimetype = accept.best_match(_OFFERED)
+    if not mimetype:
+        return None
+    return Rendition("audio/mpeg" if mimetype == "audio/mpeg" else "audio/ogg", quality)
+
+
+def supported_types() -> list[str]:
+    return list(_OUTPUT_FORMATS)
+
+
+def rendition_key(text: str, voice_id: str, rendition: Rendition) -> str:
+    return digest("speech", text, voice_id, rendition.output_format)
+
+
+# Rendered clips by rendition_key, as (audio, mimetype). Each format and
+# bitrate of a clip is its own entry.
+speech_cache = TTLCache(
+    max_entries=int(env.get("VOICE_AUDIO_CACHE_MAX_ENTRIES") or DEFAULT_CACHE_ENTRIES),
+    ttl_seconds=float(env.get("VOICE_AUDIO_CACHE_TTL_SECONDS") or DEFAULT_CACHE_TTL_SECONDS),
+)
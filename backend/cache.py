@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl_seconds`.
+
+    `on_evict(key, value)` is called, outside the lock, for every entry that
+    expires or is evicted to make room; not for `pop`.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float,
+                 on_evict: Callable[[str, Any], None] | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._on_evict = on_evict
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.monotonic()
+        dropped = []
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._data[key]
+                    self._stats["expired"] += 1
+                    dropped.append((key, entry[1]))
+                self._stats["misses"] += 1
+                value = default
+            else:
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+                value = entry[1]
+        self._notify(dropped)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float | None = None):
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        dropped = []
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                evicted, (_, old) = self._data.popitem(last=False)
+                dropped.append((evicted, old))
+                self._stats["evictions"] += 1
+        self._notify(dropped)
+
+    def purge(self):
+        """Drop every expired entry now rather than when it is next read."""
+        now = time.monotonic()
+        with self._lock:
+            dropped = [(key, entry[1]) for key, entry in self._data.items() if entry[0] <= now]
+            for key, _ in dropped:
+                del self._data[key]
+            self._stats["expired"] += len(dropped)
+        self._notify(dropped)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, size=len(self._data))
+
+    def _notify(self, dropped: list[tuple[str, Any]]):
+        if self._on_evict:
+            for key, value in dropped:
+                self._on_evict(key, value)
+
+
+def digest(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
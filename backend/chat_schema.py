@@ -0,0 +1,122 @@
+import datetime
+
+from storage_codec import (
+    CHAT_HISTORY_BLOB,
+    CODEC_ATTRIBUTE,
+    FORMAT_ZLIB_JSON,
+    codec_enabled,
+    encode_value,
+)
+
+# Version 1 (implicit: no attribute) allowed legacy `User`/`Assistant`
+# lists, tuple-style messages and threads missing ids or titles. Version 2
+# items hold only normalized threads, so readers can use them as stored.
+SCHEMA_ATTRIBUTE = "SchemaVersion"
+SCHEMA_VERSION = 2
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def schema_current(item: dict | None) -> bool:
+    return bool(item) and int(item.get(SCHEMA_ATTRIBUTE) or 0) >= SCHEMA_VERSION
+
+
+def normalize_message_entry(entry) -> dict | None:
+    if isinstance(entry, dict):
+        role = entry.get("role") or entry.get("Role")
+        content = entry.get("content") or entry.get("message") or entry.get("text")
+        timestamp = entry.get("timestamp") or entry.get("created_at")
+    elif isinstance(entry, (list, tuple)) and entry:
+        role = entry[0] if len(entry) > 0 else None
+        content = entry[1] if len(entry) > 1 else None
+        timestamp = entry[2] if len(entry) > 2 else None
+    else:
+        return None
+
+    content = (content or "").strip()
+    if not content:
+        return None
+
+    role = (role or "assistant").strip().lower()
+    if role not in {"assistant", "user", "system"}:
+        role = "assistant" if role.startswith("assist") else "user"
+
+    return {
+        "role": role,
+        "content": content,
+        "timestamp": timestamp or _now_iso(),
+    }
+
+
+def _migrate_thread_messages(thread: dict) -> list:
+    messages = thread.get("Messages")
+    if isinstance(messages, list) and messages:
+        return messages
+
+    user_msgs = thread.get("User") or []
+    assistant_msgs = thread.get("Assistant") or []
+    migrated: list = []
+    max_len = max(len(user_msgs), len(assistant_msgs))
+    for idx in range(max_len):
+        if idx < len(user_msgs):
+            migrated.append(("user", user_msgs[idx]))
+        if idx < len(assistant_msgs):
+            migrated.append(("assistant", assistant_msgs[idx]))
+    return migrated
+
+
+def normalize_thread(thread: dict, fallback_index: int = 0) -> dict:
+    thread = dict(thread or {})
+    chat_id = str(thread.get("ChatID") or fallback_index)
+    messages = _migrate_thread_messages(thread)
+    normalized_messages: list[dict] = []
+    for entry in messages or []:
+        normalized = normalize_message_entry(entry)
+        if normalized:
+            normalized_messages.append(normalized)
+
+    thread["ChatID"] = chat_id
+    thread["Messages"] = normalized_messages
+    # Folded into Messages above; keeping them only bloats the item.
+    thread.pop("User", None)
+    thread.pop("Assistant", None)
+    thread.setdefault("Title", f"Session {fallback_index + 1}")
+    thread.setdefault("CreatedAt", thread.get(
+        "CreatedAt") or _now_iso())
+    return thread
+
+
+def normalize_chat_history(chat_history: list | None) -> list[dict]:
+    normalized = []
+    for index, thread in enumerate(chat_history or []):
+        if not isinstance(thread, dict):
+            continue
+        normalized.append(normalize_thread(thread, index))
+    return normalized
+
+
+def chat_history_update(chat_history: list[dict]) -> dict:
+    """update_item arguments that store a normalized history and stamp the
+    current schema version."""
+    if codec_enabled():
+        # Drop the plain list so it can never shadow the blob.
+        return {
+            "UpdateExpression": (
+                f"SET {CHAT_HISTORY_BLOB} = :blob, {CODEC_ATTRIBUTE} = :codec, "
+                f"{SCHEMA_ATTRIBUTE} = :schema REMOVE ChatHistory"
+            ),
+            "ExpressionAttributeValues": {
+                ":blob": encode_value(chat_history),
+                ":codec": FORMAT_ZLIB_JSON,
+                ":schema": SCHEMA_VERSION,
+            },
+        }
+    # Drop any blob so a plain write is never shadowed by an older encoding.
+    return {
+        "UpdateExpression": (
+            f"SET ChatHistory = :chats, {SCHEMA_ATTRIBUTE} = :schema REMOVE {CHAT_HISTORY_BLOB}"
+        ),
+        "ExpressionAttributeValues": {":chats": chat_history, ":schema": SCHEMA_VERSION},
+    }
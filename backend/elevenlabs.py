@@ -1,9 +1,13 @@
 import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator
 
-import requests
 from dotenv import load_dotenv
-import google.generativeai as genai
+
+from emotion import classify_animation
 
 DEFAULT_SYSTEM_PROMPT = (
     "You are ETA, a concise teaching assistant who explains concepts clearly."
@@ -11,6 +15,12 @@ DEFAULT_SYSTEM_PROMPT = (
 DEFAULT_GEMINI_MODEL = "gemini-2.5-flash"
 DEFAULT_VOICE_ID = "Xb7hH8MSUJpSbSDYk0k2"
 DEFAULT_ELEVEN_MODEL = "eleven_multilingual_v2"
+DEFAULT_EMOTION_CLASSIFIER = "local"
+DEFAULT_EMOTION_MIN_CONFIDENCE = 0.5
+DEFAULT_PIPELINE_WINDOW = 3
+DEFAULT_SEGMENT_CHARS = 280
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
 
 PERSONAS = {
     "professor": {
@@ -36,6 +46,33 @@ PERSONAS = {
     },
 }
 
+def split_sentences(text: str, max_chars: int = DEFAULT_SEGMENT_CHARS) -> list[str]:
+    """Split `text` into TTS segments on sentence boundaries.
+
+    The first sentence is always its own segment so playback can start
+    quickly; later sentences are packed together up to `max_chars`.
+    Sentences longer than `max_chars` are broken on whitespace.
+    """
+    sentences: list[str] = []
+    for sentence in _SENTENCE_BOUNDARY.split((text or "").strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            sentences.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            sentences.append(sentence)
+
+    segments: list[str] = []
+    for sentence in sentences:
+        if len(segments) > 1 and len(segments[-1]) + 1 + len(sentence) <= max_chars:
+            segments[-1] = f"{segments[-1]} {sentence}"
+        else:
+            segments.append(sentence)
+    return segments
+
+
 class ElevenLabsModule:
     def __init__(self):
         pass
@@ -67,6 +104,8 @@ class ElevenLabsModule:
         if not key:
             raise RuntimeError("GEMINI_API_KEY missing")
 
+        import google.generativeai as genai
+
         model_name = os.getenv("GEMINI_MODEL", DEFAULT_GEMINI_MODEL)
         genai.configure(api_key=key)
         model = genai.GenerativeModel(model_name)
@@ -87,6 +126,8 @@ class ElevenLabsModule:
         if not key:
             raise RuntimeError("GEMINI_API_KEY missing")
 
+        import google.generativeai as genai
+
         model_name = os.getenv("GEMINI_MODEL", DEFAULT_GEMINI_MODEL)
         genai.configure(api_key=key)
         model = genai.GenerativeModel(model_name)
@@ -108,29 +149,57 @@ class ElevenLabsModule:
             raise RuntimeError("Gemini returned empty emotion")
         return emotion
 
-    def elevenlabs_speech(
+    def reply_emotion(self, answer: str) -> str:
+        # EMOTION_CLASSIFIER: "local" (lexicon only), "gemini" (always ask
+        # Gemini) or "hybrid" (ask Gemini only when the lexicon is unsure).
+        mode = (os.getenv("EMOTION_CLASSIFIER") or DEFAULT_EMOTION_CLASSIFIER).strip().lower()
+        if mode == "gemini":
+            return self.gemini_reply_emotion(answer)
+
+        label, confidence = classify_animation(answer)
+        min_confidence = float(
+            os.getenv("EMOTION_MIN_CONFIDENCE") or DEFAULT_EMOTION_MIN_CONFIDENCE)
+        if mode == "hybrid" and confidence < min_confidence:
+            try:
+                return self.gemini_reply_emotion(answer)
+            except Exception:
+                pass
+        return label.lower()
+
+    def _synthesize(
         self,
         text: str,
+        voice_id: str,
+        model_id: str,
         *,
-        voice_id: str | None = None,
-        model_id: str | None = None,
+        previous_text: str | None = None,
+        next_text: str | None = None,
+        output_format: str | None = None,
+        mimetype: str = "audio/mpeg",
     ) -> bytes:
         api_key = os.getenv("ELEVENLABS_API_KEY")
         if not api_key:
             raise RuntimeError("ELEVENLABS_API_KEY missing")
 
-        resolved_voice = voice_id or os.getenv("ELEVENLABS_VOICE_ID", DEFAULT_VOICE_ID)
-        resolved_model = model_id or os.getenv("ELEVENLABS_MODEL_ID", DEFAULT_ELEVEN_MODEL)
+        import requests
+
+        body = {"text": text, "model_id": model_id}
+        # Neighbouring text keeps intonation continuous across segments.
+        if previous_text:
+            body["previous_text"] = previous_text
+        if next_text:
+            body["next_text"] = next_text
 
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{resolved_voice}/stream"
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
         response = requests.post(
             url,
             headers={
                 "xi-api-key": api_key,
                 "Content-Type": "application/json",
-                "Accept": "audio/mpeg",
+                "Accept": mimetype,
             },
-            json={"text": text, "model_id": resolved_model},
+            params={"output_format": output_format} if output_format else None,
+            json=body,
             stream=True,
             timeout=60,
         )
@@ -142,6 +211,76 @@ class ElevenLabsModule:
                 audio_chunks.extend(chunk)
         return bytes(audio_chunks)
 
+    def elevenlabs_speech(
+        self,
+        text: str,
+        *,
+        voice_id: str | None = None,
+        model_id: str | None = None,
+        output_format: str | None = None,
+        mimetype: str = "audio/mpeg",
+    ) -> bytes:
+        if not os.getenv("ELEVENLABS_API_KEY"):
+            raise RuntimeError("ELEVENLABS_API_KEY missing")
+
+        resolved_voice = voice_id or os.getenv("ELEVENLABS_VOICE_ID", DEFAULT_VOICE_ID)
+        resolved_model = model_id or os.getenv("ELEVENLABS_MODEL_ID", DEFAULT_ELEVEN_MODEL)
+        return self._synthesize(text, resolved_voice, resolved_model,
+                                output_format=output_format, mimetype=mimetype)
+
+    def elevenlabs_speech_pipelined(
+        self,
+        text: str,
+        *,
+        voice_id: str | None = None,
+        model_id: str | None = None,
+        window: int | None = None,
+        max_segment_chars: int | None = None,
+        output_format: str | None = None,
+    ) -> Iterator[bytes]:
+        """Synthesize `text` sentence by sentence and yield MP3 segments in order.
+
+        Up to `window` segments are in flight at once, so the first audio
+        arrives after one short request regardless of the answer's length.
+        `output_format` must be an MP3 format: only MP3 frames can be
+        concatenated. Configuration errors are raised here rather than mid-stream.
+        """
+        if not os.getenv("ELEVENLABS_API_KEY"):
+            raise RuntimeError("ELEVENLABS_API_KEY missing")
+
+        resolved_voice = voice_id or os.getenv("ELEVENLABS_VOICE_ID", DEFAULT_VOICE_ID)
+        resolved_model = model_id or os.getenv("ELEVENLABS_MODEL_ID", DEFAULT_ELEVEN_MODEL)
+        window = max(1, window or int(
+            os.getenv("ELEVENLABS_PIPELINE_WINDOW") or DEFAULT_PIPELINE_WINDOW))
+        segments = split_sentences(text, max_segment_chars or int(
+            os.getenv("ELEVENLABS_SEGMENT_CHARS") or DEFAULT_SEGMENT_CHARS))
+
+        def generate() -> Iterator[bytes]:
+            executor = ThreadPoolExecutor(max_workers=window)
+            pending: deque = deque()
+            try:
+                for index, segment in enumerate(segments):
+                    pending.append(executor.submit(
+                        self._synthesize,
+                        segment,
+                        resolved_voice,
+                        resolved_model,
+                        previous_text=segments[index - 1] if index else None,
+                        next_text=segments[index + 1] if index + 1 < len(segments) else None,
+                        output_format=output_format,
+                    ))
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # Client went away or a segment failed: drop queued work.
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+        return generate()
+
 
     def prompt_for_persona(self, default: str | None) -> str | None:
         if default:
@@ -0,0 +1,94 @@
+import re
+
+ANIMATION_LABELS = ("Dancing", "Dying", "Defeated", "GangamStyle", "Idle", "Taunt", "Talking")
+DEFAULT_ANIMATION = "Talking"
+
+# Cue words per animation. Weights are rough: a strong cue is worth a couple of
+# weak ones. Talking is the default for any ordinary explanation.
+_LEXICON: dict[str, dict[str, float]] = {
+    "Dancing": {
+        "congratulations": 2.5, "congrats": 2.5, "celebrate": 2.0, "celebration": 2.0,
+        "awesome": 1.5, "amazing": 1.5, "fantastic": 1.5, "excellent": 1.2,
+        "great": 0.8, "nailed": 2.0, "perfect": 1.2, "yay": 2.5, "hooray": 2.5,
+        "woohoo": 2.5, "well": 0.3, "done": 0.5, "correct": 1.0, "proud": 1.5,
+        "passed": 1.5, "aced": 2.5, "win": 1.2, "success": 1.2, "brilliant": 1.5,
+    },
+    "GangamStyle": {
+        "party": 2.5, "hype": 2.0, "hyped": 2.0, "epic": 1.5, "legendary": 2.0,
+        "unstoppable": 2.0, "lets": 1.0, "go": 0.3, "crushing": 1.5,
+        "crushed": 1.5, "boom": 2.0, "pumped": 2.0, "rockstar": 2.0,
+        "champion": 1.5, "momentum": 0.8, "fun": 1.0,
+    },
+    "Taunt": {
+        "challenge": 1.5, "bet": 1.5, "dare": 2.0, "prove": 1.5, "think": 0.2,
+        "really": 0.5, "seriously": 1.5, "easy": 0.8, "beat": 1.5, "try": 0.5,
+        "bring": 0.8, "cmon": 2.0, "c'mon": 2.0, "tougher": 1.5, "harder": 0.8,
+        "step": 0.3, "game": 0.8, "show": 0.5, "nope": 1.5, "wrong": 0.8,
+    },
+    "Defeated": {
+        "unfortunately": 2.0, "sorry": 1.5, "afraid": 1.2, "incorrect": 1.5,
+        "mistake": 1.0, "failed": 1.5, "fail": 1.2, "unable": 1.5, "cannot": 0.8,
+        "can't": 0.8, "couldn't": 1.2, "wasn't": 0.8, "missed": 1.2, "lost": 1.2,
+        "struggle": 1.2, "struggling": 1.2, "difficult": 0.6, "disappointing": 2.0,
+        "setback": 2.0, "oops": 1.5, "not": 0.2,
+    },
+    "Dying": {
+        "dead": 2.0, "dying": 2.5, "die": 1.5, "hilarious": 2.5, "lol": 2.0,
+        "lmao": 2.5, "haha": 2.0, "hahaha": 2.5, "overwhelmed": 1.5, "exhausted": 1.5,
+        "brutal": 1.5, "killing": 1.5, "killed": 1.5, "nightmare": 1.5,
+        "impossible": 1.0, "catastrophic": 1.5, "doom": 1.5, "rip": 2.0,
+    },
+    "Idle": {
+        "ok": 1.0, "okay": 1.0, "sure": 1.0, "hmm": 1.5, "wait": 1.0, "pause": 1.5,
+        "ready": 0.8, "whenever": 1.2, "listening": 1.0, "anything": 0.3,
+    },
+}
+
+_TOKEN_RE = re.compile(r"[a-z']+")
+_MIN_SCORE = 1.5
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def score_animations(text: str) -> dict[str, float]:
+    tokens = _tokens(text)
+    scores = {label: 0.0 for label in ANIMATION_LABELS}
+    if not tokens:
+        scores["Idle"] = _MIN_SCORE
+        return scores
+
+    for token in tokens:
+        for label, cues in _LEXICON.items():
+            weight = cues.get(token)
+            if weight:
+                scores[label] += weight
+
+    exclamations = text.count("!")
+    if exclamations:
+        scores["Dancing"] += 0.4 * min(exclamations, 5)
+        scores["GangamStyle"] += 0.3 * min(exclamations, 5)
+
+    # Longer answers are explanations first; dilute incidental cue words.
+    length_factor = max(1.0, len(tokens) / 60)
+    for label in scores:
+        scores[label] /= length_factor
+
+    if len(tokens) <= 3 and not any(scores[label] for label in scores if label != "Idle"):
+        scores["Idle"] += _MIN_SCORE
+    return scores
+
+
+def classify_animation(text: str) -> tuple[str, float]:
+    """Pick an avatar animation for `text` from a local cue-word lexicon.
+
+    Returns `(label, confidence)` where confidence is the winning label's
+    share of the total score; `(DEFAULT_ANIMATION, 0.0)` means no cue fired.
+    """
+    scores = score_animations(text or "")
+    label, best = max(scores.items(), key=lambda item: item[1])
+    if best < _MIN_SCORE:
+        return DEFAULT_ANIMATION, 0.0
+    total = sum(scores.values())
+    return label, best / total if total else 0.0
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+DEFAULT_PERCENTILE = 0.95
+DEFAULT_INITIAL_DELAY = 4.0
+DEFAULT_MIN_DELAY = 0.5
+DEFAULT_MAX_DELAY = 15.0
+DEFAULT_DEADLINE = 60.0
+_MIN_SAMPLES = 20
+
+
+class HedgedCaller:
+    """Run a call with a hedge and a hard deadline.
+
+    If the primary call has not returned after the `percentile` latency of
+    recent calls (clamped to [`min_delay`, `max_delay`]; `initial_delay`
+    until enough samples exist), a backup call is started and whichever
+    succeeds first wins. The loser is cancelled if it has not started and
+    otherwise abandoned, so its result is ignored. Past `deadline` seconds
+    the call raises TimeoutError.
+
+    An abandoned call keeps its worker until it returns, so no backup is
+    started while `max_abandoned` of them are still running. With `hedge`
+    off, calls only get the deadline.
+    """
+
+    def __init__(self, *, percentile: float = DEFAULT_PERCENTILE,
+                 initial_delay: float = DEFAULT_INITIAL_DELAY,
+                 min_delay: float = DEFAULT_MIN_DELAY, max_delay: float = DEFAULT_MAX_DELAY,
+                 deadline: float = DEFAULT_DEADLINE, window: int = 200, workers: int = 32,
+                 hedge: bool = True, max_abandoned: int | None = None):
+        self.hedge = hedge
+        self.max_abandoned = max(workers // 4, 1) if max_abandoned is None else max_abandoned
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._samples: deque[float] = deque(maxlen=window)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._abandoned = 0
+        self._stats = {"calls": 0, "hedged": 0, "hedge_won": 0, "hedge_skipped": 0,
+                       "deadline_exceeded": 0, "errors": 0}
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < _MIN_SAMPLES:
+            return self.initial_delay
+        value = samples[min(len(samples) - 1, int(self.percentile * len(samples)))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def call(self, primary: Callable[[], Any], backup: Callable[[], Any] | None = None) -> Any:
+        with self._lock:
+            self._stats["calls"] += 1
+        started = time.monotonic()
+        deadline = started + self.deadline
+        first = self._executor.submit(primary)
+        pending = {first}
+
+        if self.hedge and backup is not None:
+            done, _ = wait(pending, timeout=min(self.hedge_delay(), self.deadline))
+            if not done:
+                with self._lock:
+                    allowed = self._abandoned < self.max_abandoned
+                    self._stats["hedged" if allowed else "hedge_skipped"] += 1
+                if allowed:
+                    pending.add(self._executor.submit(backup))
+
+        error: BaseException | None = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for loser in pending:
+                    self._abandon(loser)
+                with self._lock:
+                    self._samples.append(time.monotonic() - started)
+                    if future is not first:
+                        self._stats["hedge_won"] += 1
+                return future.result()
+
+        if not pending:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise error
+
+        for future in pending:
+            self._abandon(future)
+        with self._lock:
+            self._stats["deadline_exceeded"] += 1
+            # Record the timeout as a sample, or the delay never adapts to it.
+            self._samples.append(self.deadline)
+        raise TimeoutError(f"Upstream call exceeded {self.deadline:g}s deadline")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, abandoned_running=self._abandoned)
+        stats["hedge"] = self.hedge
+        stats["hedge_delay_seconds"] = round(self.hedge_delay(), 3)
+        stats["deadline_seconds"] = self.deadline
+        return stats
+
+    def _abandon(self, future):
+        if future.cancel():
+            return
+        with self._lock:
+            self._abandoned += 1
+        future.add_done_callback(self._settled)
+
+    def _settled(self, _future):
+        with self._lock:
+            self._abandoned -= 1
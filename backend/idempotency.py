@@ -0,0 +1,233 @@
+import functools
+import hashlib
+import threading
+import time
+from os import environ as env
+from typing import Callable
+
+from flask import Response, g, has_request_context, jsonify, make_response, request
+
+from usage import request_user
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_WAIT_SECONDS = 120
+DEFAULT_MAX_ENTRIES = 2048
+# Stored bodies include voice audio (~1MB each), so the store is also
+# bounded by the total size of the responses it keeps.
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+MAX_KEY_LENGTH = 255
+
+# Headers worth replaying verbatim; everything else is rebuilt by Flask.
+_REPLAYED_HEADERS = ("Content-Type", "Content-Location", "X-Animation")
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "result", "replayer", "expires_at", "size")
+
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result: tuple[bytes, int, dict] | None = None
+        # Rebuilds a streamed response, whose body is never buffered here.
+        self.replayer: Callable[[], Response] | None = None
+        self.expires_at = expires_at
+        self.size = 0
+
+
+class IdempotencyStore:
+    """In-process, short-TTL store of finished responses keyed by
+    `(route, user, Idempotency-Key)`.
+
+    The first request for a key runs the view; concurrent duplicates block on
+    the in-flight entry and replay its response once it lands. The oldest
+    finished entries are evicted past `max_entries` or `max_bytes` of bodies.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: dict[tuple[str, str], _Entry] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def begin(self, scope: str, key: str, fingerprint: str) -> tuple[_Entry, bool]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((scope, key))
+            if entry and entry.done.is_set() and entry.expires_at <= now:
+                self._remove((scope, key))
+                entry = None
+            if entry:
+                return entry, False
+            self._evict(now)
+            entry = _Entry(fingerprint, now + self.ttl_seconds)
+            self._entries[(scope, key)] = entry
+            return entry, True
+
+    def complete(self, scope: str, key: str, entry: _Entry,
+                 result: tuple[bytes, int, dict] | Callable[[], Response]) -> bool:
+        """Remember `result`, a finished response or a callable that rebuilds
+        one; a body too large to keep is abandoned instead."""
+        size = 0 if callable(result) else len(result[0])
+        if size > self.max_bytes:
+            self.abandon(scope, key, entry)
+            return False
+        with self._lock:
+            if callable(result):
+                entry.replayer = result
+            else:
+                entry.result = result
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            if self._entries.get((scope, key)) is entry:
+                entry.size = size
+                self._bytes += size
+                self._evict(time.monotonic(), room=0)
+        entry.done.set()
+        return True
+
+    def abandon(self, scope: str, key: str, entry: _Entry):
+        # Failed runs are forgotten so a retry can execute the view again.
+        with self._lock:
+            if self._entries.get((scope, key)) is entry:
+                self._remove((scope, key))
+        entry.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+    def _remove(self, key: tuple[str, str]):
+        self._bytes -= self._entries.pop(key).size
+
+    def _evict(self, now: float, room: int = 1):
+        expired = [
+            key for key, entry in self._entries.items()
+            if entry.done.is_set() and entry.expires_at <= now
+        ]
+        for key in expired:
+            self._remove(key)
+        limit = self.max_entries - room
+        if len(self._entries) <= limit and self._bytes <= self.max_bytes:
+            return
+        finished = sorted(
+            (entry.expires_at, key) for key, entry in self._entries.items()
+            if entry.done.is_set()
+        )
+        for _, key in finished:
+            if len(self._entries) <= limit and self._bytes <= self.max_bytes:
+                break
+            self._remove(key)
+
+
+_store = IdempotencyStore(
+    ttl_seconds=float(env.get("IDEMPOTENCY_TTL_SECONDS") or DEFAULT_TTL_SECONDS),
+    max_entries=int(env.get("IDEMPOTENCY_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+    max_bytes=int(env.get("IDEMPOTENCY_MAX_BYTES") or DEFAULT_MAX_BYTES),
+)
+_wait_seconds = float(env.get("IDEMPOTENCY_WAIT_SECONDS") or DEFAULT_WAIT_SECONDS)
+
+
+def _request_fingerprint() -> str:
+    # Accept is included because it selects the response format (e.g. audio).
+    fingerprint = hashlib.sha256(request.get_data(cache=True) or b"")
+    fingerprint.update((request.headers.get("Accept") or "").encode())
+    return fingerprint.hexdigest()
+
+
+def mark_degraded():
+    """Flag the current response as a fallback (e.g. Gemini failed) so it is
+    not remembered; a retry with the same key then runs the view again."""
+    if has_request_context():
+        g.idempotency_degraded = True
+
+
+def replay_with(build: Callable[[], Response]):
+    """Register how to rebuild the current response for a duplicate request.
+
+    A streamed response is never buffered, so a view that streams calls this
+    with a callable that produces the same content without repeating its
+    side effects (e.g. from the already generated answer). Without one, a
+    streamed response is not remembered and a retry runs the view again.
+    """
+    if has_request_context():
+        g.idempotency_replayer = build
+
+
+def _replay(entry: _Entry) -> Response:
+    if entry.replayer is not None:
+        response = make_response(entry.replayer())
+    else:
+        body, status, headers = entry.result
+        response = make_response(body, status)
+        for name, value in headers.items():
+            response.headers[name] = value
+    response.headers[REPLAY_HEADER] = "true"
+    return response
+
+
+def _error(message: str, status: int) -> Response:
+    return make_response(jsonify({"error": message}), status)
+
+
+def idempotent(view):
+    """Honour an `Idempotency-Key` header on an expensive POST route.
+
+    Requests without the header behave exactly as before. Responses with a
+    5xx or 429 status, or marked with `mark_degraded`, are not remembered so
+    clients can retry genuine failures. A streamed response is replayed
+    through the callable passed to `replay_with`. Keys are scoped to the route and the
+    user. Apply it above `metered` so replays and conflicts are not counted
+    as usage.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error("Idempotency-Key is too long", 400)
+
+        scope = f"{request.endpoint or request.path}:{request_user()}"
+        fingerprint = _request_fingerprint()
+        entry, owner = _store.begin(scope, key, fingerprint)
+
+        if not owner:
+            if entry.fingerprint != fingerprint:
+                return _error("Idempotency-Key was reused with a different payload", 422)
+            if not entry.done.wait(_wait_seconds):
+                return _error("Original request is still in progress", 409)
+            if entry.result is None and entry.replayer is None:
+                return _error("Original request failed; retry with the same key", 409)
+            return _replay(entry)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _store.abandon(scope, key, entry)
+            raise
+
+        if (response.status_code >= 500 or response.status_code == 429
+                or g.get("idempotency_degraded")):
+            _store.abandon(scope, key, entry)
+            return response
+        if response.is_streamed:
+            replayer = g.get("idempotency_replayer")
+            if replayer is None:
+                _store.abandon(scope, key, entry)
+            else:
+                _store.complete(scope, key, entry, replayer)
+            return response
+
+        headers = {
+            name: response.headers[name]
+            for name in _REPLAYED_HEADERS if name in response.headers
+        }
+        _store.complete(scope, key, entry, (response.get_data(), response.status_code, headers))
+        return response
+
+    return wrapper
@@ -0,0 +1,173 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+MEMORY_ATTRIBUTE = "ThreadMemory"
+DEFAULT_RECENT_MESSAGES = 6
+DEFAULT_SUMMARY_BATCH = 4
+DEFAULT_SUMMARY_CHARS = 4000
+DEFAULT_MAX_THREADS = 20
+
+
+def _speaker_lines(messages: list[dict]) -> str:
+    lines = []
+    for entry in messages:
+        speaker = "User" if entry["role"] == "user" else "Assistant"
+        lines.append(f"{speaker}: {entry['content']}")
+    return "\n".join(lines)
+
+
+def unsummarized(messages: list[dict], memory: dict | None) -> list[dict]:
+    through = (memory or {}).get("through")
+    if not through:
+        return list(messages)
+    return [entry for entry in messages if (entry.get("timestamp") or "") > through]
+
+
+class ConversationMemory:
+    """Per-thread running summary maintained off the request path.
+
+    Summaries live in the user item under `ThreadMemory.<ChatID>` as
+    `{"summary": str, "through": <timestamp of last folded message>}`; the
+    update is conditional on `through` moving forward so a slow job can
+    never overwrite a newer summary. `prune` keeps the map to the
+    `max_threads` most recently summarized threads that still exist.
+    """
+
+    def __init__(self, table_getter: Callable, generate_text: Callable[[str], str],
+                 primary_key: str, *, recent_messages: int = DEFAULT_RECENT_MESSAGES,
+                 summary_batch: int = DEFAULT_SUMMARY_BATCH,
+                 summary_chars: int = DEFAULT_SUMMARY_CHARS,
+                 max_threads: int = DEFAULT_MAX_THREADS, workers: int = 2):
+        self._table_getter = table_getter
+        self._generate_text = generate_text
+        self._primary_key = primary_key
+        self.recent_messages = recent_messages
+        self.summary_batch = summary_batch
+        self.summary_chars = summary_chars
+        self.max_threads = max(1, max_threads)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="memory")
+        self._running: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def history_text(self, messages: list[dict], memory: dict | None, window: int) -> str:
+        """Prompt history: running summary plus the turns it does not cover.
+
+        Without a summary this is the plain last-`window` transcript.
+        """
+        summary = (memory or {}).get("summary")
+        if not summary:
+            return _speaker_lines(messages[-window:])
+
+        pending = unsummarized(messages, memory)[-window:]
+        recent = pending if len(pending) >= self.recent_messages else messages[-self.recent_messages:]
+        parts = [f"Summary of earlier conversation:\n{summary}"]
+        if recent:
+            parts.append(f"Most recent messages:\n{_speaker_lines(recent)}")
+        return "\n\n".join(parts)
+
+    def schedule(self, eta_id: str, upload_date: str, chat_id: str,
+                 messages: list[dict], memory: dict | None):
+        """Fold older turns into the summary in the background when enough
+        new ones have accumulated. Returns immediately."""
+        pending = unsummarized(messages, memory)[:-self.recent_messages or None]
+        if len(pending) < self.summary_batch:
+            return
+        job = (eta_id, chat_id)
+        with self._lock:
+            if job in self._running:
+                return
+            self._running.add(job)
+        self._executor.submit(
+            self._run, eta_id, upload_date, chat_id, pending, dict(memory or {}))
+
+    def prune(self, eta_id: str, upload_date: str, memories: dict | None,
+              chat_ids: set[str]) -> list[str]:
+        """Drop, in the background, summaries of threads not in `chat_ids`
+        and all but the `max_threads` most recent. Returns the dropped ids."""
+        memories = memories or {}
+        live = sorted((chat_id for chat_id in memories if chat_id in chat_ids),
+                      key=lambda chat_id: (memories[chat_id] or {}).get("through") or "",
+                      reverse=True)
+        keep = set(live[:self.max_threads])
+        stale = [chat_id for chat_id in memories if chat_id not in keep]
+        if stale:
+            self._executor.submit(self._forget, eta_id, upload_date, stale)
+        return stale
+
+    def _forget(self, eta_id: str, upload_date: str, chat_ids: list[str]):
+        names = {f"#c{n}": chat_id for n, chat_id in enumerate(chat_ids)}
+        try:
+            self._table_getter().update_item(
+                Key={self._primary_key: eta_id, "UploadDate": upload_date},
+                UpdateExpression="REMOVE " + ", ".join(f"#memory.{name}" for name in names),
+                ExpressionAttributeNames={"#memory": MEMORY_ATTRIBUTE, **names},
+            )
+        except Exception:
+            logger.warning("Pruning conversation memory failed for %s", eta_id, exc_info=True)
+
+    def _run(self, eta_id: str, upload_date: str, chat_id: str,
+             pending: list[dict], memory: dict):
+        try:
+            summary = self._summarize(memory.get("summary") or "", pending)
+            if summary:
+                self._store(eta_id, upload_date, chat_id, {
+                    "summary": summary,
+                    "through": pending[-1].get("timestamp") or "",
+                })
+        except Exception:
+            logger.warning("Updating conversation memory failed for %s/%s",
+                           eta_id, chat_id, exc_info=True)
+        finally:
+            with self._lock:
+                self._running.discard((eta_id, chat_id))
+
+    def _summarize(self, previous: str, pending: list[dict]) -> str:
+        prompt = (
+            "You maintain a running memory of a tutoring conversation between a student "
+            "and an AI teaching assistant. Update the summary with the new messages. "
+            "Keep every topic covered, definitions given, the student's goals, "
+            "difficulties and preferences, and any open questions. Drop small talk. "
+            f"Use plain prose and stay under {self.summary_chars} characters.\n\n"
+            f"Current summary:\n{previous or 'None yet.'}\n\n"
+            f"New messages:\n{_speaker_lines(pending)}\n\n"
+            "Respond with the updated summary only."
+        )
+        return self._generate_text(prompt).strip()[:self.summary_chars]
+
+    def _store(self, eta_id: str, upload_date: str, chat_id: str, entry: dict):
+        from botocore.exceptions import ClientError
+
+        table = self._table_getter()
+        key = {self._primary_key: eta_id, "UploadDate": upload_date}
+        try:
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET #memory = :empty",
+                ConditionExpression="attribute_not_exists(#memory)",
+                ExpressionAttributeNames={"#memory": MEMORY_ATTRIBUTE},
+                ExpressionAttributeValues={":empty": {}},
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+        try:
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET #memory.#chat = :entry",
+                ConditionExpression=(
+                    "attribute_not_exists(#memory.#chat) OR #memory.#chat.#through < :through"
+                ),
+                ExpressionAttributeNames={
+                    "#memory": MEMORY_ATTRIBUTE,
+                    "#chat": chat_id,
+                    "#through": "through",
+                },
+                ExpressionAttributeValues={":entry": entry, ":through": entry["through"]},
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
@@ -0,0 +1,161 @@
+import json
+import re
+
+DEFAULT_MAX_CHARS = 3000
+DEFAULT_MAX_SECTIONS = 12
+MAX_POINTS_PER_SECTION = 5
+MAX_POINT_CHARS = 200
+MAX_TITLE_CHARS = 80
+MAX_EARLIER_TOPICS = 20
+# NotesSections live in the user item next to ChatHistory and ThreadMemory.
+# Each thread's sections stay under MAX_SECTIONS_BYTES (as stored, UTF-8),
+# and only DEFAULT_MAX_THREADS threads per user keep them: 48KB in all.
+MAX_SECTIONS_BYTES = 6 * 1024
+DEFAULT_MAX_THREADS = 8
+_MIN_SECTION_CHARS = 120
+
+_HEADING = re.compile(r"^\s*(#{1,6}\s+|\*\*)(?P<title>.+?)(\*\*)?\s*:?\s*$")
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit - 1)
+    return text[:cut if cut > 0 else limit - 1].rstrip(",;:") + "…"
+
+
+def _points(lines: list[str]) -> list[str]:
+    points: list[str] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if _BULLET.match(line):
+            points.append(_BULLET.sub("", line))
+        else:
+            points.extend(s for s in _SENTENCE_BOUNDARY.split(line) if s.strip())
+    return [_clip(point, MAX_POINT_CHARS) for point in points[:MAX_POINTS_PER_SECTION]]
+
+
+def extract_sections(text: str, source: str) -> list[dict]:
+    """Turn one assistant message into note sections.
+
+    Markdown headings (or bold-only lines) start a new section; a message
+    without headings becomes one section titled by its first sentence.
+    """
+    blocks: list[tuple[str | None, list[str]]] = [(None, [])]
+    for line in (text or "").splitlines():
+        match = _HEADING.match(line)
+        if match and not _BULLET.match(line):
+            blocks.append((match.group("title").strip("*# "), []))
+        else:
+            blocks[-1][1].append(line)
+
+    sections = []
+    for title, lines in blocks:
+        points = _points(lines)
+        if not title:
+            if not points:
+                continue
+            title, points = points[0], points[1:]
+        sections.append({
+            "title": _clip(title, MAX_TITLE_CHARS),
+            "points": points,
+            "source": source,
+        })
+    return sections
+
+
+def sections_size(sections: list[dict]) -> int:
+    return len(json.dumps(sections, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def merge_sections(existing: list[dict], new: list[dict],
+                   max_sections: int = DEFAULT_MAX_SECTIONS,
+                   max_bytes: int = MAX_SECTIONS_BYTES) -> list[dict]:
+    """Append `new` sections, merging ones whose titles repeat and folding
+    the oldest into an "Earlier topics" section once `max_sections` or
+    `max_bytes` is hit."""
+    merged = [dict(section, points=list(section.get("points") or [])) for section in existing]
+    by_title = {section["title"].lower(): section for section in merged}
+    for section in new:
+        match = by_title.get(section["title"].lower())
+        if match:
+            seen = set(match["points"])
+            match["points"].extend(p for p in section["points"] if p not in seen)
+            match["points"] = match["points"][-MAX_POINTS_PER_SECTION:]
+            match["source"] = section["source"]
+        else:
+            merged.append(section)
+            by_title[section["title"].lower()] = section
+
+    earlier = next((s for s in merged if s.get("earlier")), None)
+    rest = [s for s in merged if not s.get("earlier")]
+
+    def folded(overflow: int) -> list[dict]:
+        if overflow <= 0:
+            return merged
+        topics = list(earlier["points"]) if earlier else []
+        topics.extend(section["title"] for section in rest[:overflow])
+        return [{
+            "title": "Earlier topics",
+            "points": topics[-MAX_EARLIER_TOPICS:],
+            "source": rest[overflow - 1]["source"],
+            "earlier": True,
+        }] + rest[overflow:]
+
+    overflow = len(rest) - (max_sections - 1) if len(merged) > max_sections else 0
+    result = folded(overflow)
+    while sections_size(result) > max_bytes and len(result) > 1:
+        if overflow < len(rest) - 1:
+            overflow += 1
+            result = folded(overflow)
+        else:
+            # Only the newest section is left beside "Earlier topics".
+            result = result[1:]
+    return result
+
+
+def prune_sections(threads: list[dict], keep: str,
+                   max_threads: int = DEFAULT_MAX_THREADS) -> None:
+    """Drop NotesSections from all but the `max_threads` most recently
+    updated threads, always keeping the thread `keep`. Their rendered
+    Notes stay; sections are rebuilt from the hot messages if asked again."""
+    with_sections = [t for t in threads if t.get("NotesSections") is not None]
+    if len(with_sections) <= max_threads:
+        return
+    with_sections.sort(key=lambda t: (str(t.get("ChatID")) == keep, t.get("UpdatedAt") or ""),
+                       reverse=True)
+    for thread in with_sections[max(max_threads, 1):]:
+        thread.pop("NotesSections", None)
+        thread.pop("NotesCursor", None)
+
+
+def render_notes(sections: list[dict], max_chars: int = DEFAULT_MAX_CHARS) -> str:
+    """Render sections as Markdown within `max_chars`.
+
+    The budget is shared evenly so later sections are never cut off
+    wholesale; each section keeps its title and as many points as fit.
+    """
+    if not sections:
+        return ""
+    per_section = max(_MIN_SECTION_CHARS, max_chars // len(sections))
+    rendered: list[str] = []
+    for section in sections:
+        block = f"## {section['title']}"
+        for point in section.get("points") or []:
+            line = f"\n- {point}"
+            if len(block) + len(line) > per_section:
+                break
+            block += line
+        rendered.append(block)
+    notes = "\n\n".join(rendered)
+    while len(notes) > max_chars and len(rendered) > 1:
+        # Only reachable when the minimum per-section budget overshoots:
+        # keep the newest sections.
+        rendered.pop(0)
+        notes = "\n\n".join(rendered)
+    return notes[:max_chars]
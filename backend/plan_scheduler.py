@@ -0,0 +1,297 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from cache import digest
+from segment_scan import ScanCheckpoint, scan_segment
+
+logger = logging.getLogger(__name__)
+
+PLANS_ATTRIBUTE = "WeeklyPlans"
+DEFAULT_HOURS = "2-5"
+DEFAULT_ACTIVE_DAYS = 7
+DEFAULT_CONCURRENCY = 2
+DEFAULT_CHECK_SECONDS = 300
+DEFAULT_MAX_PLANS = 20
+# The item in the lease table (partition key LEASE_KEY) that records which
+# window has been claimed, so only one instance runs a pass per window.
+LEASE_KEY = "LeaseName"
+LEASE_NAME = "weekly-plans"
+
+
+def parse_hours(value: str) -> tuple[int, int]:
+    """`"2-5"` -> (2, 5): from 02:00 up to 05:00 local time. A window such
+    as `"22-4"` wraps past midnight."""
+    start, _, end = (value or DEFAULT_HOURS).partition("-")
+    return int(start) % 24, int(end or start) % 24
+
+
+def plan_freshness(thread: dict, context_version: str) -> str:
+    """Marker for everything a weekly plan is built from. Any new message,
+    edit or upload changes it, and with it the stored plan goes stale."""
+    messages = thread.get("Messages") or []
+    return digest(
+        thread.get("UpdatedAt") or thread.get("CreatedAt"),
+        len(messages),
+        messages[-1].get("timestamp") if messages else None,
+        context_version,
+    )
+
+
+def _parse_time(value) -> datetime.datetime | None:
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+class WeeklyPlanScheduler:
+    """Pre-generates weekly plans for recently active threads off-peak.
+
+    Once a day, inside the `hours` window, the table is scanned for threads
+    whose `UpdatedAt` (or `CreatedAt`) falls within `active_days`. For each
+    one without an up-to-date plan, `generate(item, thread)` is run,
+    `concurrency` at a time. The result is stored under
+    `WeeklyPlans.<ChatID>` as `{"content", "freshness", "generated_at"}`.
+    `freshness(item, thread)` computes the marker the route compares against.
+    Only a user's `max_plans` most recently touched threads get a plan; each
+    pass drops stored plans of any other thread, including deleted ones, and
+    the route drops a plan once it has served it.
+
+    Before a pass, the window is claimed with a conditional write on the
+    `LEASE_NAME` item of the table from `lease_table_getter`, so when
+    several instances run a scheduler only the first one in each window
+    does the work. Without a lease table (none given, or the table does
+    not exist) every instance runs its pass; a missing table is logged.
+    """
+
+    def __init__(self, table_getter: Callable, load_item: Callable[[dict], dict],
+                 generate: Callable[[dict, dict], str], freshness: Callable[[dict, dict], str],
+                 primary_key: str, *, hours: tuple[int, int] = parse_hours(DEFAULT_HOURS),
+                 active_days: float = DEFAULT_ACTIVE_DAYS,
+                 concurrency: int = DEFAULT_CONCURRENCY, segments: int = 1,
+                 check_seconds: float = DEFAULT_CHECK_SECONDS,
+                 max_plans: int = DEFAULT_MAX_PLANS,
+                 lease_table_getter: Callable | None = None):
+        self._table_getter = table_getter
+        self._lease_table_getter = lease_table_getter
+        self._load_item = load_item
+        self._generate = generate
+        self._freshness = freshness
+        self._primary_key = primary_key
+        self.hours = hours
+        self.active_days = active_days
+        self.concurrency = max(1, concurrency)
+        self.segments = max(1, segments)
+        self.check_seconds = check_seconds
+        self.max_plans = max(1, max_plans)
+        self._last_window: str | None = None
+        self._lease_missing_logged = False
+        self.started = False
+        self._running = threading.Lock()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"runs": 0, "scanned": 0, "generated": 0, "fresh": 0, "errors": 0,
+                       "pruned": 0, "claimed_elsewhere": 0, "last_run_at": None}
+
+    def in_window(self, now: datetime.datetime) -> bool:
+        start, end = self.hours
+        if start <= end:
+            return start <= now.hour < end
+        return now.hour >= start or now.hour < end
+
+    def window_day(self, now: datetime.datetime) -> str:
+        """The date a window started on; a window past midnight belongs to
+        the day before."""
+        start, end = self.hours
+        if start > end and now.hour < end:
+            now -= datetime.timedelta(days=1)
+        return now.date().isoformat()
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        threading.Thread(target=self._loop, name="weekly-plans", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats, hours=f"{self.hours[0]}-{self.hours[1]}")
+
+    def run_once(self) -> dict:
+        """Run a full pass now, whatever the time. Returns this pass's counts."""
+        if not self._running.acquire(blocking=False):
+            return {"skipped": "a pass is already running"}
+        counts = {"scanned": 0, "generated": 0, "fresh": 0, "errors": 0, "pruned": 0}
+        lock = threading.Lock()
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=self.active_days)
+
+        def plan(item: dict, thread: dict, marker: str):
+            try:
+                content = self._generate(item, thread)
+                if content:
+                    self._store(item, str(thread.get("ChatID")), {
+                        "content": content,
+                        "freshness": marker,
+                        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    })
+                    outcome = "generated"
+                else:
+                    outcome = "errors"
+            except Exception:
+                logger.warning("Pre-generating a weekly plan failed for %s/%s",
+                               item.get(self._primary_key), thread.get("ChatID"), exc_info=True)
+                outcome = "errors"
+            with lock:
+                counts[outcome] += 1
+
+        def handle_page(raw_items: list, _progress: dict):
+            jobs = []
+            for raw in raw_items:
+                item = self._load_item(raw)
+                stored = item.get(PLANS_ATTRIBUTE) or {}
+                threads = self._planned_threads(item)
+                kept = {str(thread.get("ChatID")) for thread in threads}
+                stale = [chat_id for chat_id in stored if chat_id not in kept]
+                if stale and self.forget(item[self._primary_key], item["UploadDate"], stale):
+                    with lock:
+                        counts["pruned"] += len(stale)
+                for thread in threads:
+                    touched = _parse_time(thread.get("UpdatedAt") or thread.get("CreatedAt"))
+                    if not touched or touched < cutoff or not thread.get("Messages"):
+                        continue
+                    with lock:
+                        counts["scanned"] += 1
+                    marker = self._freshness(item, thread)
+                    if (stored.get(str(thread.get("ChatID"))) or {}).get("freshness") == marker:
+                        with lock:
+                            counts["fresh"] += 1
+                        continue
+                    jobs.append((item, thread, marker))
+            # One page at a time keeps memory bounded by the scan page size.
+            list(executor.map(lambda job: plan(*job), jobs))
+
+        try:
+            checkpoint = ScanCheckpoint(None, self.segments)
+            with ThreadPoolExecutor(max_workers=self.concurrency,
+                                    thread_name_prefix="weekly-plan") as executor:
+                for index in range(self.segments):
+                    scan_segment(self._table_getter(), index, self.segments, checkpoint, handle_page)
+        finally:
+            with self._stats_lock:
+                self._stats["runs"] += 1
+                for name, value in counts.items():
+                    self._stats[name] += value
+                self._stats["last_run_at"] = datetime.datetime.now(
+                    datetime.timezone.utc).isoformat()
+            self._running.release()
+        return counts
+
+    def forget(self, eta_id: str, upload_date: str, chat_ids: list[str]) -> bool:
+        """Remove the stored plans of `chat_ids`; False if the write failed."""
+        names = {f"#c{n}": chat_id for n, chat_id in enumerate(chat_ids)}
+        try:
+            self._table_getter().update_item(
+                Key={self._primary_key: eta_id, "UploadDate": upload_date},
+                UpdateExpression="REMOVE " + ", ".join(f"#plans.{name}" for name in names),
+                ExpressionAttributeNames={"#plans": PLANS_ATTRIBUTE, **names},
+            )
+        except Exception:
+            logger.warning("Removing weekly plans failed for %s", eta_id, exc_info=True)
+            return False
+        return True
+
+    def _planned_threads(self, item: dict) -> list[dict]:
+        """The `max_plans` most recently touched threads of `item`."""
+        epoch = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+        return sorted(
+            item.get("ChatHistory") or [],
+            key=lambda thread: _parse_time(thread.get("UpdatedAt") or thread.get("CreatedAt"))
+            or epoch,
+            reverse=True,
+        )[:self.max_plans]
+
+    def _loop(self):
+        while not self._stop.wait(self.check_seconds):
+            now = datetime.datetime.now().astimezone()
+            if not self.in_window(now):
+                continue
+            window = self.window_day(now)
+            if self._last_window == window:
+                continue
+            try:
+                if not self._claim(window):
+                    self._last_window = window
+                    with self._stats_lock:
+                        self._stats["claimed_elsewhere"] += 1
+                    continue
+                self._last_window = window
+                counts = self.run_once()
+                logger.info("Weekly plan pre-generation finished: %s", counts)
+            except Exception:
+                # A failed claim is retried on the next check.
+                logger.warning("Weekly plan pre-generation pass failed", exc_info=True)
+
+    def _claim(self, window: str) -> bool:
+        """Record `window` as taken unless another instance already has."""
+        if self._lease_table_getter is None:
+            return True
+        from botocore.exceptions import ClientError
+
+        try:
+            self._lease_table_getter().update_item(
+                Key={LEASE_KEY: LEASE_NAME},
+                UpdateExpression="SET #window = :window, #owner = :owner, #at = :at",
+                ConditionExpression="attribute_not_exists(#window) OR #window < :window",
+                ExpressionAttributeNames={"#window": "LastWindow", "#owner": "ClaimedBy",
+                                          "#at": "ClaimedAt"},
+                ExpressionAttributeValues={
+                    ":window": window,
+                    ":owner": f"{socket.gethostname()}:{os.getpid()}",
+                    ":at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                },
+            )
+        except ClientError as exc:
+            code = exc.response.get("Error", {}).get("Code")
+            if code == "ResourceNotFoundException":
+                # Better a pass per instance than none at all.
+                if not self._lease_missing_logged:
+                    self._lease_missing_logged = True
+                    logger.warning("Weekly plan lease table is missing; every instance "
+                                   "will run the pre-generation pass")
+                return True
+            if code != "ConditionalCheckFailedException":
+                raise
+            return False
+        return True
+
+    def _store(self, item: dict, chat_id: str, entry: dict):
+        from botocore.exceptions import ClientError
+
+        table = self._table_getter()
+        key = {self._primary_key: item[self._primary_key], "UploadDate": item["UploadDate"]}
+        try:
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET #plans = :empty",
+                ConditionExpression="attribute_not_exists(#plans)",
+                ExpressionAttributeNames={"#plans": PLANS_ATTRIBUTE},
+                ExpressionAttributeValues={":empty": {}},
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+        table.update_item(
+            Key=key,
+            UpdateExpression="SET #plans.#chat = :entry",
+            ExpressionAttributeNames={"#plans": PLANS_ATTRIBUTE, "#chat": chat_id},
+            ExpressionAttributeValues={":entry": entry},
+        )
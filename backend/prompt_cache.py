@@ -0,0 +1,198 @@
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from cache import TTLCache, digest
+from singleflight import SingleFlight
+
+DEFAULT_TTL_SECONDS = 600
+# Explicit caching rejects prefixes under ~1024 tokens; roughly 4 chars each.
+DEFAULT_MIN_CHARS = 4096
+# A handle is dropped locally this long before the provider expires it, so a
+# request never goes out with a handle that lapses in flight.
+EXPIRY_MARGIN_SECONDS = 30
+FAILURE_RETRY_SECONDS = 60
+
+
+class PrefixStore(ABC):
+    """Where cached prompt prefixes live.
+
+    `create` returns an opaque handle for `text` on `model`, valid for
+    `ttl_seconds`; `config` turns a handle into generate_content config.
+    `delete` removes a handle that is still live; `expire` is told about one
+    the cache has dropped after its TTL or to make room.
+    """
+
+    @abstractmethod
+    def create(self, model: str, text: str, ttl_seconds: float, label: str) -> str:
+        ...
+
+    @abstractmethod
+    def config(self, handle: str) -> dict:
+        ...
+
+    def delete(self, handle: str):
+        pass
+
+    def expire(self, handle: str):
+        pass
+
+
+class GeminiPrefixStore(PrefixStore):
+    """Prefixes held by Gemini's context cache (`client.caches`)."""
+
+    def __init__(self, client: Callable):
+        self._client = client
+
+    def create(self, model: str, text: str, ttl_seconds: float, label: str) -> str:
+        cached = self._client().caches.create(
+            model=model,
+            config={
+                "system_instruction": text,
+                "ttl": f"{int(ttl_seconds)}s",
+                "display_name": label[:128],
+            },
+        )
+        return cached.name
+
+    def config(self, handle: str) -> dict:
+        return {"cached_content": handle}
+
+    def delete(self, handle: str):
+        self._client().caches.delete(name=handle)
+
+
+class LocalPrefixStore(PrefixStore):
+    """Keeps prefixes in process and sends them as a system instruction.
+
+    Nothing is saved upstream; this exercises the same code path as
+    GeminiPrefixStore for development and for models without caching.
+    """
+
+    def __init__(self):
+        self._texts: dict[str, str] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, model: str, text: str, ttl_seconds: float, label: str) -> str:
+        # One handle per create, so expiring one owner's entry never drops
+        # text another owner's entry still points at.
+        handle = f"local/{digest(model, text)[:16]}-{next(self._ids)}"
+        with self._lock:
+            self._texts[handle] = text
+        return handle
+
+    def config(self, handle: str) -> dict:
+        with self._lock:
+            return {"system_instruction": self._texts[handle]}
+
+    def delete(self, handle: str):
+        with self._lock:
+            self._texts.pop(handle, None)
+
+    def expire(self, handle: str):
+        self.delete(handle)
+
+
+class PrefixCache:
+    """One cached-content handle per (model, user, persona, context version).
+
+    The persona text and the user's `Context` block are identical on every
+    chat request until an upload changes the context version, so they are
+    cached upstream once and each request sends only the conversation tail.
+    Handles expire with `ttl_seconds` and are deleted by `invalidate`;
+    expired and evicted handles are forgotten along with their owner entry.
+    Prefixes shorter than `min_chars`, or whose handle cannot be created,
+    are sent inline.
+    """
+
+    def __init__(self, store: PrefixStore, *, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 min_chars: int = DEFAULT_MIN_CHARS, max_entries: int = 1024):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.min_chars = min_chars
+        self._handles = TTLCache(max_entries=max_entries,
+                                 ttl_seconds=max(ttl_seconds - EXPIRY_MARGIN_SECONDS, 1),
+                                 on_evict=self._forget)
+        self._owners: dict[str, set[str]] = {}
+        self._key_owner: dict[str, str] = {}
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "inline": 0, "failed": 0, "invalidated": 0}
+
+    def config(self, model: str, text: str, owner: str, *scope) -> dict:
+        """generate_content config carrying `text` for `owner` (the ETA id);
+        `scope` is whatever else the prefix depends on."""
+        if len(text) < self.min_chars:
+            self._count("inline")
+            return {"system_instruction": text}
+        key = digest(model, owner, *scope)
+        handle = self._handles.get(key)
+        if handle is None:
+            handle = self._flight.do(key, lambda: self._create(key, model, text, owner))
+        elif handle:
+            self._count("reused")
+        if not handle:
+            return {"system_instruction": text}
+        return self.store.config(handle)
+
+    def invalidate(self, owner: str):
+        with self._lock:
+            keys = self._owners.pop(owner, set())
+            for key in keys:
+                self._key_owner.pop(key, None)
+        for key in keys:
+            handle = self._handles.pop(key)
+            if not handle:
+                continue
+            self._count("invalidated")
+            try:
+                self.store.delete(handle)
+            except Exception:
+                # The provider drops it at the TTL anyway.
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=self._handles.stats()["size"],
+                        owners=len(self._owners))
+
+    def _create(self, key: str, model: str, text: str, owner: str) -> str:
+        cached = self._handles.get(key)
+        if cached is not None:
+            return cached
+        # Creations are rare next to lookups, so sweep expired handles here
+        # instead of leaving them until their key is read again.
+        self._handles.purge()
+        try:
+            handle = self.store.create(model, text, self.ttl_seconds, f"eta:{owner}")
+        except Exception:
+            # Remember the failure briefly instead of retrying on every request.
+            self._count("failed")
+            self._handles.set(key, "", ttl_seconds=FAILURE_RETRY_SECONDS)
+            return ""
+        self._count("created")
+        self._handles.set(key, handle)
+        with self._lock:
+            self._owners.setdefault(owner, set()).add(key)
+            self._key_owner[key] = owner
+        return handle
+
+    def _forget(self, key: str, handle: str):
+        with self._lock:
+            owner = self._key_owner.pop(key, None)
+            keys = self._owners.get(owner)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._owners[owner]
+        if handle:
+            try:
+                self.store.expire(handle)
+            except Exception:
+                pass
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
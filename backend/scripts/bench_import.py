@@ -0,0 +1,90 @@
+"""Measure cold-start latency of the Flask API.
+
+Each run spawns a fresh interpreter that imports `app` and then builds the
+WSGI application by reading `app.app` (which a WSGI server loading `app:app`
+does, and which runs `create_app`), and reports wall-clock time for both
+steps, plus the slowest modules from `python -X importtime`.
+
+    python scripts/bench_import.py --runs 10
+    python scripts/bench_import.py --max-ms 400   # non-zero exit if slower
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+_PROBE = (
+    "import time; start = time.perf_counter(); import app; imported = time.perf_counter(); "
+    "app.app; built = time.perf_counter(); "
+    "print((imported - start) * 1000, (built - start) * 1000)"
+)
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    # Clients are lazy, but keep the probe independent of a real key.
+    env.setdefault("GEMINI_API_KEY", "bench")
+    return env
+
+
+def time_import(runs: int) -> list[tuple[float, float]]:
+    """(import ms, import + create_app ms) per run."""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True,
+        )
+        imported, built = result.stdout.strip().splitlines()[-1].split()
+        samples.append((float(imported), float(built)))
+    return samples
+
+
+def slowest_imports(limit: int) -> list[tuple[int, str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Keep `app` and the modules it imports directly; deeper rows are noise.
+        if name.startswith("    "):
+            continue
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail when the median import plus create_app exceeds this budget")
+    args = parser.parse_args()
+
+    samples = time_import(args.runs)
+    for label, column in (("import app", 0), ("import app + create_app", 1)):
+        values = [sample[column] for sample in samples]
+        print(f"{label}: median {statistics.median(values):.1f} ms, min {min(values):.1f} ms, "
+              f"max {max(values):.1f} ms over {len(values)} runs")
+    median = statistics.median(sample[1] for sample in samples)
+    print()
+    print("slowest top-level imports (cumulative):")
+    for micros, name in slowest_imports(args.top):
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nmedian {median:.1f} ms exceeds budget of {args.max_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,157 @@
+"""Measure how often the local animation classifier agrees with Gemini.
+
+`emotion_samples.jsonl` is the set the lexicon was tuned on, so scoring it
+says nothing about agreement with Gemini. Build a held-out set instead:
+`label` takes real assistant answers (a JSONL file of `{"text": ...}` rows
+or a `scripts/user_transfer.py` export), drops any that appear in the
+development set, and labels a random sample with the existing Gemini
+classifier (`gemini_reply_emotion`, needs GEMINI_API_KEY). `score` then
+compares the local classifier against those labels and lists every
+disagreement.
+
+    python scripts/eval_emotion.py label users.ndjson --output heldout.jsonl --limit 300
+    python scripts/eval_emotion.py score heldout.jsonl --disagreements misses.jsonl
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from emotion import ANIMATION_LABELS, classify_animation  # noqa: E402
+
+DEVELOPMENT_CORPUS = Path(__file__).with_name("emotion_samples.jsonl")
+GEMINI_LABELER = "gemini"
+
+
+def load_rows(path: Path) -> list[dict]:
+    rows = []
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+    return rows
+
+
+def answer_texts(path: Path) -> Iterator[str]:
+    """Assistant answers from an export, or `text` fields of plain rows."""
+    for row in load_rows(path):
+        if row.get("type") == "message":
+            message = row.get("message") or {}
+            if message.get("role") == "assistant":
+                yield str(message.get("content") or "")
+        elif "text" in row:
+            yield str(row["text"])
+
+
+def label(args) -> int:
+    from elevenlabs import ElevenLabsModule
+
+    development = {row["text"].strip() for row in load_rows(DEVELOPMENT_CORPUS)}
+    candidates = sorted({
+        text.strip() for text in answer_texts(args.source)
+        if text.strip() and text.strip() not in development
+    })
+    random.Random(args.seed).shuffle(candidates)
+    done = set()
+    if args.output.exists():
+        # Resume: rows already labelled are kept and not sent again.
+        done = {row["text"] for row in load_rows(args.output)}
+
+    module = ElevenLabsModule()
+    module.load_env()
+    labelled = failed = 0
+    with args.output.open("a", encoding="utf-8") as output:
+        for text in candidates[:args.limit]:
+            if text in done:
+                continue
+            try:
+                reference = module.gemini_reply_emotion(text).strip().lower()
+            except Exception as exc:
+                failed += 1
+                print(f"labelling failed: {exc}", file=sys.stderr)
+                continue
+            output.write(json.dumps(
+                {"text": text, "label": reference, "labeler": GEMINI_LABELER},
+                ensure_ascii=False) + "\n")
+            labelled += 1
+    print(f"labelled {labelled} answers ({len(done)} already labelled, {failed} failed) "
+          f"into {args.output}")
+    return 0
+
+
+def score(args) -> int:
+    rows = load_rows(args.corpus)
+    if args.corpus.resolve() == DEVELOPMENT_CORPUS.resolve():
+        print("warning: this is the lexicon's development set; its score is not evidence "
+              "of agreement with Gemini", file=sys.stderr)
+    elif any(row.get("labeler") != GEMINI_LABELER for row in rows):
+        print("warning: some rows were not labelled by Gemini", file=sys.stderr)
+
+    agree = 0
+    confusion: Counter = Counter()
+    local_seconds = 0.0
+    disagreements = []
+    for row in rows:
+        start = time.perf_counter()
+        predicted, confidence = classify_animation(row["text"])
+        local_seconds += time.perf_counter() - start
+
+        reference = row["label"].strip().lower()
+        predicted = predicted.lower()
+        confusion[(reference, predicted)] += 1
+        if predicted == reference:
+            agree += 1
+        else:
+            disagreements.append({"gemini": reference, "local": predicted,
+                                  "confidence": round(confidence, 2), "text": row["text"]})
+
+    total = len(rows)
+    print(f"samples:   {total}")
+    print(f"agreement: {agree}/{total} ({agree / total:.1%})" if total else "agreement: n/a")
+    print(f"local:     {local_seconds / max(total, 1) * 1e6:.1f} us/answer")
+    print()
+    labels = [label.lower() for label in ANIMATION_LABELS]
+    print("gemini \\ local".ljust(22) + "".join(label[:8].rjust(9) for label in labels))
+    for reference in labels:
+        counts = "".join(str(confusion[(reference, p)]).rjust(9) for p in labels)
+        print(reference.ljust(22) + counts)
+
+    if disagreements:
+        print(f"\n{len(disagreements)} disagreements:")
+        for miss in disagreements:
+            print(f"- gemini {miss['gemini']}, local {miss['local']} "
+                  f"({miss['confidence']}): {miss['text'][:80]}")
+    if args.disagreements:
+        with args.disagreements.open("w", encoding="utf-8") as output:
+            for miss in disagreements:
+                output.write(json.dumps(miss, ensure_ascii=False) + "\n")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("label", help="label held-out answers with Gemini")
+    build.add_argument("source", type=Path, help="JSONL of {text} rows or a user_transfer export")
+    build.add_argument("--output", type=Path, required=True)
+    build.add_argument("--limit", type=int, default=300)
+    build.add_argument("--seed", type=int, default=0)
+
+    evaluate = commands.add_parser("score", help="compare the local classifier to the labels")
+    evaluate.add_argument("corpus", type=Path)
+    evaluate.add_argument("--disagreements", type=Path, help="also write them as JSONL")
+
+    args = parser.parse_args()
+    return label(args) if args.command == "label" else score(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
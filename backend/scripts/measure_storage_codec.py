@@ -0,0 +1,157 @@
+"""Estimate DynamoDB item size and capacity units with and without the
+storage codec.
+
+By default a synthetic user is generated (threads of alternating user and
+assistant turns plus PDF summaries). Pass `--item` with the JSON returned by
+`/get-user/<eta_id>` to measure a real item instead.
+
+    python scripts/measure_storage_codec.py
+    python scripts/measure_storage_codec.py --threads 8 --messages 40
+    python scripts/measure_storage_codec.py --item user.json
+"""
+import argparse
+import json
+import math
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage_codec import (  # noqa: E402
+    CHAT_HISTORY_BLOB,
+    CODEC_ATTRIBUTE,
+    CONTEXT_BLOB,
+    FORMAT_ZLIB_JSON,
+    encode_value,
+)
+
+_WORDS = (
+    "the a of to and in is that for it as with on this be are by an we you can "
+    "function derivative integral limit matrix vector energy force mass velocity "
+    "equation theorem proof example step first second then therefore because "
+    "consider notice remember key idea concept definition property value rate "
+    "change system model data set algorithm complexity recursion base case tree "
+    "graph node edge cell protein enzyme reaction acid market demand supply cost "
+    "history revolution policy economy essay argument evidence source practice "
+    "problem solution answer check review exam quiz week plan study focus time"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    body = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return body[0].upper() + body[1:] + "."
+
+
+def _paragraph(rng: random.Random, chars: int) -> str:
+    parts: list[str] = []
+    while sum(len(p) + 1 for p in parts) < chars:
+        parts.append(_sentence(rng, rng.randint(8, 22)))
+    return " ".join(parts)
+
+
+def synthetic_item(threads: int, messages: int, pdfs: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    history = []
+    for index in range(threads):
+        thread_messages = []
+        for turn in range(messages):
+            role = "user" if turn % 2 == 0 else "assistant"
+            length = rng.randint(40, 200) if role == "user" else rng.randint(600, 2000)
+            thread_messages.append({
+                "role": role,
+                "content": _paragraph(rng, length),
+                "timestamp": f"2026-09-{1 + turn % 28:02d}T10:{turn % 60:02d}:00+00:00",
+            })
+        history.append({
+            "ChatID": f"{index:08x}-0000-4000-8000-000000000000",
+            "Title": f"Session {index + 1}",
+            "CreatedAt": "2026-09-01T09:00:00+00:00",
+            "UpdatedAt": "2026-09-28T18:00:00+00:00",
+            "Messages": thread_messages,
+        })
+    context = [{
+        "type": "pdf",
+        "filename": f"lecture-{index + 1}.pdf",
+        "summary": _paragraph(rng, rng.randint(3000, 8000)),
+        "uploaded_at": "2026-09-02T12:00:00+00:00",
+    } for index in range(pdfs)]
+    return {
+        "ElectronincTeachingAssistantMaterialID": "00000000-0000-4000-8000-000000000000",
+        "UploadDate": "2026-09-01T09:00:00+00:00",
+        "UsersName": "Sample Student",
+        "Email": "student@example.com",
+        "ChatHistory": history,
+        "Context": context,
+        "Uploads": [],
+    }
+
+
+def attribute_size(value) -> int:
+    """Approximate DynamoDB's billed size for one attribute value."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (int, float)):
+        return 1 + math.ceil(len(str(abs(value)).replace(".", "")) / 2)
+    if isinstance(value, list):
+        return 3 + sum(1 + attribute_size(entry) for entry in value)
+    if isinstance(value, dict):
+        return 3 + sum(
+            1 + len(str(name).encode("utf-8")) + attribute_size(entry)
+            for name, entry in value.items()
+        )
+    return len(str(value).encode("utf-8"))
+
+
+def item_size(item: dict) -> int:
+    return sum(len(name.encode("utf-8")) + attribute_size(value) for name, value in item.items())
+
+
+def encoded_item(item: dict) -> dict:
+    encoded = dict(item)
+    encoded[CHAT_HISTORY_BLOB] = encode_value(encoded.pop("ChatHistory", []) or [])
+    encoded[CONTEXT_BLOB] = encode_value(encoded.pop("Context", []) or [])
+    encoded[CODEC_ATTRIBUTE] = FORMAT_ZLIB_JSON
+    return encoded
+
+
+def _report(label: str, size: int):
+    rcu = math.ceil(size / 4096)
+    wcu = math.ceil(size / 1024)
+    print(f"{label:<8} {size / 1024:9.1f} KB   RCU {rcu:4d} (eventual {rcu / 2:5.1f})   WCU {wcu:4d}")
+    return rcu, wcu
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--item", type=Path, help="JSON item from /get-user")
+    parser.add_argument("--threads", type=int, default=6)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--pdfs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.item:
+        item = json.loads(args.item.read_text(encoding="utf-8"))
+    else:
+        item = synthetic_item(args.threads, args.messages, args.pdfs, args.seed)
+
+    plain = item_size(item)
+    packed = item_size(encoded_item(item))
+    plain_rcu, plain_wcu = _report("plain", plain)
+    packed_rcu, packed_wcu = _report("encoded", packed)
+    print()
+    print(f"size reduction: {1 - packed / plain:.1%}")
+    print(f"RCU per read:   {plain_rcu} -> {packed_rcu}")
+    print(f"WCU per write:  {plain_wcu} -> {packed_wcu}")
+    if plain > 400 * 1024:
+        print("note: the plain item exceeds DynamoDB's 400 KB item limit")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
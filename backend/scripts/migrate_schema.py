@@ -0,0 +1,99 @@
+"""Normalize legacy chat histories and stamp the current schema version.
+
+Scans the table as `--segments` parallel scan segments. Every item below
+the current `SchemaVersion` has its `ChatHistory` normalized (legacy
+`User`/`Assistant` lists, tuple-style messages, missing ids/titles) and
+written back with the version attribute. Progress per segment is saved to
+`--checkpoint` after every page, so an interrupted run picks up where it
+stopped when started again with the same arguments.
+
+    python scripts/migrate_schema.py --dry-run
+    python scripts/migrate_schema.py --segments 8 --checkpoint migrate.json
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chat_schema import (  # noqa: E402
+    SCHEMA_ATTRIBUTE,
+    SCHEMA_VERSION,
+    chat_history_update,
+    normalize_chat_history,
+)
+from segment_scan import ScanCheckpoint, scan_segment  # noqa: E402
+from storage_codec import decode_item  # noqa: E402
+
+PRIMARY_KEY = "ElectronincTeachingAssistantMaterialID"
+
+
+def migrate_segment(table, index: int, segments: int, checkpoint: ScanCheckpoint,
+                    page_size: int, dry_run: bool) -> dict:
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
+    def migrate_page(items: list, progress: dict):
+        for counter in ("scanned", "migrated", "conflicts"):
+            progress.setdefault(counter, 0)
+        for raw in items:
+            progress["scanned"] += 1
+            item = decode_item(raw)
+            if dry_run:
+                progress["migrated"] += 1
+                continue
+            update = chat_history_update(normalize_chat_history(item.get("ChatHistory", [])))
+            update["ExpressionAttributeNames"] = {"#schema": SCHEMA_ATTRIBUTE}
+            update["ExpressionAttributeValues"][":current"] = SCHEMA_VERSION
+            try:
+                table.update_item(
+                    Key={PRIMARY_KEY: item[PRIMARY_KEY], "UploadDate": item["UploadDate"]},
+                    # The app stamps every write, so a version already present
+                    # means a newer history landed since the scan read it.
+                    ConditionExpression="attribute_not_exists(#schema) OR #schema < :current",
+                    **update,
+                )
+                progress["migrated"] += 1
+            except ClientError as exc:
+                if exc.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    raise
+                progress["conflicts"] += 1
+
+    outdated = Attr(SCHEMA_ATTRIBUTE).not_exists() | Attr(SCHEMA_ATTRIBUTE).lt(SCHEMA_VERSION)
+    return scan_segment(table, index, segments, checkpoint, migrate_page,
+                        page_size=page_size, FilterExpression=outdated)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", default="ETA")
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION") or "us-east-2")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--checkpoint", type=Path, default=Path("migrate_schema.checkpoint.json"))
+    parser.add_argument("--dry-run", action="store_true",
+                        help="count outdated items without writing or checkpointing")
+    args = parser.parse_args()
+
+    import boto3
+
+    table = boto3.resource("dynamodb", region_name=args.region).Table(args.table)
+    checkpoint = ScanCheckpoint(None if args.dry_run else args.checkpoint, args.segments)
+    with ThreadPoolExecutor(max_workers=args.segments) as executor:
+        results = list(executor.map(
+            lambda index: migrate_segment(
+                table, index, args.segments, checkpoint, args.page_size, args.dry_run),
+            range(args.segments),
+        ))
+
+    totals = {key: sum(result.get(key, 0) for result in results)
+              for key in ("scanned", "migrated", "conflicts")}
+    label = "would migrate" if args.dry_run else "migrated"
+    print(f"scanned {totals['scanned']} outdated items, {label} {totals['migrated']}, "
+          f"{totals['conflicts']} changed concurrently (already current)")
+
+
+if __name__ == "__main__":
+    main()
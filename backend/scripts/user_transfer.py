@@ -0,0 +1,242 @@
+"""Stream users in and out of the ETA table as NDJSON.
+
+Each user item becomes a `user` record followed by one `thread` record per
+chat thread, a `message` record per message and a `context` record per
+context entry, so no line is ever a whole item and both directions run in
+constant memory. Archived messages (see MESSAGE_ARCHIVE) are not included.
+
+Export runs `--segments` parallel scan segments and writes complete items
+to the output one at a time:
+
+    python scripts/user_transfer.py export --segments 8 --output users.ndjson
+
+Import rebuilds items and writes them with batched puts from `--workers`
+threads. Progress is checkpointed as a byte offset into the input that
+every earlier item has been written up to, so re-running the same command
+after an interruption resumes there (items are overwritten, never merged):
+
+    python scripts/user_transfer.py import users.ndjson --workers 4
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+from typing import IO, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chat_schema import (  # noqa: E402
+    SCHEMA_ATTRIBUTE,
+    SCHEMA_VERSION,
+    normalize_chat_history,
+    schema_current,
+)
+from segment_scan import ScanCheckpoint, scan_segment  # noqa: E402
+from storage_codec import decode_item, encode_item  # noqa: E402
+
+PRIMARY_KEY = "ElectronincTeachingAssistantMaterialID"
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raw = getattr(value, "value", value)
+    if isinstance(raw, (bytes, bytearray)):
+        return {"$binary": base64.b64encode(bytes(raw)).decode("ascii")}
+    if isinstance(value, set):
+        return sorted(value, key=str)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _json_object(value: dict):
+    if len(value) == 1 and "$binary" in value:
+        return base64.b64decode(value["$binary"])
+    return value
+
+
+def item_records(item: dict) -> Iterator[dict]:
+    if not schema_current(item):
+        item["ChatHistory"] = normalize_chat_history(item.get("ChatHistory", []))
+        item[SCHEMA_ATTRIBUTE] = SCHEMA_VERSION
+    history = item.pop("ChatHistory", None) or []
+    context = item.pop("Context", None) or []
+    eta_id, upload_date = item[PRIMARY_KEY], item["UploadDate"]
+    yield {"type": "user", "eta_id": eta_id, "upload_date": upload_date, "item": item}
+    for thread in history:
+        messages = thread.pop("Messages", None) or []
+        yield {"type": "thread", "eta_id": eta_id, "chat_id": thread["ChatID"], "thread": thread}
+        for message in messages:
+            yield {"type": "message", "eta_id": eta_id, "chat_id": thread["ChatID"], "message": message}
+    for entry in context:
+        yield {"type": "context", "eta_id": eta_id, "entry": entry}
+
+
+def read_items(stream: IO[bytes], offset: int) -> Iterator[tuple[int, int, dict]]:
+    """Yield `(start_offset, end_offset, item)` for each item from `offset`."""
+    stream.seek(offset)
+    item, start = None, offset
+    for line in stream:
+        line_start, offset = offset, offset + len(line)
+        if not line.strip():
+            continue
+        record = json.loads(line, parse_float=Decimal, object_hook=_json_object)
+        kind = record.get("type")
+        if kind == "user":
+            if item is not None:
+                yield start, line_start, item
+            item, start = dict(record["item"], ChatHistory=[], Context=[]), line_start
+        elif item is None:
+            raise ValueError(f"{kind} record at byte {line_start} precedes any user record")
+        elif kind == "thread":
+            item["ChatHistory"].append(dict(record["thread"], Messages=[]))
+        elif kind == "message":
+            item["ChatHistory"][-1]["Messages"].append(record["message"])
+        elif kind == "context":
+            item["Context"].append(record["entry"])
+    if item is not None:
+        yield start, offset, item
+
+
+def export_users(table, output: IO[str], segments: int, page_size: int) -> int:
+    lock = threading.Lock()
+    exported = [0]
+
+    def write_page(items: list, progress: dict):
+        for raw in items:
+            lines = "".join(
+                json.dumps(record, ensure_ascii=False, default=_json_default) + "\n"
+                for record in item_records(decode_item(raw)))
+            with lock:
+                output.write(lines)
+                exported[0] += 1
+
+    # Export is cheap to redo, so progress is tracked in memory only.
+    checkpoint = ScanCheckpoint(None, segments)
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        list(executor.map(
+            lambda index: scan_segment(table, index, segments, checkpoint, write_page,
+                                       page_size=page_size),
+            range(segments),
+        ))
+    output.flush()
+    return exported[0]
+
+
+class ImportCheckpoint:
+    """Byte offset below which every item of `input` has been written.
+
+    Batches can finish out of order; the offset only advances across a
+    contiguous run of finished batches.
+    """
+
+    def __init__(self, path: Path | None, source: str):
+        self.path = path
+        self.source = source
+        self.offset = 0
+        self.imported = 0
+        self._pending: dict[int, tuple[int, int]] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        if path and path.exists():
+            saved = json.loads(path.read_text())
+            if saved.get("input") == source:
+                self.offset, self.imported = saved["offset"], saved["imported"]
+
+    def finished(self, sequence: int, end_offset: int, count: int):
+        with self._lock:
+            self._pending[sequence] = (end_offset, count)
+            while self._next in self._pending:
+                self.offset, done = self._pending.pop(self._next)
+                self.imported += done
+                self._next += 1
+            if self.path:
+                temporary = self.path.with_suffix(".tmp")
+                temporary.write_text(json.dumps(
+                    {"input": self.source, "offset": self.offset, "imported": self.imported}))
+                os.replace(temporary, self.path)
+
+
+def import_users(table, stream: IO[bytes], checkpoint: ImportCheckpoint, workers: int,
+                 batch_items: int) -> int:
+    slots = threading.BoundedSemaphore(workers * 2)
+    failures: list[BaseException] = []
+
+    def write_batch(sequence: int, end_offset: int, items: list[dict]):
+        try:
+            with table.batch_writer() as writer:
+                for item in items:
+                    writer.put_item(Item=encode_item(item))
+            checkpoint.finished(sequence, end_offset, len(items))
+        except BaseException as exc:
+            failures.append(exc)
+        finally:
+            slots.release()
+
+    def submit(sequence: int, end_offset: int, items: list[dict]):
+        slots.acquire()
+        executor.submit(write_batch, sequence, end_offset, items)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch: list[dict] = []
+        sequence = 0
+        for _, end_offset, item in read_items(stream, checkpoint.offset):
+            if failures:
+                break
+            batch.append(item)
+            if len(batch) >= batch_items:
+                submit(sequence, end_offset, batch)
+                batch, sequence = [], sequence + 1
+        if batch and not failures:
+            submit(sequence, end_offset, batch)
+    if failures:
+        raise failures[0]
+    return checkpoint.imported
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", default="ETA")
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION") or "us-east-2")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="scan the table to NDJSON")
+    export.add_argument("--output", default="-", help="file to write, or - for stdout")
+    export.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    export.add_argument("--page-size", type=int, default=100)
+
+    restore = commands.add_parser("import", help="write NDJSON users into the table")
+    restore.add_argument("input", type=Path)
+    restore.add_argument("--workers", type=int, default=4)
+    restore.add_argument("--batch-items", type=int, default=25)
+    restore.add_argument("--checkpoint", type=Path,
+                         help="defaults to <input>.checkpoint.json")
+    args = parser.parse_args()
+
+    import boto3
+
+    table = boto3.resource("dynamodb", region_name=args.region).Table(args.table)
+    if args.command == "export":
+        if args.output == "-":
+            count = export_users(table, sys.stdout, args.segments, args.page_size)
+        else:
+            with open(args.output, "w", encoding="utf-8") as output:
+                count = export_users(table, output, args.segments, args.page_size)
+        print(f"exported {count} users", file=sys.stderr)
+        return
+
+    checkpoint = ImportCheckpoint(
+        args.checkpoint or args.input.with_name(args.input.name + ".checkpoint.json"),
+        str(args.input.resolve()),
+    )
+    with args.input.open("rb") as stream:
+        total = import_users(table, stream, checkpoint, args.workers, args.batch_items)
+    print(f"imported {total} users (offset {checkpoint.offset})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
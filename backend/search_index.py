@@ -0,0 +1,182 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+DEFAULT_INDEX_DIR = Path(__file__).with_name("search_data")
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+_QUERY_TOKEN = re.compile(r"\w+", re.UNICODE)
+_MAX_QUERY_TOKENS = 12
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+    title, content,
+    kind UNINDEXED, chat_id UNINDEXED, ref UNINDEXED, created_at UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS cursors (scope TEXT PRIMARY KEY, position TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS context_refs (ref TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS threads (chat_id TEXT PRIMARY KEY, title TEXT NOT NULL, doc INTEGER);
+"""
+
+
+def _fts_query(text: str) -> str | None:
+    tokens = _QUERY_TOKEN.findall(text or "")[:_MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+    # Quote every token so user input can never be parsed as FTS syntax;
+    # the last one is a prefix match for search-as-you-type.
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+class SearchIndex:
+    """Per-user SQLite FTS5 index over messages, thread titles and context.
+
+    Each user gets their own database file so lookups never touch other
+    users' postings. Messages are indexed incrementally behind a per-thread
+    timestamp cursor; context entries are de-duplicated by reference.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._init_lock = threading.Lock()
+        self._initialised: set[str] = set()
+
+    def _path(self, eta_id: str) -> Path:
+        name = eta_id if _SAFE_ID.match(eta_id) else hashlib.sha256(eta_id.encode("utf-8")).hexdigest()
+        return self.root / f"{name}.sqlite"
+
+    def _connect(self, eta_id: str) -> sqlite3.Connection:
+        path = self._path(eta_id)
+        if eta_id not in self._initialised:
+            self.root.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(path, timeout=10)
+        if eta_id not in self._initialised:
+            with self._init_lock:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(_SCHEMA)
+                self._initialised.add(eta_id)
+        return connection
+
+    def index_thread(self, eta_id: str, thread: dict):
+        chat_id = str(thread.get("ChatID"))
+        title = thread.get("Title") or ""
+        with closing(self._connect(eta_id)) as connection, connection:
+            # Take the write lock before reading the cursor, so two indexers
+            # of the same thread (in any process) cannot both insert `fresh`.
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT position FROM cursors WHERE scope = ?", (f"thread:{chat_id}",)).fetchone()
+            through = row[0] if row else ""
+
+            title_row = connection.execute(
+                "SELECT title, doc FROM threads WHERE chat_id = ?", (chat_id,)).fetchone()
+            if not title_row or title_row[0] != title:
+                if title_row:
+                    connection.execute("DELETE FROM docs WHERE rowid = ?", (title_row[1],))
+                doc = connection.execute(
+                    "INSERT INTO docs (title, content, kind, chat_id, ref, created_at) "
+                    "VALUES (?, '', 'thread', ?, ?, ?)",
+                    (title, chat_id, chat_id, thread.get("CreatedAt") or "")).lastrowid
+                connection.execute(
+                    "INSERT INTO threads (chat_id, title, doc) VALUES (?, ?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET title = excluded.title, doc = excluded.doc",
+                    (chat_id, title, doc))
+
+            fresh = [
+                entry for entry in thread.get("Messages") or []
+                if (entry.get("timestamp") or "") > through
+            ]
+            if not fresh:
+                return
+            connection.executemany(
+                "INSERT INTO docs (title, content, kind, chat_id, ref, created_at) "
+                "VALUES ('', ?, 'message', ?, ?, ?)",
+                [
+                    (entry["content"], chat_id,
+                     f"{entry['role']}:{entry.get('timestamp') or ''}", entry.get("timestamp") or "")
+                    for entry in fresh
+                ],
+            )
+            connection.execute(
+                "INSERT INTO cursors (scope, position) VALUES (?, ?) "
+                "ON CONFLICT(scope) DO UPDATE SET position = excluded.position",
+                (f"thread:{chat_id}", max(entry.get("timestamp") or "" for entry in fresh)))
+
+    def index_context(self, eta_id: str, entries: list):
+        with closing(self._connect(eta_id)) as connection, connection:
+            for entry in entries or []:
+                if not isinstance(entry, dict):
+                    entry = {"summary": str(entry)}
+                text = entry.get("summary") or entry.get("content") or ""
+                if not text:
+                    continue
+                ref = f"{entry.get('type') or 'context'}:{entry.get('filename') or ''}:{entry.get('uploaded_at') or ''}"
+                inserted = connection.execute(
+                    "INSERT OR IGNORE INTO context_refs (ref) VALUES (?)", (ref,)).rowcount
+                if not inserted:
+                    continue
+                connection.execute(
+                    "INSERT INTO docs (title, content, kind, chat_id, ref, created_at) "
+                    "VALUES (?, ?, 'context', '', ?, ?)",
+                    (entry.get("filename") or entry.get("type") or "", text, ref,
+                     entry.get("uploaded_at") or ""))
+
+    def sync_due(self, eta_id: str, max_age_seconds: float) -> bool:
+        """Whether the user's index was last caught up with DynamoDB more
+        than `max_age_seconds` ago, or never on this instance."""
+        if not self._path(eta_id).exists():
+            return True
+        with closing(self._connect(eta_id)) as connection:
+            row = connection.execute(
+                "SELECT position FROM cursors WHERE scope = 'synced'").fetchone()
+        return not row or time.time() - float(row[0]) >= max_age_seconds
+
+    def sync_user(self, eta_id: str, chat_history: list[dict], context: list):
+        """Catch up with anything written by another process.
+
+        Message cursors compare stored timestamps, so `chat_history` must be
+        as stored: normalizing a legacy thread stamps its messages afresh
+        and would index them again on every sync.
+        """
+        for thread in chat_history or []:
+            self.index_thread(eta_id, thread)
+        self.index_context(eta_id, context)
+        with closing(self._connect(eta_id)) as connection, connection:
+            connection.execute(
+                "INSERT INTO cursors (scope, position) VALUES ('synced', ?) "
+                "ON CONFLICT(scope) DO UPDATE SET position = excluded.position",
+                (str(time.time()),))
+
+    def search(self, eta_id: str, query: str, *, limit: int = 20,
+               offset: int = 0) -> tuple[list[dict], int]:
+        match = _fts_query(query)
+        if not match or not self._path(eta_id).exists():
+            return [], 0
+        with closing(self._connect(eta_id)) as connection:
+            total = connection.execute(
+                "SELECT count(*) FROM docs WHERE docs MATCH ?", (match,)).fetchone()[0]
+            rows = connection.execute(
+                "SELECT docs.kind, docs.chat_id, docs.ref, "
+                "coalesce(threads.title, docs.title), docs.created_at, "
+                "snippet(docs, 1, '[', ']', '…', 16), bm25(docs, 2.0, 1.0) AS score "
+                "FROM docs LEFT JOIN threads ON threads.chat_id = docs.chat_id "
+                "WHERE docs MATCH ? ORDER BY score LIMIT ? OFFSET ?",
+                (match, limit, offset),
+            ).fetchall()
+        results = [{
+            "kind": kind,
+            "chat_id": chat_id or None,
+            "ref": ref,
+            "title": title,
+            "created_at": created_at,
+            "snippet": snippet if kind != "thread" else title,
+            # bm25() is lower-is-better; flip it so callers sort descending.
+            "score": round(-score, 6),
+        } for kind, chat_id, ref, title, created_at, snippet, score in rows]
+        return results, total
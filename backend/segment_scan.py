@@ -0,0 +1,57 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable
+
+
+class ScanCheckpoint:
+    """Per-segment progress of a parallel DynamoDB scan, saved as JSON.
+
+    A run restarted with the same checkpoint file skips finished segments
+    and continues the others from their last `LastEvaluatedKey`.
+    """
+
+    def __init__(self, path: Path | None, segments: int):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {"total_segments": segments, "segments": {}}
+        if path and path.exists():
+            saved = json.loads(path.read_text())
+            if saved.get("total_segments") != segments:
+                raise SystemExit(
+                    f"{path} was written with --segments {saved.get('total_segments')}; "
+                    "resume with the same value or use a new checkpoint file")
+            self.state = saved
+
+    def segment(self, index: int) -> dict:
+        with self._lock:
+            saved = self.state["segments"].get(str(index))
+        return dict(saved or {"last_key": None, "done": False})
+
+    def save(self, index: int, progress: dict):
+        with self._lock:
+            self.state["segments"][str(index)] = progress
+            if not self.path:
+                return
+            temporary = self.path.with_suffix(".tmp")
+            temporary.write_text(json.dumps(self.state, indent=2, default=str))
+            os.replace(temporary, self.path)
+
+
+def scan_segment(table, index: int, segments: int, checkpoint: ScanCheckpoint,
+                 handle_page: Callable[[list, dict], None], *, page_size: int = 100,
+                 **scan_kwargs) -> dict:
+    """Scan one segment page by page, calling `handle_page(items, progress)`
+    and checkpointing after each page. Only one page is held at a time."""
+    progress = checkpoint.segment(index)
+    while not progress["done"]:
+        kwargs = dict(scan_kwargs, Segment=index, TotalSegments=segments, Limit=page_size)
+        if progress["last_key"]:
+            kwargs["ExclusiveStartKey"] = progress["last_key"]
+        response = table.scan(**kwargs)
+        handle_page(response.get("Items", []), progress)
+        progress["last_key"] = response.get("LastEvaluatedKey")
+        progress["done"] = not progress["last_key"]
+        checkpoint.save(index, progress)
+    return progress
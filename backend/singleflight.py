@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+from typing import Any, Callable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    The first caller for a key runs `fn`; callers that arrive while it is
+    still running block and receive the same result (or exception). Nothing
+    is cached once the call returns. `execute` also tells the caller
+    whether it was the one that ran `fn`.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executed": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        return self.execute(key, fn)[0]
+
+    def execute(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+def request_key(model: str, contents: Any) -> str:
+    payload = json.dumps({"model": model, "contents": contents},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,119 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from cache import TTLCache, digest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 8
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_MAX_ENTRIES = 64
+
+
+class SpeechPrefetcher:
+    """Speculatively render assistant messages to audio before anyone asks.
+
+    `render(text, voice_id)` returns `(audio_bytes, animation)`. At most
+    `max_pending` renders are queued or running; extra submissions are
+    dropped rather than queued. Each thread only keeps its newest message:
+    submitting a newer one cancels the older job if it has not started and
+    discards its result if it has. A superseded render that is already
+    running still holds a worker, so it counts against `max_pending` until
+    it finishes. Finished renders are kept in a TTL cache
+    until `take` collects them. Which message is newest per thread is kept
+    in a bounded TTL cache too and forgotten once that message is taken.
+    """
+
+    def __init__(self, render: Callable[[str, str], tuple[bytes, str]], *,
+                 workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self._render = render
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts-prefetch")
+        self._ready = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._jobs: dict[str, object] = {}
+        # Newest message key per thread, by digest(eta_id, chat_id). An entry
+        # lives as long as a prepared render could, and it makes room for
+        # every queued job on top of the prepared ones.
+        self._latest = TTLCache(max_entries=max_entries + max_pending, ttl_seconds=ttl_seconds)
+        self._running = 0
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "dropped": 0, "superseded": 0,
+                       "served": 0, "missed": 0, "errors": 0}
+
+    def submit(self, eta_id: str, chat_id: str, message_id: str,
+               text: str, voice_id: str) -> bool:
+        thread = (eta_id, chat_id)
+        key = digest(eta_id, chat_id, message_id, voice_id)
+        with self._lock:
+            previous = self._latest.get(digest(*thread))
+            if previous and previous != key:
+                job = self._jobs.get(previous)
+                if job is not None and job.cancel():
+                    del self._jobs[previous]
+                self._ready.pop(previous)
+                self._stats["superseded"] += 1
+            self._latest.set(digest(*thread), key)
+            if key in self._jobs:
+                return True
+            if len(self._jobs) >= self.max_pending:
+                self._stats["dropped"] += 1
+                return False
+            self._jobs[key] = self._executor.submit(self._run, thread, key, text, voice_id)
+            self._stats["submitted"] += 1
+        return True
+
+    def take(self, eta_id: str, chat_id: str, message_id: str, voice_id: str,
+             wait: float = 0.0) -> tuple[bytes, str] | None:
+        """Return the prepared render, waiting up to `wait` seconds for one
+        that is still in progress; None means render it live."""
+        key = digest(eta_id, chat_id, message_id, voice_id)
+        prepared = None
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None:
+            try:
+                prepared = job.result(timeout=wait)
+            except Exception:
+                # Timed out, cancelled or failed: fall back to a live render.
+                prepared = None
+        # _run caches before it deregisters the job, so a render that
+        # finished after the lookup above is still found here.
+        prepared = self._ready.pop(key) or prepared
+        with self._lock:
+            if self._latest.get(digest(eta_id, chat_id)) == key:
+                self._latest.pop(digest(eta_id, chat_id))
+            self._stats["served" if prepared else "missed"] += 1
+        return prepared
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, pending=len(self._jobs) - self._running,
+                        running=self._running)
+
+    def _run(self, thread: tuple[str, str], key: str, text: str,
+             voice_id: str) -> tuple[bytes, str] | None:
+        with self._lock:
+            self._running += 1
+        try:
+            with self._lock:
+                if self._latest.get(digest(*thread)) != key:
+                    return None
+            result = self._render(text, voice_id)
+            with self._lock:
+                if self._latest.get(digest(*thread)) == key:
+                    self._ready.set(key, result)
+            return result
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning("Speculative speech render failed for %s", thread[0], exc_info=True)
+            return None
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._jobs.pop(key, None)
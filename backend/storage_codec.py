@@ -0,0 +1,70 @@
+import json
+import zlib
+from decimal import Decimal
+from os import environ as env
+
+# First byte of every blob; bump when the layout changes so old and new
+# items can be decoded side by side.
+FORMAT_ZLIB_JSON = 1
+CODEC_ATTRIBUTE = "StorageCodec"
+CHAT_HISTORY_BLOB = "ChatHistoryBlob"
+CONTEXT_BLOB = "ContextBlob"
+_COMPRESSION_LEVEL = 6
+
+
+def codec_enabled() -> bool:
+    return (env.get("STORAGE_CODEC") or "none").strip().lower() == "zlib"
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def encode_value(value) -> bytes:
+    payload = json.dumps(value, separators=(",", ":"), ensure_ascii=False,
+                         default=_json_default).encode("utf-8")
+    return bytes([FORMAT_ZLIB_JSON]) + zlib.compress(payload, _COMPRESSION_LEVEL)
+
+
+def decode_value(blob):
+    # boto3 hands binary attributes back wrapped in `Binary`.
+    raw = bytes(getattr(blob, "value", blob))
+    if not raw:
+        return None
+    version, payload = raw[0], raw[1:]
+    if version == FORMAT_ZLIB_JSON:
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+    raise ValueError(f"Unknown storage codec version {version}")
+
+
+def decode_item(item: dict | None) -> dict | None:
+    """Expand compressed attributes of a DynamoDB item in place.
+
+    Items written before the codec existed pass through untouched. A plain
+    `Context` list next to `ContextBlob` holds entries appended since the
+    last compaction and is kept after the decoded prefix.
+    """
+    if not item:
+        return item
+    if CHAT_HISTORY_BLOB in item:
+        item["ChatHistory"] = decode_value(item.pop(CHAT_HISTORY_BLOB)) or []
+    if CONTEXT_BLOB in item:
+        compacted = decode_value(item.pop(CONTEXT_BLOB)) or []
+        item["Context"] = compacted + list(item.get("Context") or [])
+    item.pop(CODEC_ATTRIBUTE, None)
+    return item
+
+
+def encode_item(item: dict) -> dict:
+    """Inverse of `decode_item` for whole-item writes (put_item)."""
+    item = dict(item)
+    if not codec_enabled():
+        return item
+    item[CHAT_HISTORY_BLOB] = encode_value(item.pop("ChatHistory", None) or [])
+    item[CONTEXT_BLOB] = encode_value(item.pop("Context", None) or [])
+    item[CODEC_ATTRIBUTE] = FORMAT_ZLIB_JSON
+    return item
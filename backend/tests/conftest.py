@@ -0,0 +1,153 @@
+import sys
+from pathlib import Path
+
+# Backend modules import each other as top-level modules.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+import copy
+import re
+import threading
+
+import pytest
+
+PRIMARY_KEY = "ElectronincTeachingAssistantMaterialID"
+_ASSIGNMENT = re.compile(
+    r"([#\w.]+) = (?:list_append\(if_not_exists\([#\w]+, (:\w+)\), (:\w+)\)"
+    r"|if_not_exists\([#\w]+, (:\w+)\)|(:\w+))")
+
+
+def _condition_holds(item, condition, names, values):
+    # Just the forms the code uses: `attribute_not_exists(#a)` and `#a < :v`,
+    # joined by OR. Anything else is treated as satisfied.
+    for clause in condition.split(" OR "):
+        clause = clause.strip()
+        missing = re.fullmatch(r"attribute_not_exists\(([#\w]+)\)", clause)
+        if missing:
+            if names.get(missing.group(1), missing.group(1)) not in item:
+                return True
+            continue
+        less = re.fullmatch(r"([#\w]+) < (:\w+)", clause)
+        if less:
+            current = item.get(names.get(less.group(1), less.group(1)))
+            if current is not None and current < values[less.group(2)]:
+                return True
+            continue
+        return True
+    return False
+
+
+class FakeTable:
+    """In-memory stand-in for the ETA table: latest-item queries, scans and
+    the SET / REMOVE update expressions the app issues. Only the simplest
+    condition expressions are evaluated. `key_names` are the key attributes;
+    queries assume the ETA (partition, sort) layout."""
+
+    def __init__(self, items=(), key_names=(PRIMARY_KEY, "UploadDate")):
+        self.key_names = key_names
+        self.items = {}
+        self.updates = []
+        self._lock = threading.Lock()
+        for item in items:
+            self.put_item(Item=item)
+
+    def _key(self, key):
+        return tuple(key[name] for name in self.key_names)
+
+    def put_item(self, Item, **_):
+        with self._lock:
+            self.items[self._key(Item)] = copy.deepcopy(Item)
+
+    def get_item(self, Key, **_):
+        item = self.items.get(self._key(Key))
+        return {"Item": copy.deepcopy(item)} if item else {}
+
+    def query(self, KeyConditionExpression, Limit=None, **_):
+        eta_id = KeyConditionExpression.get_expression()["values"][1]
+        matches = sorted((item for (owner, _), item in self.items.items() if owner == eta_id),
+                         key=lambda item: item["UploadDate"], reverse=True)
+        return {"Items": copy.deepcopy(matches[:Limit] if Limit else matches)}
+
+    def scan(self, Segment=0, TotalSegments=1, **_):
+        items = [item for n, item in enumerate(self.items.values()) if n % TotalSegments == Segment]
+        return {"Items": copy.deepcopy(items)}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None,
+                    ExpressionAttributeNames=None, ReturnValues="NONE",
+                    ConditionExpression=None, **kwargs):
+        from botocore.exceptions import ClientError
+
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self._lock:
+            item = self.items.get(self._key(Key)) or dict(Key)
+            if ConditionExpression and not _condition_holds(item, ConditionExpression, names, values):
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}},
+                                  "UpdateItem")
+            self.updates.append(dict(kwargs, Key=Key, UpdateExpression=UpdateExpression))
+            self.items[self._key(Key)] = item
+            assignments, _, removals = (" " + UpdateExpression).removeprefix(" SET ").partition(
+                " REMOVE ")
+            for match in _ASSIGNMENT.finditer(assignments):
+                path = [names.get(part, part) for part in match.group(1).split(".")]
+                target = item
+                for part in path[:-1]:
+                    target = target.setdefault(part, {})
+                if match.group(3):
+                    target[path[-1]] = list(target.get(path[-1]) or []) + copy.deepcopy(
+                        values[match.group(3)])
+                elif match.group(4):
+                    target.setdefault(path[-1], copy.deepcopy(values[match.group(4)]))
+                else:
+                    target[path[-1]] = copy.deepcopy(values[match.group(5)])
+            for name in filter(None, (part.strip() for part in removals.split(","))):
+                path = [names.get(part, part) for part in name.split(".")]
+                target = item
+                for part in path[:-1]:
+                    target = target.get(part) or {}
+                target.pop(path[-1], None)
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": copy.deepcopy(item)}
+        return {}
+
+
+class _Part:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    """Gemini client whose replies are `reply #<n>`; `prompts` records each call."""
+
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+        self.models = self
+
+    def generate_content(self, model, contents, **_):
+        with self._lock:
+            self.prompts.append(contents[-1]["parts"][0]["text"])
+            text = f"reply #{len(self.prompts)}"
+        content = type("Content", (), {"parts": [_Part(text)]})()
+        return type("Response", (), {
+            "text": text, "candidates": [type("Candidate", (), {"content": content})()]})()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The Flask app wired to a FakeTable and FakeGemini, with the search
+    index, conversation memory and usage ledger switched off. Admin routes
+    accept the `admin_headers` sent with the client."""
+    import app as app_module
+
+    table, gemini = FakeTable(), FakeGemini()
+    monkeypatch.setenv("ADMIN_TOKEN", "test-admin-token")
+    monkeypatch.setattr(app_module, "_table", lambda: table)
+    monkeypatch.setattr(app_module, "_gemini_client", lambda: gemini)
+    monkeypatch.setattr(app_module, "SEARCH_ENABLED", False)
+    monkeypatch.setattr(app_module, "MEMORY_ENABLED", False)
+    app_module.generation_cache._data.clear()
+    client = app_module.create_app({"USAGE_LEDGER": False}).test_client()
+    client.table, client.gemini, client.module = table, gemini, app_module
+    client.admin_headers = {"X-Admin-Token": "test-admin-token"}
+    return client
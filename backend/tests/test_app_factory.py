@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def test_importing_the_app_defers_heavy_clients():
+    # A fresh interpreter, since other tests import these modules directly.
+    script = (
+        "import sys, app\n"
+        "heavy = ('boto3', 'google.genai', 'google.generativeai', 'pypdf', 'PyPDF2')\n"
+        "print(','.join(name for name in heavy if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_create_app_builds_independent_apps():
+    import app
+
+    first, second = app.create_app(), app.create_app()
+    assert first is not second
+    rules = {rule.rule for rule in first.url_map.iter_rules()}
+    assert {"/thread/add_message", "/voice-response"} <= rules
+    assert first.test_client().get("/no-such-route").status_code == 404
+
+
+def test_importing_the_app_leaves_the_write_behind_log_alone(tmp_path):
+    wal = tmp_path / "wal" / "chat_history.wal"
+    script = (
+        "import threading, app\n"
+        "print(app.write_behind, app._default_app,\n"
+        "      any(t.name == 'write-behind' for t in threading.enumerate()))\n"
+    )
+    env = dict(os.environ, CHAT_WRITE_BEHIND="1", CHAT_WRITE_BEHIND_WAL=str(wal))
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["None", "None", "False"]
+    assert not wal.parent.exists()
+
+
+def test_create_app_starts_one_write_behind_buffer(tmp_path, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "write_behind", None)
+    config = {"USAGE_LEDGER": False, "CHAT_WRITE_BEHIND": True,
+              "CHAT_WRITE_BEHIND_WAL": str(tmp_path / "chat.wal")}
+    app.create_app(config)
+    buffer = app.write_behind
+    app.create_app(config)
+    assert buffer is not None and app.write_behind is buffer
+    assert (tmp_path / "chat.wal").exists()
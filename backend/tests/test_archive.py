@@ -0,0 +1,103 @@
+import pytest
+
+from archive import DynamoSegmentArchive, LocalSegmentArchive, get_archive
+
+
+def test_segments_are_numbered_and_paged_newest_first(tmp_path):
+    archive = LocalSegmentArchive(tmp_path)
+    for start in range(0, 50, 10):
+        messages = [{"content": f"m{n}"} for n in range(start, start + 10)]
+        assert archive.append_segment("user", "chat", messages) == start // 10
+
+    segments, cursor = archive.read_segments("user", "chat", None, 2)
+    assert [seq for seq, _ in segments] == [3, 4]
+    assert segments[0][1][0] == {"content": "m30"}
+    assert cursor == 3
+
+    segments, cursor = archive.read_segments("user", "chat", cursor, 10)
+    assert [seq for seq, _ in segments] == [0, 1, 2]
+    assert cursor is None
+
+
+def test_unknown_thread_is_empty(tmp_path):
+    assert LocalSegmentArchive(tmp_path).read_segments("user", "missing", None, 5) == ([], None)
+
+
+def test_ids_stay_inside_the_root(tmp_path):
+    root = tmp_path / "root"
+    archive = LocalSegmentArchive(root)
+    archive.append_segment("../escape", "chat/../x", [{"content": "m"}])
+
+    assert not (tmp_path / "escape").exists()
+    assert all(path.resolve().is_relative_to(root.resolve()) for path in root.rglob("*.seg"))
+    assert archive.read_segments("../escape", "chat/../x", None, 1)[0][0][1] == [{"content": "m"}]
+
+
+@pytest.mark.parametrize("setting, kind", [
+    (None, type(None)), ("dynamodb", DynamoSegmentArchive), ("local", LocalSegmentArchive),
+    ("none", type(None))])
+def test_archive_is_opt_in(monkeypatch, tmp_path,
+                                                                setting, kind):
+    if setting is None:
+        monkeypatch.delenv("MESSAGE_ARCHIVE", raising=False)
+    else:
+        monkeypatch.setenv("MESSAGE_ARCHIVE", setting)
+    monkeypatch.setenv("MESSAGE_ARCHIVE_DIR", str(tmp_path))
+    get_archive.cache_clear()
+    try:
+        assert type(get_archive()) is kind
+    finally:
+        get_archive.cache_clear()
+
+
+def _messages(count):
+    return [{"role": "user", "content": f"m{n}", "timestamp": f"t{n:03d}"} for n in range(count)]
+
+
+def test_trimmed_messages_move_to_the_archive_and_page_back(api, tmp_path, monkeypatch):
+    module = api.module
+    archive = LocalSegmentArchive(tmp_path)
+    monkeypatch.setattr(module, "get_archive", lambda: archive)
+    thread = {"ChatID": "c1", "Messages": _messages(module.HOT_MESSAGE_LIMIT + 1)}
+
+    with api.application.app_context():
+        module._trim_thread("user", thread)
+
+    kept = module.HOT_MESSAGE_LIMIT - module.ARCHIVE_BATCH
+    assert len(thread["Messages"]) == kept
+    assert thread["ArchivedMessages"] == module.HOT_MESSAGE_LIMIT + 1 - kept
+    page = api.get("/thread/archive?etaId=user&chatID=c1").get_json()
+    assert page["messages"][0]["content"] == "m0"
+    assert page["next_before"] is None
+
+
+def test_messages_stay_in_the_thread_when_archiving_fails(api, monkeypatch):
+    module = api.module
+
+    class BrokenArchive:
+        def append_segment(self, *args):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(module, "get_archive", lambda: BrokenArchive())
+    thread = {"ChatID": "c1", "Messages": _messages(module.HOT_MESSAGE_LIMIT + 5)}
+    with api.application.app_context():
+        module._trim_thread("user", thread)
+    assert len(thread["Messages"]) == module.HOT_MESSAGE_LIMIT + 5
+
+
+def test_thread_stays_bounded_while_the_archive_keeps_failing(api, monkeypatch):
+    module = api.module
+
+    class BrokenArchive:
+        def append_segment(self, *args):
+            raise OSError("table missing")
+
+    monkeypatch.setattr(module, "get_archive", lambda: BrokenArchive())
+    thread = {"ChatID": "c1", "Messages": []}
+    with api.application.app_context():
+        for n in range(10 * module.HOT_MESSAGE_LIMIT):
+            thread["Messages"].append({"role": "user", "content": f"m{n}"})
+            module._trim_thread("user", thread)
+            assert len(thread["Messages"]) <= module.HARD_MESSAGE_LIMIT
+    assert thread["Messages"][-1]["content"] == f"m{10 * module.HOT_MESSAGE_LIMIT - 1}"
+    assert "ArchivedMessages" not in thread
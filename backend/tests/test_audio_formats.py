@@ -0,0 +1,58 @@
+import pytest
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import audio_formats
+from audio_formats import (DEFAULT_RENDITION, configured_quality, default_rendition, negotiate,
+                           rendition_key)
+
+
+def _accept(value):
+    return parse_accept_header(value, MIMEAccept)
+
+
+def test_missing_or_wildcard_accept_gets_mp3():
+    assert negotiate(_accept(""), None).output_format == DEFAULT_RENDITION.output_format
+    rendition = negotiate(_accept("*/*"), "low")
+    assert (rendition.mimetype, rendition.output_format) == ("audio/mpeg", "mp3_22050_32")
+    assert rendition.streamable
+
+
+@pytest.mark.parametrize("accept", ["audio/ogg", "audio/ogg;codecs=opus", "audio/opus",
+                                    "audio/ogg, audio/mpeg;q=0.5"])
+def test_ogg_opus_is_negotiated(accept):
+    rendition = negotiate(_accept(accept), "medium")
+    assert (rendition.mimetype, rendition.output_format) == ("audio/ogg", "opus_48000_64")
+    assert not rendition.streamable
+
+
+def test_unacceptable_type_and_unknown_quality():
+    assert negotiate(_accept("audio/wav"), None) is None
+    with pytest.raises(ValueError):
+        negotiate(_accept("audio/mpeg"), "lossless")
+
+
+def test_default_quality_comes_from_the_environment(monkeypatch):
+    monkeypatch.setattr(audio_formats, "default_quality", configured_quality(" Low "))
+    assert negotiate(_accept("audio/mpeg"), None).quality == "low"
+
+
+@pytest.mark.parametrize("accept", ["", "*/*", "audio/mpeg"])
+def test_speculative_rendition_matches_what_a_plain_request_negotiates(monkeypatch, accept):
+    monkeypatch.setattr(audio_formats, "default_quality", "medium")
+    expected = negotiate(_accept(accept), None).output_format
+    assert default_rendition().output_format == expected == "mp3_44100_64"
+
+
+def test_bad_default_quality_falls_back_instead_of_failing_requests(monkeypatch, caplog):
+    monkeypatch.setattr(audio_formats, "default_quality", configured_quality("lossless"))
+    assert "VOICE_DEFAULT_QUALITY" in caplog.text
+    assert negotiate(_accept("audio/mpeg"), None).quality == "high"
+    assert negotiate(_accept("audio/mpeg"), "").quality == "high"
+
+
+def test_each_rendition_is_cached_separately():
+    mp3 = negotiate(_accept("audio/mpeg"), "high")
+    ogg = negotiate(_accept("audio/ogg"), "high")
+    assert rendition_key("hi", "voice", mp3) != rendition_key("hi", "voice", ogg)
+    assert rendition_key("hi", "voice", mp3) == rendition_key("hi", "voice", DEFAULT_RENDITION)
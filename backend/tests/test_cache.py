@@ -0,0 +1,51 @@
+from cache import TTLCache, digest
+
+
+def test_hits_misses_and_expiry():
+    cache = TTLCache(max_entries=4, ttl_seconds=60)
+    cache.set("fresh", 1)
+    cache.set("stale", 2, ttl_seconds=0)
+
+    assert cache.get("fresh") == 1
+    assert cache.get("stale") is None
+    assert cache.get("missing", "default") == "default"
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0, "expired": 1, "size": 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_pop_removes_an_entry():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "gone") == "gone"
+    assert cache.get("a") is None
+
+
+def test_on_evict_sees_expired_and_evicted_entries_but_not_pops():
+    dropped = []
+    cache = TTLCache(max_entries=2, ttl_seconds=60, on_evict=lambda *entry: dropped.append(entry))
+    cache.set("stale", 1, ttl_seconds=0)
+    cache.set("a", 2)
+    cache.set("b", 3)
+    cache.pop("b")
+    cache.set("c", 4, ttl_seconds=0)
+    cache.purge()
+
+    assert dropped == [("stale", 1), ("c", 4)]
+    assert cache.stats()["size"] == 1 and cache.get("a") == 2
+
+
+def test_digest_is_stable_and_order_sensitive():
+    assert digest("route", {"b": 1, "a": 2}) == digest("route", {"a": 2, "b": 1})
+    assert digest("a", "b") != digest("b", "a")
@@ -0,0 +1,43 @@
+from chat_schema import (SCHEMA_ATTRIBUTE, SCHEMA_VERSION, chat_history_update,
+                         normalize_chat_history, normalize_message_entry, schema_current)
+from storage_codec import CHAT_HISTORY_BLOB, decode_value
+
+
+def test_legacy_user_and_assistant_lists_become_messages():
+    history = normalize_chat_history([
+        {"User": ["q1", "q2"], "Assistant": ["a1"]},
+        "not a thread",
+        {"ChatID": "c2", "Messages": [("Assistant", "hello", "t1"), {"role": "user", "text": " "}]},
+    ])
+
+    assert [thread["ChatID"] for thread in history] == ["0", "c2"]
+    first = history[0]
+    assert [(m["role"], m["content"]) for m in first["Messages"]] == [
+        ("user", "q1"), ("assistant", "a1"), ("user", "q2")]
+    assert "User" not in first and "Assistant" not in first
+    assert first["Title"] == "Session 1" and first["CreatedAt"]
+    assert history[1]["Messages"] == [{"role": "assistant", "content": "hello", "timestamp": "t1"}]
+
+
+def test_unknown_roles_are_mapped():
+    assert normalize_message_entry({"Role": "Assistant-bot", "message": "x"})["role"] == "assistant"
+    assert normalize_message_entry({"role": "student", "content": "x"})["role"] == "user"
+    assert normalize_message_entry(42) is None
+
+
+def test_schema_version_is_stamped_on_write(monkeypatch):
+    monkeypatch.delenv("STORAGE_CODEC", raising=False)
+    plain = chat_history_update([{"ChatID": "1"}])
+    assert "REMOVE " + CHAT_HISTORY_BLOB in plain["UpdateExpression"]
+    assert plain["ExpressionAttributeValues"][":schema"] == SCHEMA_VERSION
+
+    monkeypatch.setenv("STORAGE_CODEC", "zlib")
+    encoded = chat_history_update([{"ChatID": "1"}])
+    assert "REMOVE ChatHistory" in encoded["UpdateExpression"]
+    assert decode_value(encoded["ExpressionAttributeValues"][":blob"]) == [{"ChatID": "1"}]
+
+
+def test_schema_current():
+    assert not schema_current(None)
+    assert not schema_current({"ChatHistory": []})
+    assert schema_current({SCHEMA_ATTRIBUTE: SCHEMA_VERSION})
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from elevenlabs import ElevenLabsModule, split_sentences
+
+
+def test_first_sentence_stands_alone_and_the_rest_are_packed():
+    text = "First one. Second is here. Third too! Fourth? Fifth."
+    assert split_sentences(text, max_chars=30) == [
+        "First one.", "Second is here. Third too!", "Fourth? Fifth.",
+    ]
+
+
+def test_overlong_sentences_break_on_whitespace():
+    segments = split_sentences("word " * 30, max_chars=20)
+    assert all(len(segment) <= 20 for segment in segments)
+    assert " ".join(segments).split() == ["word"] * 30
+    assert split_sentences("   ") == []
+
+
+def test_pipelined_speech_yields_segments_in_order(monkeypatch):
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "key")
+    requests = []
+
+    def synthesize(self, text, voice_id, model_id, *, previous_text=None, next_text=None,
+                   **_):
+        requests.append((text, previous_text, next_text))
+        # Later segments finish first; the output must still be in order.
+        time.sleep(0.05 if text.startswith("One") else 0.0)
+        return text.encode()
+
+    monkeypatch.setattr(ElevenLabsModule, "_synthesize", synthesize)
+    chunks = ElevenLabsModule().elevenlabs_speech_pipelined(
+        "One. Two. Three.", window=3, max_segment_chars=6)
+
+    assert b"|".join(chunks) == b"One.|Two.|Three."
+    assert sorted(requests) == [
+        ("One.", None, "Two."), ("Three.", "Two.", None), ("Two.", "One.", "Three."),
+    ]
+
+
+def test_pipelined_speech_needs_an_api_key_up_front(monkeypatch):
+    monkeypatch.delenv("ELEVENLABS_API_KEY", raising=False)
+    with pytest.raises(RuntimeError):
+        ElevenLabsModule().elevenlabs_speech_pipelined("Hello.")
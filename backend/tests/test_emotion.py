@@ -0,0 +1,29 @@
+import pytest
+
+from emotion import ANIMATION_LABELS, DEFAULT_ANIMATION, classify_animation
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Congratulations, you nailed it! Perfect score!", "Dancing"),
+    ("Unfortunately that answer is incorrect, sorry.", "Defeated"),
+    ("Haha, that is hilarious, lol.", "Dying"),
+    ("Okay, sure.", "Idle"),
+    ("", "Idle"),
+])
+def test_clear_cues_pick_their_animation(text, expected):
+    label, confidence = classify_animation(text)
+    assert label == expected
+    assert 0 < confidence <= 1
+
+
+def test_plain_explanation_keeps_talking():
+    text = ("A derivative measures how a function changes as its input changes. "
+            "For f(x) = x squared the derivative is 2x.")
+    assert classify_animation(text) == (DEFAULT_ANIMATION, 0.0)
+
+
+def test_long_answers_dilute_incidental_cues():
+    explanation = " ".join(["the integral of a polynomial term adds one to its exponent"] * 20)
+    label, _ = classify_animation("Great. " + explanation)
+    assert label == DEFAULT_ANIMATION
+    assert label in ANIMATION_LABELS
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from hedging import HedgedCaller
+
+
+def test_fast_primary_is_not_hedged():
+    caller = HedgedCaller(initial_delay=1.0)
+    backups = []
+    assert caller.call(lambda: "primary", lambda: backups.append(1)) == "primary"
+    assert backups == []
+    assert caller.stats()["hedged"] == 0
+
+
+def test_slow_primary_is_hedged_and_the_backup_wins():
+    release = threading.Event()
+    caller = HedgedCaller(initial_delay=0.05, deadline=5)
+
+    def slow():
+        release.wait(5)
+        return "primary"
+
+    assert caller.call(slow, lambda: "backup") == "backup"
+    release.set()
+    stats = caller.stats()
+    assert stats["hedged"] == 1 and stats["hedge_won"] == 1
+
+
+def test_deadline_raises_timeout():
+    release = threading.Event()
+    caller = HedgedCaller(initial_delay=0.05, deadline=0.2)
+    with pytest.raises(TimeoutError):
+        caller.call(lambda: release.wait(5))
+    release.set()
+    assert caller.stats()["deadline_exceeded"] == 1
+
+
+def test_error_is_raised_once_every_attempt_failed():
+    caller = HedgedCaller(initial_delay=0.01, deadline=5)
+
+    def failing():
+        time.sleep(0.05)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        caller.call(failing, failing)
+    assert caller.stats()["errors"] == 1
+
+
+def test_hedge_delay_follows_recent_latency():
+    caller = HedgedCaller(initial_delay=4.0, min_delay=0.5, max_delay=15.0)
+    assert caller.hedge_delay() == 4.0
+    caller._samples.extend([1.0] * 19 + [10.0])
+    assert caller.hedge_delay() == 10.0
+    caller._samples.extend([0.1] * 200)
+    assert caller.hedge_delay() == 0.5
+
+
+def test_hedging_can_be_switched_off():
+    release = threading.Event()
+    caller = HedgedCaller(initial_delay=0.01, deadline=5, hedge=False)
+    backups = []
+
+    def slow():
+        release.wait(0.2)
+        return "primary"
+
+    assert caller.call(slow, lambda: backups.append(1)) == "primary"
+    assert backups == [] and caller.stats()["hedged"] == 0
+
+
+def test_no_new_hedges_while_abandoned_losers_hold_workers():
+    release = threading.Event()
+    caller = HedgedCaller(initial_delay=0.01, deadline=5, workers=8, max_abandoned=1)
+
+    def stuck():
+        release.wait(5)
+        return "late"
+
+    # The backup wins and the running primary is abandoned.
+    assert caller.call(stuck, lambda: "backup") == "backup"
+    assert caller.stats()["abandoned_running"] == 1
+
+    backups = []
+    assert caller.call(lambda: time.sleep(0.1) or "primary",
+                       lambda: backups.append(1)) == "primary"
+    assert backups == [] and caller.stats()["hedge_skipped"] == 1
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while caller.stats()["abandoned_running"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert caller.stats()["abandoned_running"] == 0
@@ -0,0 +1,175 @@
+import threading
+
+import pytest
+from flask import Flask, Response, jsonify, request
+
+import idempotency
+from idempotency import (IDEMPOTENCY_HEADER, REPLAY_HEADER, IdempotencyStore, idempotent,
+                         mark_degraded, replay_with)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(idempotency, "_store", IdempotencyStore(ttl_seconds=60))
+    monkeypatch.setattr(idempotency, "_wait_seconds", 5)
+    app = Flask(__name__)
+    app.calls = []
+    app.entered = threading.Event()
+    app.release = threading.Event()
+    app.release.set()
+
+    @app.route("/chat", methods=["POST"])
+    @idempotent
+    def chat():
+        body = request.get_json()
+        app.calls.append(body)
+        app.entered.set()
+        app.release.wait(5)
+        if body.get("degraded"):
+            mark_degraded()
+        return jsonify({"reply": len(app.calls)}), body.get("status", 200)
+
+    @app.route("/stream", methods=["POST"])
+    @idempotent
+    def stream():
+        body = request.get_json()
+        app.calls.append(body)
+        answer = f"answer {len(app.calls)}"
+        if body.get("replayable"):
+            replay_with(lambda: Response(answer.encode(), mimetype="audio/mpeg"))
+        return Response((chunk for chunk in (answer[:3].encode(), answer[3:].encode())),
+                        mimetype="audio/mpeg")
+
+    return app
+
+
+def _post(app, body, key="key-1"):
+    headers = {IDEMPOTENCY_HEADER: key} if key else {}
+    return app.test_client().post("/chat", json=body, headers=headers)
+
+
+def test_retry_replays_the_first_response(app):
+    first = _post(app, {"text": "hi"})
+    second = _post(app, {"text": "hi"})
+
+    assert len(app.calls) == 1
+    assert second.get_json() == first.get_json() == {"reply": 1}
+    assert second.headers[REPLAY_HEADER] == "true"
+    assert REPLAY_HEADER not in first.headers
+
+
+def test_concurrent_duplicate_waits_for_the_original(app):
+    app.release.clear()
+    responses = {}
+
+    def send(name):
+        responses[name] = _post(app, {"text": "hi"})
+
+    original = threading.Thread(target=send, args=("original",))
+    original.start()
+    assert app.entered.wait(5)
+    duplicate = threading.Thread(target=send, args=("duplicate",))
+    duplicate.start()
+
+    # The duplicate blocks on the in-flight entry instead of running the view.
+    duplicate.join(0.2)
+    assert duplicate.is_alive()
+    assert len(app.calls) == 1
+
+    app.release.set()
+    original.join(5)
+    duplicate.join(5)
+    assert len(app.calls) == 1
+    assert responses["duplicate"].get_json() == responses["original"].get_json() == {"reply": 1}
+    assert responses["duplicate"].headers[REPLAY_HEADER] == "true"
+
+
+def test_concurrent_duplicate_of_a_failed_request_is_told_to_retry(app):
+    app.release.clear()
+    responses = {}
+
+    def send(name, body):
+        responses[name] = _post(app, body)
+
+    original = threading.Thread(target=send, args=("original", {"status": 503}))
+    original.start()
+    assert app.entered.wait(5)
+    duplicate = threading.Thread(target=send, args=("duplicate", {"status": 503}))
+    duplicate.start()
+    duplicate.join(0.2)
+
+    app.release.set()
+    original.join(5)
+    duplicate.join(5)
+    assert responses["original"].status_code == 503
+    assert responses["duplicate"].status_code == 409
+    assert len(app.calls) == 1
+
+
+def test_reused_key_with_different_payload_conflicts(app):
+    _post(app, {"text": "hi"})
+    response = _post(app, {"text": "something else"})
+    assert response.status_code == 422
+    assert len(app.calls) == 1
+
+
+def test_requests_without_a_key_always_run(app):
+    _post(app, {"text": "hi"}, key=None)
+    _post(app, {"text": "hi"}, key=None)
+    assert len(app.calls) == 2
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_failures_are_not_remembered(app, status):
+    assert _post(app, {"status": status}).status_code == status
+    assert _post(app, {"status": status}).status_code == status
+    assert len(app.calls) == 2
+
+
+def test_overlong_key_is_rejected(app):
+    assert _post(app, {"text": "hi"}, key="k" * 300).status_code == 400
+    assert app.calls == []
+
+
+def test_keys_are_scoped_per_user(app):
+    _post(app, {"eta_id": "u", "text": "hi"})
+    _post(app, {"eta_id": "other", "text": "hi"})
+    assert len(app.calls) == 2
+
+
+def test_degraded_responses_are_not_remembered(app):
+    assert _post(app, {"degraded": True}).status_code == 200
+    assert _post(app, {"degraded": True}).status_code == 200
+    assert len(app.calls) == 2
+
+
+def test_streamed_response_replays_through_its_replayer(app):
+    client = app.test_client()
+    headers = {IDEMPOTENCY_HEADER: "key-1"}
+    first = client.post("/stream", json={"replayable": True}, headers=headers)
+    second = client.post("/stream", json={"replayable": True}, headers=headers)
+
+    assert len(app.calls) == 1
+    assert first.data == second.data == b"answer 1"
+    assert second.headers[REPLAY_HEADER] == "true"
+
+
+def test_streamed_response_without_a_replayer_runs_again(app):
+    client = app.test_client()
+    headers = {IDEMPOTENCY_HEADER: "key-1"}
+    client.post("/stream", json={}, headers=headers)
+    assert client.post("/stream", json={}, headers=headers).data == b"answer 2"
+
+
+def test_store_drops_oldest_bodies_past_byte_cap():
+    store = IdempotencyStore(ttl_seconds=60, max_bytes=10)
+    for key in ("a", "b", "c"):
+        entry, owner = store.begin("scope", key, "fp")
+        assert owner
+        assert store.complete("scope", key, entry, (b"12345", 200, {}))
+    assert store.stats() == {"entries": 2, "bytes": 10}
+    assert store.begin("scope", "a", "fp")[1]
+
+    entry, _ = store.begin("scope", "huge", "fp")
+    assert not store.complete("scope", "huge", entry, (b"x" * 11, 200, {}))
+    assert store.begin("scope", "huge", "fp")[1]
@@ -0,0 +1,90 @@
+from conftest import PRIMARY_KEY, FakeTable
+from memory import MEMORY_ATTRIBUTE, ConversationMemory, unsummarized
+
+
+def _messages(count):
+    return [{"role": "user" if n % 2 == 0 else "assistant", "content": f"m{n}",
+             "timestamp": f"2024-01-01T00:00:{n:02d}"} for n in range(count)]
+
+
+class RecordingTable:
+    def __init__(self):
+        self.updates = []
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+
+
+def _memory(table, replies):
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return replies.pop(0)
+
+    memory = ConversationMemory(lambda: table, generate, "id", recent_messages=4,
+                                summary_batch=4, summary_chars=50)
+    return memory, prompts
+
+
+def test_history_without_a_summary_is_the_plain_window():
+    memory, _ = _memory(RecordingTable(), [])
+    text = memory.history_text(_messages(10), None, window=2)
+    assert text == "User: m8\nAssistant: m9"
+
+
+def test_history_with_a_summary_adds_only_newer_turns():
+    memory, _ = _memory(RecordingTable(), [])
+    messages = _messages(10)
+    stored = {"summary": "Covered limits.", "through": messages[5]["timestamp"]}
+
+    assert unsummarized(messages, stored) == messages[6:]
+    text = memory.history_text(messages, stored, window=20)
+    assert text.startswith("Summary of earlier conversation:\nCovered limits.")
+    assert "User: m6" in text and "m5" not in text
+
+
+def test_schedule_folds_older_turns_in_the_background():
+    table = RecordingTable()
+    memory, prompts = _memory(table, ["  A long summary " + "x" * 100])
+    messages = _messages(10)
+
+    memory.schedule("user", "2024", "chat", messages, None)
+    memory._executor.shutdown(wait=True)
+
+    # The newest `recent_messages` stay verbatim; the six before are folded.
+    assert "User: m0" in prompts[0] and "Assistant: m5" in prompts[0]
+    assert "m6" not in prompts[0]
+    entry = table.updates[-1]["ExpressionAttributeValues"][":entry"]
+    assert entry["through"] == messages[5]["timestamp"]
+    assert entry["summary"].startswith("A long summary") and len(entry["summary"]) == 50
+    assert table.updates[0]["ExpressionAttributeNames"] == {"#memory": MEMORY_ATTRIBUTE}
+
+
+def test_schedule_waits_for_a_full_batch():
+    table = RecordingTable()
+    memory, prompts = _memory(table, [])
+    memory.schedule("user", "2024", "chat", _messages(7), None)
+    memory._executor.shutdown(wait=True)
+    assert prompts == [] and table.updates == []
+
+
+def test_prune_drops_deleted_threads_and_all_but_the_most_recent():
+    memories = {chat_id: {"summary": "s", "through": through} for chat_id, through in
+                [("old", "t1"), ("mid", "t2"), ("new", "t3"), ("gone", "t4")]}
+    table = FakeTable([{PRIMARY_KEY: "user", "UploadDate": "2024",
+                        MEMORY_ATTRIBUTE: dict(memories)}])
+    memory = ConversationMemory(lambda: table, lambda prompt: "", PRIMARY_KEY, max_threads=2)
+
+    assert memory.prune("user", "2024", memories, {"old", "mid", "new"}) == ["old", "gone"]
+    memory._executor.shutdown(wait=True)
+    assert sorted(table.items[("user", "2024")][MEMORY_ATTRIBUTE]) == ["mid", "new"]
+
+
+def test_prune_writes_nothing_within_the_cap():
+    table = RecordingTable()
+    memory = ConversationMemory(lambda: table, lambda prompt: "", "id", max_threads=2)
+    assert memory.prune("user", "2024", {"a": {"through": "t"}}, {"a"}) == []
+    assert memory.prune("user", "2024", None, {"a"}) == []
+    memory._executor.shutdown(wait=True)
+    assert table.updates == []
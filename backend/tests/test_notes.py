@@ -0,0 +1,77 @@
+from memory import DEFAULT_MAX_THREADS as MEMORY_THREADS
+from memory import DEFAULT_SUMMARY_CHARS
+from notes import (DEFAULT_MAX_THREADS, MAX_SECTIONS_BYTES, extract_sections, merge_sections,
+                   prune_sections, render_notes, sections_size)
+
+
+def test_headings_start_sections_and_bullets_become_points():
+    text = ("## Limits\n- A limit describes approach.\n- It may not equal f(a).\n\n"
+            "**Continuity**\nA function is continuous if the limit equals the value. "
+            "Polynomials are continuous.")
+    sections = extract_sections(text, "t1")
+
+    assert [section["title"] for section in sections] == ["Limits", "Continuity"]
+    assert sections[0]["points"] == ["A limit describes approach.", "It may not equal f(a)."]
+    assert sections[1]["points"] == [
+        "A function is continuous if the limit equals the value.",
+        "Polynomials are continuous.",
+    ]
+    assert all(section["source"] == "t1" for section in sections)
+
+
+def test_message_without_headings_is_titled_by_its_first_sentence():
+    sections = extract_sections("Derivatives measure change. The slope is 2x.", "t1")
+    assert sections == [{"title": "Derivatives measure change.",
+                         "points": ["The slope is 2x."], "source": "t1"}]
+
+
+def test_repeated_titles_merge_without_duplicate_points():
+    first = extract_sections("## Limits\n- One.\n- Two.", "t1")
+    second = extract_sections("## limits\n- Two.\n- Three.", "t2")
+    merged = merge_sections(first, second)
+
+    assert merged == [{"title": "Limits", "points": ["One.", "Two.", "Three."], "source": "t2"}]
+    assert first[0]["points"] == ["One.", "Two."]
+
+
+def test_oldest_sections_fold_into_earlier_topics():
+    sections = [{"title": f"Topic {n}", "points": [], "source": f"t{n}"} for n in range(5)]
+    merged = merge_sections([], sections, max_sections=3)
+
+    assert merged[0]["title"] == "Earlier topics"
+    assert merged[0]["points"] == ["Topic 0", "Topic 1", "Topic 2"]
+    assert [section["title"] for section in merged[1:]] == ["Topic 3", "Topic 4"]
+
+
+def test_render_shares_the_budget_between_sections():
+    sections = [{"title": f"Topic {n}", "points": ["x" * 100] * 6, "source": "t"}
+                for n in range(4)]
+    notes = render_notes(sections, max_chars=600)
+
+    assert len(notes) <= 600
+    assert all(f"## Topic {n}" in notes for n in range(4))
+    assert render_notes([]) == ""
+
+
+def test_worst_case_notes_and_memory_fit_the_item_budget():
+    # Every message a wall of maximal sections in 4-byte characters.
+    sections = []
+    for n in range(60):
+        text = "\n".join(f"## {chr(0x1F600 + n)}{'𝑥' * 100} {k}\n" + "\n".join(
+            f"- {'𝑥' * 300}" for _ in range(10)) for k in range(30))
+        sections = merge_sections(sections, extract_sections(text, f"t{n}"))
+        assert sections_size(sections) <= MAX_SECTIONS_BYTES
+
+    # Notes sections plus thread summaries stay within 128KB of the 400KB item.
+    budget = DEFAULT_MAX_THREADS * MAX_SECTIONS_BYTES + MEMORY_THREADS * DEFAULT_SUMMARY_CHARS
+    assert budget <= 128 * 1024
+
+
+def test_only_the_most_recent_threads_keep_sections():
+    threads = [{"ChatID": n, "UpdatedAt": f"2024-01-{n + 1:02d}", "Notes": "n",
+                "NotesSections": [], "NotesCursor": "c"} for n in range(12)]
+    prune_sections(threads, "0", max_threads=3)
+
+    assert [t["ChatID"] for t in threads if "NotesSections" in t] == [0, 10, 11]
+    assert all(t["Notes"] == "n" for t in threads)
+    assert "NotesCursor" not in threads[5]
@@ -0,0 +1,156 @@
+import datetime
+
+from conftest import PRIMARY_KEY, FakeTable
+from plan_scheduler import (
+    LEASE_KEY,
+    PLANS_ATTRIBUTE,
+    WeeklyPlanScheduler,
+    parse_hours,
+    plan_freshness,
+)
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+
+
+def _thread(chat_id, days_ago, messages=1):
+    touched = (NOW - datetime.timedelta(days=days_ago)).isoformat()
+    return {"ChatID": chat_id, "UpdatedAt": touched,
+            "Messages": [{"role": "user", "content": "hi", "timestamp": touched}] * messages}
+
+
+def _scheduler(table, generated, **kwargs):
+    def generate(item, thread):
+        generated.append((item[PRIMARY_KEY], thread["ChatID"]))
+        return f"plan for {thread['ChatID']}"
+
+    return WeeklyPlanScheduler(lambda: table, lambda raw: raw, generate,
+                               lambda item, thread: plan_freshness(thread, "v1"),
+                               PRIMARY_KEY, **kwargs)
+
+
+def test_parse_hours_and_window():
+    assert parse_hours("2-5") == (2, 5)
+    assert parse_hours("22-4") == (22, 4)
+    assert parse_hours("") == (2, 5)
+
+    at = lambda hour: datetime.datetime(2024, 1, 1, hour)  # noqa: E731
+    table = FakeTable()
+    daytime = _scheduler(table, [], hours=(2, 5))
+    assert daytime.in_window(at(2)) and daytime.in_window(at(4))
+    assert not daytime.in_window(at(5)) and not daytime.in_window(at(1))
+    overnight = _scheduler(table, [], hours=(22, 4))
+    assert overnight.in_window(at(23)) and overnight.in_window(at(3))
+    assert not overnight.in_window(at(12))
+
+
+def test_run_once_plans_recent_threads_without_a_fresh_plan():
+    fresh = _thread("c1", 1)
+    table = FakeTable([
+        {PRIMARY_KEY: "a", "UploadDate": "d",
+         "ChatHistory": [_thread("c1", 1), _thread("c2", 2), _thread("old", 30),
+                         _thread("empty", 1, messages=0)]},
+        {PRIMARY_KEY: "b", "UploadDate": "d", "ChatHistory": [fresh],
+         PLANS_ATTRIBUTE: {"c1": {"content": "kept", "freshness": plan_freshness(fresh, "v1")}}},
+    ])
+    generated = []
+    scheduler = _scheduler(table, generated, segments=2)
+
+    assert scheduler.run_once() == {"scanned": 3, "generated": 2, "fresh": 1, "errors": 0,
+                                   "pruned": 0}
+    assert sorted(generated) == [("a", "c1"), ("a", "c2")]
+    plans = table.items[("a", "d")][PLANS_ATTRIBUTE]
+    assert plans["c1"]["content"] == "plan for c1"
+    assert plans["c2"]["freshness"] == plan_freshness(_thread("c2", 2), "v1")
+    assert table.items[("b", "d")][PLANS_ATTRIBUTE]["c1"]["content"] == "kept"
+
+    # Everything is fresh now, so a second pass generates nothing.
+    assert scheduler.run_once()["generated"] == 0
+
+
+def test_failed_generation_is_counted_and_stores_nothing():
+    table = FakeTable([{PRIMARY_KEY: "a", "UploadDate": "d", "ChatHistory": [_thread("c1", 1)]}])
+
+    def failing(item, thread):
+        raise RuntimeError("quota")
+
+    scheduler = WeeklyPlanScheduler(lambda: table, lambda raw: raw, failing,
+                                    lambda item, thread: "marker", PRIMARY_KEY)
+    assert scheduler.run_once()["errors"] == 1
+    assert PLANS_ATTRIBUTE not in table.items[("a", "d")]
+
+
+def test_only_the_most_recent_threads_keep_a_plan():
+    threads = [_thread("c1", 3), _thread("c2", 2), _thread("c3", 1)]
+    plans = {thread["ChatID"]: {"content": "p", "freshness": plan_freshness(thread, "v1")}
+             for thread in threads}
+    plans["deleted"] = {"content": "p", "freshness": "x"}
+    table = FakeTable([{PRIMARY_KEY: "a", "UploadDate": "d", "ChatHistory": threads,
+                        PLANS_ATTRIBUTE: plans}])
+    generated = []
+    scheduler = _scheduler(table, generated, max_plans=2)
+
+    assert scheduler.run_once() == {"scanned": 2, "generated": 0, "fresh": 2, "errors": 0,
+                                    "pruned": 2}
+    assert sorted(table.items[("a", "d")][PLANS_ATTRIBUTE]) == ["c2", "c3"]
+    # The oldest thread is left out rather than planned and pruned each pass.
+    assert scheduler.run_once()["pruned"] == 0 and generated == []
+
+
+def test_overnight_window_belongs_to_the_day_it_started():
+    scheduler = _scheduler(FakeTable(), [], hours=(22, 4))
+    assert scheduler.window_day(datetime.datetime(2024, 1, 2, 23)) == "2024-01-02"
+    assert scheduler.window_day(datetime.datetime(2024, 1, 3, 3)) == "2024-01-02"
+
+
+def test_each_window_is_claimed_by_one_instance():
+    table, leases = FakeTable(), FakeTable(key_names=(LEASE_KEY,))
+    first, second = (_scheduler(table, [], lease_table_getter=lambda: leases)
+                     for _ in range(2))
+    assert first._claim("2024-01-02")
+    assert not second._claim("2024-01-02")
+    assert second._claim("2024-01-03")
+    # The lease never lands in the user table, so its scans stay clean.
+    assert table.items == {} and len(leases.items) == 1
+    assert _scheduler(table, [])._claim("2024-01-03")
+
+
+def test_missing_lease_table_runs_without_a_lease(caplog):
+    from botocore.exceptions import ClientError
+
+    class MissingTable:
+        def update_item(self, **_):
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "UpdateItem")
+
+    scheduler = _scheduler(FakeTable(), [], lease_table_getter=lambda: MissingTable())
+    assert scheduler._claim("2024-01-02") and scheduler._claim("2024-01-03")
+    assert caplog.text.count("lease table is missing") == 1
+
+
+def test_create_app_starts_the_scheduler_only_when_enabled(monkeypatch):
+    import app as app_module
+
+    started = []
+    monkeypatch.setattr(app_module.weekly_plan_scheduler, "start", lambda: started.append(1))
+    app_module.create_app({"USAGE_LEDGER": False})
+    assert started == []
+    app_module.create_app({"USAGE_LEDGER": False, "WEEKLY_PLAN_SCHEDULE": True})
+    assert started == [1]
+
+
+def test_a_served_plan_is_not_generated_or_appended_again(api):
+    item = {PRIMARY_KEY: "a", "UploadDate": "d", "SchemaVersion": 2, "Context": [],
+            "ChatHistory": [_thread("c1", 1)]}
+    item[PLANS_ATTRIBUTE] = {"c1": {
+        "content": "stored plan",
+        "freshness": api.module._weekly_plan_freshness(item, item["ChatHistory"][0])}}
+    api.table.put_item(Item=item)
+
+    served = [api.post("/generate-weekly-plan", json={"etaId": "a", "chatID": "c1"}).get_json()
+              for _ in range(2)]
+
+    assert [(body["weekly_plan"], body["precomputed"]) for body in served] == [
+        ("stored plan", True), ("stored plan", False)]
+    assert api.gemini.prompts == []
+    messages = api.table.items[("a", "d")]["ChatHistory"][0]["Messages"]
+    assert [message["content"] for message in messages] == ["hi", "stored plan"]
+    assert api.table.items[("a", "d")][PLANS_ATTRIBUTE] == {}
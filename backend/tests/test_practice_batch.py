@@ -0,0 +1,75 @@
+import json
+
+from conftest import PRIMARY_KEY
+
+
+def _user(eta_id, *chat_ids):
+    return {PRIMARY_KEY: eta_id, "UploadDate": "2024-01-01", "SchemaVersion": 2, "Context": [],
+            "ChatHistory": [{"ChatID": chat_id, "Title": chat_id, "CreatedAt": "t",
+                             "Messages": [{"role": "user", "content": f"{eta_id} asks about {chat_id}",
+                                           "timestamp": "t1"}]}
+                            for chat_id in chat_ids]}
+
+
+def _batch(api, items):
+    response = api.post("/generate-practice-problems/batch", json={"items": items},
+                        headers=api.admin_headers)
+    return response, [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_batch_streams_results_and_saves_each_user_once(api):
+    for user in (_user("a", "c1", "c2"), _user("b", "c1")):
+        api.table.put_item(Item=user)
+
+    response, lines = _batch(api, [
+        {"etaId": "a", "chatID": "c1"}, {"etaId": "a", "chatID": "c2"},
+        {"etaId": "b", "chatID": "c1"}, {"etaId": "missing", "chatID": "c1"},
+        {"etaId": "a", "chatID": "c1"}, {"chatID": "c1"},
+    ])
+
+    assert response.mimetype == "application/x-ndjson"
+    results = {line["index"]: line for line in lines if line["type"] == "result"}
+    assert [results[n]["status"] for n in range(6)] == [200, 200, 200, 404, 409, 400]
+    assert lines[-1] == {"type": "summary", "items": 6, "succeeded": 3, "failed": 3,
+                         "unsaved_users": 0}
+    persisted = [line for line in lines if line["type"] == "persisted"]
+    assert sorted((line["eta_id"], line["threads"]) for line in persisted) == [("a", 2), ("b", 1)]
+
+    # One history write per user, holding every generated reply.
+    writes = [update["Key"][PRIMARY_KEY] for update in api.table.updates]
+    assert sorted(writes) == ["a", "b"]
+    threads = api.table.items[("a", "2024-01-01")]["ChatHistory"]
+    assert all(thread["Messages"][-1]["content"].startswith("reply #") for thread in threads)
+    assert len(api.gemini.prompts) == 3
+
+
+def test_batch_rejects_an_empty_request(api):
+    response = api.post("/generate-practice-problems/batch", json={"items": []},
+                        headers=api.admin_headers)
+    assert response.status_code == 400
+
+
+def test_batch_needs_the_admin_token(api):
+    response = api.post("/generate-practice-problems/batch",
+                        json={"items": [{"etaId": "a", "chatID": "c1"}]})
+    assert response.status_code == 401
+    assert api.gemini.prompts == []
+
+
+def test_batch_keeps_messages_sent_while_it_was_generating(api):
+    api.table.put_item(Item=_user("a", "c1"))
+    generate = api.gemini.generate_content
+
+    def generate_while_user_chats(*args, **kwargs):
+        # The user sends a message after the batch has read their item.
+        api.table.items[("a", "2024-01-01")]["ChatHistory"][0]["Messages"].append(
+            {"role": "user", "content": "sent meanwhile", "timestamp": "t2"})
+        return generate(*args, **kwargs)
+
+    api.gemini.generate_content = generate_while_user_chats
+    _, lines = _batch(api, [{"etaId": "a", "chatID": "c1"}])
+
+    assert [line["status"] for line in lines if line["type"] == "persisted"] == [200]
+    messages = api.table.items[("a", "2024-01-01")]["ChatHistory"][0]["Messages"]
+    assert [message["content"] for message in messages] == [
+        "a asks about c1", "sent meanwhile", "reply #1"]
@@ -0,0 +1,93 @@
+from prompt_cache import LocalPrefixStore, PrefixCache, PrefixStore
+
+LONG = "persona and context " * 10
+
+
+class RecordingStore(PrefixStore):
+    def __init__(self, fail=False):
+        self.created = []
+        self.deleted = []
+        self.expired = []
+        self.fail = fail
+
+    def create(self, model, text, ttl_seconds, label):
+        if self.fail:
+            raise RuntimeError("caching not supported")
+        self.created.append(label)
+        return f"handle-{len(self.created)}"
+
+    def config(self, handle):
+        return {"cached_content": handle}
+
+    def delete(self, handle):
+        self.deleted.append(handle)
+
+    def expire(self, handle):
+        self.expired.append(handle)
+
+
+def test_short_prefixes_are_sent_inline():
+    store = RecordingStore()
+    cache = PrefixCache(store, min_chars=1000)
+    assert cache.config("model", "short", "user") == {"system_instruction": "short"}
+    assert store.created == [] and cache.stats()["inline"] == 1
+
+
+def test_handle_is_created_once_per_scope_and_reused():
+    store = RecordingStore()
+    cache = PrefixCache(store, min_chars=10)
+
+    assert cache.config("model", LONG, "user", "v1") == {"cached_content": "handle-1"}
+    assert cache.config("model", LONG, "user", "v1") == {"cached_content": "handle-1"}
+    assert cache.config("model", LONG, "user", "v2") == {"cached_content": "handle-2"}
+    assert store.created == ["eta:user", "eta:user"]
+    stats = cache.stats()
+    assert (stats["created"], stats["reused"]) == (2, 1)
+
+
+def test_invalidate_deletes_the_owners_handles():
+    store = RecordingStore()
+    cache = PrefixCache(store, min_chars=10)
+    cache.config("model", LONG, "user", "v1")
+    cache.config("model", LONG, "other", "v1")
+
+    cache.invalidate("user")
+    assert store.deleted == ["handle-1"]
+    assert cache.config("model", LONG, "user", "v1") == {"cached_content": "handle-3"}
+
+
+def test_failed_creation_falls_back_inline_and_is_not_retried_at_once():
+    store = RecordingStore(fail=True)
+    cache = PrefixCache(store, min_chars=10)
+    assert cache.config("model", LONG, "user") == {"system_instruction": LONG}
+    store.fail = False
+    assert cache.config("model", LONG, "user") == {"system_instruction": LONG}
+    assert store.created == [] and cache.stats()["failed"] == 1
+
+
+def test_local_store_sends_the_prefix_as_system_instruction():
+    cache = PrefixCache(LocalPrefixStore(), min_chars=10)
+    assert cache.config("model", LONG, "user") == {"system_instruction": LONG}
+    assert cache.stats()["created"] == 1
+
+
+def test_evicted_handles_are_forgotten_with_their_owner():
+    store = RecordingStore()
+    cache = PrefixCache(store, min_chars=10, max_entries=1)
+    cache.config("model", LONG, "user")
+    assert cache.stats()["owners"] == 1
+
+    cache.config("model", LONG, "other")
+    assert store.expired == ["handle-1"]
+    assert cache.stats()["owners"] == 1
+    cache.invalidate("user")
+    assert store.deleted == []
+
+
+def test_local_store_gives_each_creation_its_own_handle():
+    store = LocalPrefixStore()
+    first = store.create("model", LONG, 60, "eta:a")
+    second = store.create("model", LONG, 60, "eta:b")
+    assert first != second
+    store.expire(first)
+    assert store.config(second) == {"system_instruction": LONG}
@@ -0,0 +1,91 @@
+import threading
+
+from search_index import SearchIndex
+
+
+def _thread(chat_id, title, *contents):
+    return {"ChatID": chat_id, "Title": title, "CreatedAt": "2024-01-01T00:00:00",
+            "Messages": [{"role": "user" if n % 2 == 0 else "assistant", "content": content,
+                          "timestamp": f"2024-01-01T00:00:{n:02d}"}
+                         for n, content in enumerate(contents)]}
+
+
+def test_messages_titles_and_context_are_searchable(tmp_path):
+    index = SearchIndex(tmp_path)
+    index.index_thread("user", _thread("c1", "Calculus review",
+                                       "What is a derivative?", "It measures change."))
+    index.index_context("user", [{"type": "upload", "filename": "notes.pdf",
+                                  "summary": "Integration by parts", "uploaded_at": "t"}])
+
+    results, total = index.search("user", "deriv")
+    assert total == 1
+    assert results[0]["kind"] == "message" and results[0]["chat_id"] == "c1"
+    assert results[0]["title"] == "Calculus review"
+    assert "[derivative]" in results[0]["snippet"]
+
+    assert {r["kind"] for r in index.search("user", "calculus")[0]} == {"thread"}
+    assert index.search("user", "integration")[0][0]["title"] == "notes.pdf"
+
+
+def test_reindexing_only_adds_new_messages(tmp_path):
+    index = SearchIndex(tmp_path)
+    thread = _thread("c1", "Old title", "limits")
+    index.index_thread("user", thread)
+    index.index_context("user", [{"summary": "limits again", "uploaded_at": "t"}])
+    index.index_context("user", [{"summary": "limits again", "uploaded_at": "t"}])
+
+    thread["Title"] = "New title"
+    thread["Messages"] += _thread("c1", "", "x", "more limits")["Messages"][1:]
+    index.index_thread("user", thread)
+    index.index_thread("user", thread)
+
+    assert index.search("user", "limits")[1] == 3
+    assert index.search("user", "old")[1] == 0
+    assert index.search("user", "new title")[1] == 1
+
+
+def test_concurrent_indexing_of_a_thread_adds_each_message_once(tmp_path):
+    index = SearchIndex(tmp_path)
+    index.index_thread("user", _thread("c1", "Title", "warm up"))
+    thread = _thread("c1", "Title", "warm up", *[f"limits {n}" for n in range(20)])
+    start = threading.Barrier(8)
+
+    def worker():
+        start.wait(5)
+        index.index_thread("user", thread)
+
+    workers = [threading.Thread(target=worker) for _ in range(8)]
+    for each in workers:
+        each.start()
+    for each in workers:
+        each.join(10)
+
+    assert index.search("user", "limits")[1] == 20
+
+
+def test_users_are_isolated_and_queries_are_escaped(tmp_path):
+    index = SearchIndex(tmp_path)
+    index.index_thread("alice", _thread("c1", "", "secret topic"))
+
+    assert index.search("bob", "secret") == ([], 0)
+    assert index.search("alice", 'secret" OR content:*') == ([], 0)
+    assert index.search("alice", "   ") == ([], 0)
+    assert index.search("../alice", "secret") == ([], 0)
+
+
+def test_index_directory_is_created_on_first_write(tmp_path):
+    index = SearchIndex(tmp_path / "fresh" / "search_data")
+    index.index_thread("user", _thread("c1", "", "first message"))
+    assert index.search("user", "first")[1] == 1
+
+
+def test_sync_is_due_until_the_user_was_caught_up(tmp_path):
+    index = SearchIndex(tmp_path)
+    assert index.sync_due("user", 300)
+
+    thread = _thread("c1", "Title", "first message")
+    index.sync_user("user", [thread], [])
+    index.sync_user("user", [thread], [])
+    assert not index.sync_due("user", 300)
+    assert index.sync_due("user", 0)
+    assert index.search("user", "first")[1] == 1
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, request_key
+
+
+def _run_concurrently(flight, key, fn, count):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _wait_for_calls(flight, count):
+    deadline = time.monotonic() + 5
+    while flight.stats()["calls"] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def slow():
+        executions.append(1)
+        release.wait(5)
+        return "reply"
+
+    threads, results, errors = _run_concurrently(flight, "k", slow, 5)
+    _wait_for_calls(flight, 5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert executions == [1]
+    assert results == ["reply"] * 5 and errors == []
+    assert flight.stats() == {"calls": 5, "executed": 1, "coalesced": 4, "errors": 0,
+                              "in_flight": 0}
+
+
+def test_execute_reports_which_caller_ran_the_function():
+    flight = SingleFlight()
+    release = threading.Event()
+    outcomes = []
+
+    def slow():
+        release.wait(5)
+        return "reply"
+
+    threads = [threading.Thread(target=lambda: outcomes.append(flight.execute("k", slow)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    _wait_for_calls(flight, 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(outcomes) == [("reply", False), ("reply", False), ("reply", True)]
+
+
+def test_waiters_receive_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("quota")
+
+    threads, results, errors = _run_concurrently(flight, "k", failing, 3)
+    _wait_for_calls(flight, 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [] and len(errors) == 3
+    assert all(str(error) == "quota" for error in errors)
+
+
+def test_results_are_not_cached_once_the_call_returns():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: int("x"))
+    assert flight.do("k", lambda: 3) == 3
+
+
+def test_request_key_depends_on_model_and_contents():
+    assert request_key("m", [{"text": "a"}]) == request_key("m", [{"text": "a"}])
+    assert request_key("m", [{"text": "a"}]) != request_key("m", [{"text": "b"}])
+    assert request_key("m", "a") != request_key("other", "a")
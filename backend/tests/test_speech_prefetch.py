@@ -0,0 +1,93 @@
+import threading
+
+from speech_prefetch import SpeechPrefetcher
+
+
+class Renderer:
+    def __init__(self):
+        self.texts = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, text, voice_id):
+        self.release.wait(5)
+        self.texts.append(text)
+        return text.encode(), "Talking"
+
+
+def test_prepared_render_is_served_once():
+    renderer = Renderer()
+    prefetcher = SpeechPrefetcher(renderer)
+    assert prefetcher.submit("user", "chat", "m1", "Hello there.", "voice")
+
+    assert prefetcher.take("user", "chat", "m1", "voice", wait=5) == (b"Hello there.", "Talking")
+    assert prefetcher.take("user", "chat", "m1", "voice") is None
+    assert prefetcher.take("user", "chat", "m1", "other-voice") is None
+    stats = prefetcher.stats()
+    assert stats["served"] == 1 and stats["missed"] == 2
+
+
+def test_newer_message_supersedes_the_older_one():
+    renderer = Renderer()
+    renderer.release.clear()
+    prefetcher = SpeechPrefetcher(renderer, workers=1)
+    prefetcher.submit("user", "chat", "m1", "first", "voice")
+    prefetcher.submit("user", "chat", "m2", "second", "voice")
+    renderer.release.set()
+
+    assert prefetcher.take("user", "chat", "m2", "voice", wait=5) == (b"second", "Talking")
+    assert prefetcher.take("user", "chat", "m1", "voice") is None
+    assert prefetcher.stats()["superseded"] == 1
+
+
+def test_submissions_past_max_pending_are_dropped():
+    renderer = Renderer()
+    renderer.release.clear()
+    prefetcher = SpeechPrefetcher(renderer, workers=1, max_pending=2)
+
+    assert prefetcher.submit("a", "chat", "m1", "one", "voice")
+    assert prefetcher.submit("b", "chat", "m1", "two", "voice")
+    assert not prefetcher.submit("c", "chat", "m1", "three", "voice")
+    renderer.release.set()
+    prefetcher._executor.shutdown(wait=True)
+
+    assert sorted(renderer.texts) == ["one", "two"]
+    assert prefetcher.stats()["dropped"] == 1
+
+
+def test_failed_render_falls_back_to_live():
+    def failing(text, voice_id):
+        raise RuntimeError("provider down")
+
+    prefetcher = SpeechPrefetcher(failing)
+    prefetcher.submit("user", "chat", "m1", "text", "voice")
+    assert prefetcher.take("user", "chat", "m1", "voice", wait=5) is None
+    assert prefetcher.stats()["errors"] == 1
+
+
+def test_superseded_running_render_still_counts_against_max_pending():
+    renderer = Renderer()
+    renderer.release.clear()
+    prefetcher = SpeechPrefetcher(renderer, workers=1, max_pending=2)
+    prefetcher.submit("user", "chat", "m1", "first", "voice")
+    while not prefetcher.stats()["running"]:
+        renderer.release.wait(0.01)
+
+    # m1 is rendering, so superseding it cannot free its slot.
+    assert prefetcher.submit("user", "chat", "m2", "second", "voice")
+    assert not prefetcher.submit("other", "chat", "m1", "third", "voice")
+    assert prefetcher.stats()["running"] == 1 and prefetcher.stats()["pending"] == 1
+    renderer.release.set()
+    assert prefetcher.take("user", "chat", "m2", "voice", wait=5) == (b"second", "Talking")
+
+
+def test_threads_are_forgotten_once_their_message_is_taken():
+    prefetcher = SpeechPrefetcher(Renderer(), max_entries=4, max_pending=2)
+    for n in range(50):
+        prefetcher.submit("user", f"chat{n}", "m1", "hi", "voice")
+        assert prefetcher.take("user", f"chat{n}", "m1", "voice", wait=5)
+    assert prefetcher._latest.stats()["size"] == 0
+
+    for n in range(50):
+        prefetcher.submit("user", f"chat{n}", "m1", "hi", "voice")
+    assert prefetcher._latest.stats()["size"] <= 6
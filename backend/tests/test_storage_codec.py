@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+import pytest
+
+import storage_codec
+from storage_codec import (CHAT_HISTORY_BLOB, CODEC_ATTRIBUTE, CONTEXT_BLOB, decode_item,
+                           decode_value, encode_item, encode_value)
+
+
+class Binary:
+    """Stands in for boto3's Binary wrapper."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def test_value_round_trip():
+    value = [{"role": "user", "content": "héllo ✓", "n": Decimal(3), "f": Decimal("0.5")}]
+    blob = encode_value(value)
+    assert blob[0] == storage_codec.FORMAT_ZLIB_JSON
+    assert decode_value(blob) == [{"role": "user", "content": "héllo ✓", "n": 3, "f": 0.5}]
+    assert decode_value(Binary(blob)) == decode_value(blob)
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(ValueError):
+        decode_value(b"\x09payload")
+
+
+def test_decode_item_expands_blobs():
+    history = [{"ChatID": 1, "Messages": [{"role": "user", "content": "hi"}]}]
+    item = {"ElectronincTeachingAssistantMaterialID": "user",
+            CHAT_HISTORY_BLOB: Binary(encode_value(history)),
+            CONTEXT_BLOB: encode_value(["old"]),
+            "Context": ["new"],
+            CODEC_ATTRIBUTE: storage_codec.FORMAT_ZLIB_JSON}
+
+    assert decode_item(item) == {"ElectronincTeachingAssistantMaterialID": "user",
+                                 "ChatHistory": history, "Context": ["old", "new"]}
+
+
+def test_legacy_items_pass_through():
+    item = {"ChatHistory": [1], "Context": [2]}
+    assert decode_item(dict(item)) == item
+    assert decode_item(None) is None
+
+
+def test_codec_is_opt_in(monkeypatch):
+    monkeypatch.delenv("STORAGE_CODEC", raising=False)
+    assert not storage_codec.codec_enabled()
+    monkeypatch.setenv("STORAGE_CODEC", " ZLIB ")
+    assert storage_codec.codec_enabled()
+
+
+def test_encode_item_round_trip(monkeypatch):
+    monkeypatch.setenv("STORAGE_CODEC", "zlib")
+    item = {"ElectronincTeachingAssistantMaterialID": "user",
+            "ChatHistory": [{"ChatID": 1, "Messages": []}], "Context": ["a", "b"]}
+
+    encoded = encode_item(item)
+    assert "ChatHistory" not in encoded and "Context" not in encoded
+    assert encoded[CODEC_ATTRIBUTE] == storage_codec.FORMAT_ZLIB_JSON
+    assert decode_item(encoded) == item
+
+    monkeypatch.delenv("STORAGE_CODEC")
+    assert encode_item(item) == item
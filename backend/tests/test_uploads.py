@@ -0,0 +1,48 @@
+import io
+
+import pytest
+from flask import Flask, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from uploads import BoundedSpooledFile, SpooledUploadRequest, iter_chunks
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("UPLOAD_MAX_BYTES", "4096")
+    monkeypatch.setenv("UPLOAD_MEMORY_BYTES", "1024")
+    app = Flask(__name__)
+    app.request_class = SpooledUploadRequest
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        stream = request.files["file"].stream
+        return jsonify({"size": sum(len(chunk) for chunk in iter_chunks(stream, 100)),
+                        "on_disk": stream._rolled})
+
+    return app.test_client()
+
+
+def _upload(client, size):
+    return client.post("/upload", data={"file": (io.BytesIO(b"x" * size), "notes.pdf")},
+                       content_type="multipart/form-data")
+
+
+def test_small_upload_stays_in_memory(client):
+    assert _upload(client, 512).get_json() == {"size": 512, "on_disk": False}
+
+
+def test_larger_upload_spools_to_disk(client):
+    assert _upload(client, 3000).get_json() == {"size": 3000, "on_disk": True}
+
+
+def test_oversized_upload_is_rejected(client):
+    assert _upload(client, 5000).status_code == 413
+
+
+def test_limit_is_checked_on_every_write():
+    spooled = BoundedSpooledFile(max_bytes=10, memory_bytes=4)
+    spooled.write(b"12345")
+    with pytest.raises(RequestEntityTooLarge):
+        spooled.write(b"123456")
+    assert b"".join(iter_chunks(spooled, 2)) == b"12345"
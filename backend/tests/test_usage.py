@@ -0,0 +1,111 @@
+import time
+
+import pytest
+from flask import Flask, jsonify
+
+import usage
+from usage import QuotaPolicy, UsageLedger, metered
+
+
+def test_per_route_limit_rejects_with_retry_after():
+    policy = QuotaPolicy({"voice": {"per_minute": 2}})
+    assert policy.acquire("u", "voice") == 0
+    assert policy.acquire("u", "voice") == 0
+    wait = policy.acquire("u", "voice")
+    assert 0 < wait <= 60
+    # Other users and routes have their own budgets.
+    assert policy.acquire("other", "voice") == 0
+    assert policy.acquire("u", "chat") == 0
+
+
+def test_wildcard_limit_covers_every_route():
+    policy = QuotaPolicy({"*": {"per_hour": 2}})
+    assert policy.acquire("u", "chat") == 0
+    assert policy.acquire("u", "voice") == 0
+    assert policy.acquire("u", "practice") > 0
+
+
+def test_rejected_requests_are_not_counted():
+    policy = QuotaPolicy({"chat": {"per_minute": 1, "per_day": 2}})
+    assert policy.acquire("u", "chat") == 0
+    for _ in range(5):
+        assert policy.acquire("u", "chat") > 0
+    assert policy._counts[("u", "chat", "per_day", int(time.time() // 86400))] == 1
+
+
+def test_no_limits_and_unknown_windows_allow_everything():
+    assert QuotaPolicy({}).acquire("u", "chat") == 0
+    policy = QuotaPolicy({"chat": {"per_fortnight": 1}})
+    assert all(policy.acquire("u", "chat") == 0 for _ in range(3))
+
+
+def test_queue_mode_gives_up_when_the_wait_is_too_long():
+    policy = QuotaPolicy({"chat": {"per_day": 1}}, mode="queue", max_wait=0.05)
+    assert policy.acquire("u", "chat") == 0
+    start = time.monotonic()
+    assert policy.acquire("u", "chat") > 0
+    assert time.monotonic() - start < 1
+
+
+def test_ledger_sums_counters_per_user_and_route(tmp_path):
+    ledger = UsageLedger(tmp_path / "usage.sqlite", flush_seconds=3600)
+    ledger.add("u", "chat", requests=1, prompt_chars=100)
+    ledger.add("u", "chat", requests=1, prompt_chars=50, output_chars=0)
+    ledger.flush()
+    ledger.add("u", "voice", requests=1, audio_bytes=2048)
+    ledger.add("other", "chat", requests=1)
+
+    rows = {(row["eta_id"], row["route"]): row for row in ledger.report()}
+    assert rows[("u", "chat")]["requests"] == 2
+    assert rows[("u", "chat")]["prompt_chars"] == 150
+    assert rows[("u", "voice")]["audio_bytes"] == 2048
+    assert [row["eta_id"] for row in ledger.report(route="chat", eta_id="other")] == ["other"]
+
+
+@pytest.fixture
+def metered_client(tmp_path, monkeypatch):
+    usage.configure_ledger(tmp_path / "usage.sqlite")
+    monkeypatch.setattr(usage, "usage_quotas", QuotaPolicy({"chat": {"per_minute": 1}}))
+    app = Flask(__name__)
+
+    @app.route("/chat", methods=["POST"])
+    @metered("chat")
+    def chat():
+        usage.note_usage(prompt_chars=10)
+        return jsonify({"reply": "ok"})
+
+    client = app.test_client()
+    client.ledger = usage.usage_ledger()
+    yield client
+    usage.configure_ledger(None)
+
+
+def test_metered_route_records_usage_and_enforces_quota(metered_client):
+    first = metered_client.post("/chat", json={"eta_id": "u"})
+    second = metered_client.post("/chat", json={"eta_id": "u"})
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) >= 1
+    row = metered_client.ledger.report(eta_id="u")[0]
+    assert (row["requests"], row["rejected"], row["prompt_chars"]) == (1, 1, 10)
+
+
+def test_json_body_without_content_type_is_still_metered(metered_client):
+    body = b'{"eta_id": "u"}'
+    assert metered_client.post("/chat", data=body, content_type="text/plain").status_code == 200
+    assert metered_client.post("/chat", data=body).status_code == 429
+    assert metered_client.ledger.report(eta_id="u")[0]["rejected"] == 1
+
+
+def test_ledger_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "lazy" / "usage.sqlite"
+    usage.configure_ledger(path)
+    try:
+        assert not path.exists()
+        usage.record_usage("u", "chat", requests=1)
+        assert path.exists()
+        assert usage.usage_ledger().report()[0]["requests"] == 1
+    finally:
+        usage.configure_ledger(None)
+    assert usage.usage_ledger() is None
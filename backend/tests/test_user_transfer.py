@@ -0,0 +1,108 @@
+import importlib.util
+import io
+from decimal import Decimal
+from pathlib import Path
+
+from segment_scan import ScanCheckpoint, scan_segment
+
+_SPEC = importlib.util.spec_from_file_location(
+    "user_transfer", Path(__file__).resolve().parent.parent / "scripts" / "user_transfer.py")
+user_transfer = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(user_transfer)
+
+PRIMARY_KEY = user_transfer.PRIMARY_KEY
+
+
+class PagedTable:
+    """Scans in pages and segments like DynamoDB; records batched puts."""
+
+    def __init__(self, items):
+        self.items = items
+        self.written = []
+        self.scans = 0
+
+    def scan(self, Segment, TotalSegments, Limit, ExclusiveStartKey=None, **_):
+        self.scans += 1
+        mine = [item for n, item in enumerate(self.items) if n % TotalSegments == Segment]
+        start = ExclusiveStartKey["offset"] if ExclusiveStartKey else 0
+        page = mine[start:start + Limit]
+        response = {"Items": [dict(item) for item in page]}
+        if start + Limit < len(mine):
+            response["LastEvaluatedKey"] = {"offset": start + Limit}
+        return response
+
+    def batch_writer(self):
+        table = self
+
+        class Writer:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def put_item(self, Item):
+                table.written.append(Item)
+
+        return Writer()
+
+
+def _user(n):
+    return {
+        PRIMARY_KEY: f"user-{n}", "UploadDate": "2024-01-01", "SchemaVersion": Decimal(2),
+        "Score": Decimal("1.5"),
+        "ChatHistory": [{"ChatID": "c1", "Title": "T", "CreatedAt": "t",
+                         "Messages": [{"role": "user", "content": f"hi {n}", "timestamp": "t1"}]}],
+        "Context": [{"type": "upload", "summary": "notes"}],
+    }
+
+
+def test_export_then_import_round_trips_items(monkeypatch):
+    monkeypatch.delenv("STORAGE_CODEC", raising=False)
+    source = PagedTable([_user(n) for n in range(7)])
+    output = io.StringIO()
+    assert user_transfer.export_users(source, output, segments=3, page_size=2) == 7
+
+    lines = output.getvalue().splitlines()
+    assert sum('"type": "user"' in line for line in lines) == 7
+
+    target = PagedTable([])
+    stream = io.BytesIO(output.getvalue().encode())
+    checkpoint = user_transfer.ImportCheckpoint(None, "users.ndjson")
+    assert user_transfer.import_users(target, stream, checkpoint, workers=2, batch_items=3) == 7
+
+    imported = {item[PRIMARY_KEY]: item for item in target.written}
+    assert imported["user-4"] == {**_user(4), "Score": Decimal("1.5")}
+    assert checkpoint.offset == len(stream.getvalue())
+
+
+def test_import_resumes_from_its_checkpoint(tmp_path):
+    source = PagedTable([_user(n) for n in range(4)])
+    output = io.StringIO()
+    user_transfer.export_users(source, output, segments=1, page_size=10)
+    data = output.getvalue().encode()
+    path = tmp_path / "import.json"
+
+    first = user_transfer.ImportCheckpoint(path, "users.ndjson")
+    user_transfer.import_users(PagedTable([]), io.BytesIO(data), first, workers=1, batch_items=2)
+
+    # A second run with the same checkpoint has nothing left to write.
+    target = PagedTable([])
+    resumed = user_transfer.ImportCheckpoint(path, "users.ndjson")
+    assert resumed.imported == 4
+    user_transfer.import_users(target, io.BytesIO(data), resumed, workers=1, batch_items=2)
+    assert target.written == []
+
+
+def test_scan_checkpoint_skips_finished_segments(tmp_path):
+    table = PagedTable([_user(n) for n in range(5)])
+    path = tmp_path / "scan.json"
+    seen = []
+    checkpoint = ScanCheckpoint(path, 2)
+    scan_segment(table, 0, 2, checkpoint, lambda items, _: seen.extend(items), page_size=2)
+
+    resumed = ScanCheckpoint(path, 2)
+    scans = table.scans
+    scan_segment(table, 0, 2, resumed, lambda items, _: seen.extend(items), page_size=2)
+    assert table.scans == scans
+    assert len(seen) == 3
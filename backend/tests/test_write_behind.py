@@ -0,0 +1,197 @@
+import fcntl
+import json
+import threading
+from decimal import Decimal
+
+import pytest
+
+from write_behind import WriteBehindBuffer
+
+
+class Recorder:
+    def __init__(self):
+        self.writes = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, eta_id, upload_date, history):
+        self.release.wait(5)
+        self.writes.append((eta_id, upload_date, history))
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_flushes_latest_value_and_truncates_log(tmp_path):
+    recorder = Recorder()
+    wal = tmp_path / "chat.wal"
+    buffer = WriteBehindBuffer(recorder, wal, flush_delay=0.01)
+
+    buffer.enqueue("user", "2024", [{"ChatID": 1, "Count": Decimal(2)}])
+    assert buffer.pending("user", "2024") == [{"ChatID": 1, "Count": Decimal(2)}]
+    assert buffer.flush()
+
+    assert recorder.writes[-1] == ("user", "2024", [{"ChatID": 1, "Count": Decimal(2)}])
+    assert buffer.pending("user", "2024") is None
+    assert buffer.wal_path.read_text() == ""
+
+
+def test_writes_to_one_key_coalesce(tmp_path):
+    recorder = Recorder()
+    recorder.release.clear()
+    buffer = WriteBehindBuffer(recorder, tmp_path / "chat.wal", flush_delay=0.01)
+    buffer.enqueue("user", "2024", [1])
+    history = [1, 2]
+    buffer.enqueue("user", "2024", history)
+    buffer.enqueue("user", "2024", [1, 2, 3])
+    # The pending copy is a snapshot, not the caller's list.
+    history.append("mutated")
+
+    assert buffer.pending("user", "2024") == [1, 2, 3]
+    recorder.release.set()
+    assert buffer.flush()
+    assert recorder.writes[-1] == ("user", "2024", [1, 2, 3])
+    assert len(recorder.writes) <= 2
+    assert buffer.stats()["coalesced"] == 2
+
+
+def test_replays_unflushed_writes_after_crash(tmp_path):
+    wal = tmp_path / "chat.wal"
+    lines = [
+        {"op": "put", "seq": 1, "eta_id": "a", "upload_date": "d", "chat_history": [1]},
+        {"op": "put", "seq": 2, "eta_id": "b", "upload_date": "d", "chat_history": [2]},
+        {"op": "done", "seq": 2},
+        {"op": "put", "seq": 3, "eta_id": "a", "upload_date": "d", "chat_history": [3]},
+    ]
+    wal.write_text("".join(json.dumps(line) + "\n" for line in lines) + '{"op": "pu')
+
+    recorder = Recorder()
+    recorder.release.clear()
+    buffer = WriteBehindBuffer(recorder, wal, flush_delay=0.01)
+
+    # Only the newest put for "a" survives; "b" was already stored.
+    assert buffer.pending("a", "d") == [3]
+    assert buffer.pending("b", "d") is None
+    assert [record["eta_id"] for record in _records(wal)] == ["a"]
+
+    recorder.release.set()
+    assert buffer.flush()
+    assert recorder.writes == [("a", "d", [3])]
+
+    buffer.enqueue("c", "d", [4])
+    assert buffer.flush()
+    assert recorder.writes[-1] == ("c", "d", [4])
+
+
+def test_failed_write_is_retried(tmp_path):
+    attempts = []
+
+    def flaky(eta_id, upload_date, history):
+        attempts.append(history)
+        if len(attempts) == 1:
+            raise RuntimeError("throttled")
+
+    buffer = WriteBehindBuffer(flaky, tmp_path / "chat.wal", flush_delay=0.01)
+    buffer.enqueue("user", "2024", [1])
+
+    assert buffer.flush()
+    assert attempts == [[1], [1]]
+    assert buffer.stats()["retries"] == 1
+
+
+class ClientError(Exception):
+    # Shaped like botocore's ClientError, which is all the buffer looks at.
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+def test_write_that_can_never_succeed_is_dropped(tmp_path):
+    attempts = []
+
+    def writer(eta_id, upload_date, history):
+        attempts.append(eta_id)
+        if eta_id == "huge":
+            raise ClientError("ValidationException")
+
+    wal = tmp_path / "chat.wal"
+    buffer = WriteBehindBuffer(writer, wal, flush_delay=0.01)
+    buffer.enqueue("huge", "d", ["x"])
+    buffer.enqueue("fine", "d", ["y"])
+
+    assert buffer.flush()
+    assert attempts.count("huge") == 1
+    assert buffer.pending("huge", "d") is None
+    stats = buffer.stats()
+    assert stats["dropped"] == 1 and stats["retries"] == 0 and stats["flushed"] == 1
+
+    # Nothing left in the log to replay after a restart either.
+    assert buffer.wal_path.read_text() == ""
+
+
+def test_write_is_dropped_after_max_attempts(tmp_path):
+    attempts = []
+
+    def writer(eta_id, upload_date, history):
+        attempts.append(history)
+        raise ClientError("ProvisionedThroughputExceededException")
+
+    buffer = WriteBehindBuffer(writer, tmp_path / "chat.wal", flush_delay=0.01,
+                               max_backoff=0.01, max_attempts=3)
+    buffer.enqueue("user", "d", [1])
+
+    assert buffer.flush()
+    assert attempts == [[1], [1], [1]]
+    assert buffer.stats()["retries"] == 2 and buffer.stats()["dropped"] == 1
+
+
+def test_log_is_compacted_while_a_key_stays_pending(tmp_path):
+    stuck = threading.Event()
+
+    def writer(eta_id, upload_date, history):
+        if eta_id == "stuck":
+            stuck.wait(5)
+
+    wal = tmp_path / "chat.wal"
+    buffer = WriteBehindBuffer(writer, wal, flush_delay=0.01, compact_bytes=2048)
+    buffer.enqueue("stuck", "d", ["x" * 100])
+    for index in range(50):
+        buffer.enqueue("busy", "d", ["y" * 100, index])
+
+    stats = buffer.stats()
+    assert stats["compactions"] > 0
+    assert stats["wal_bytes"] < 4096
+    puts = {(record["eta_id"], record["seq"])
+            for record in _records(buffer.wal_path) if record["op"] == "put"}
+    assert ("stuck", 1) in puts
+
+    stuck.set()
+    assert buffer.flush()
+
+
+def _put(seq, eta_id, history):
+    return json.dumps({"op": "put", "seq": seq, "eta_id": eta_id, "upload_date": "d",
+                       "chat_history": history}) + "\n"
+
+
+def test_a_second_process_cannot_share_the_log(tmp_path):
+    wal = tmp_path / "chat.wal"
+    with (tmp_path / "chat.lock").open("a") as other_process:
+        fcntl.flock(other_process, fcntl.LOCK_EX)
+        with pytest.raises(RuntimeError, match="single worker"):
+            WriteBehindBuffer(Recorder(), wal, flush_delay=0.01)
+    assert not wal.exists()
+
+
+def test_per_process_logs_from_an_earlier_release_are_replayed(tmp_path):
+    wal = tmp_path / "chat.wal"
+    (tmp_path / "chat.101.wal").write_text(_put(1, "worker", [1]))
+    (tmp_path / "chat.101.wal.lock").touch()
+    wal.write_text(_put(3, "main", [2]))
+
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, wal, flush_delay=0.01)
+    assert buffer.flush()
+    assert sorted(recorder.writes) == [("main", "d", [2]), ("worker", "d", [1])]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["chat.lock", "chat.wal"]
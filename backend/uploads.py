@@ -0,0 +1,69 @@
+import functools
+from os import environ as env
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterator
+
+from flask import Request, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MEMORY_BYTES = 512 * 1024
+# Declared lengths cover the whole multipart body, not just the file.
+MULTIPART_OVERHEAD = 64 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+
+def upload_max_bytes() -> int:
+    return int(env.get("UPLOAD_MAX_BYTES") or DEFAULT_MAX_BYTES)
+
+
+class BoundedSpooledFile(SpooledTemporaryFile):
+    """Spooled temporary file that refuses to grow past `max_bytes`.
+
+    Small uploads stay in memory; anything over `memory_bytes` rolls over
+    to disk. The limit is checked on every write, so an oversized upload
+    is rejected while it is still being received.
+    """
+
+    def __init__(self, max_bytes: int, memory_bytes: int):
+        super().__init__(max_size=memory_bytes, mode="w+b")
+        self.max_bytes = max_bytes
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        if self.written > self.max_bytes:
+            raise RequestEntityTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        return super().write(data)
+
+
+class SpooledUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None) -> BinaryIO:
+        return BoundedSpooledFile(
+            upload_max_bytes(),
+            int(env.get("UPLOAD_MEMORY_BYTES") or DEFAULT_MEMORY_BYTES),
+        )
+
+
+def bounded_upload(view):
+    """Reject an upload on its declared length before the body is read;
+    SpooledUploadRequest enforces the same limit while streaming."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        max_bytes = upload_max_bytes()
+        if (request.content_length or 0) > max_bytes + MULTIPART_OVERHEAD:
+            return jsonify({"error": f"File too large (limit {max_bytes} bytes)"}), 413
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def iter_chunks(stream: BinaryIO, size: int = CHUNK_BYTES) -> Iterator[bytes]:
+    stream.seek(0)
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,296 @@
+import atexit
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import closing, contextmanager
+from os import environ as env
+from pathlib import Path
+from typing import Iterator
+
+from flask import Response, g, has_request_context, jsonify, make_response, request
+
+DEFAULT_USAGE_DB = Path(__file__).with_name("usage_data") / "usage.sqlite"
+DEFAULT_BUCKET_SECONDS = 3600
+DEFAULT_FLUSH_SECONDS = 5
+DEFAULT_QUEUE_WAIT_SECONDS = 5
+COUNTERS = ("requests", "rejected", "errors", "prompt_chars", "output_chars",
+            "audio_bytes", "upstream_calls", "upstream_ms")
+_USER_FIELDS = ("ElectronincTeachingAssistantMaterialID", "eta_id", "etaId")
+# Left to the form parser: reading these as JSON would consume the stream.
+_FORM_MIMETYPES = ("multipart/form-data", "application/x-www-form-urlencoded")
+_WINDOWS = {"per_minute": 60, "per_hour": 3600, "per_day": 86400}
+_scope = threading.local()
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS usage (
+    eta_id TEXT NOT NULL,
+    route TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    {", ".join(f"{name} INTEGER NOT NULL DEFAULT 0" for name in COUNTERS)},
+    PRIMARY KEY (eta_id, route, bucket)
+) WITHOUT ROWID;
+"""
+
+
+class UsageLedger:
+    """Per-user, per-route usage counters in time buckets.
+
+    `add` only touches an in-memory tally; a background thread folds it
+    into a local SQLite file every `flush_seconds` with one upsert per
+    (user, route, bucket), so the request path never waits on disk.
+    """
+
+    def __init__(self, path: Path, *, bucket_seconds: int = DEFAULT_BUCKET_SECONDS,
+                 flush_seconds: float = DEFAULT_FLUSH_SECONDS):
+        self.path = Path(path)
+        self.bucket_seconds = bucket_seconds
+        self._pending: dict[tuple[str, str, int], Counter] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path)) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(flush_seconds,),
+                         name="usage-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def add(self, eta_id: str, route: str, **counters: int):
+        bucket = int(time.time()) // self.bucket_seconds * self.bucket_seconds
+        with self._lock:
+            self._pending.setdefault((eta_id, route, bucket), Counter()).update(
+                {name: int(value) for name, value in counters.items() if value})
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        columns = ", ".join(COUNTERS)
+        updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in COUNTERS)
+        rows = [
+            (eta_id, route, bucket, *(tally.get(name, 0) for name in COUNTERS))
+            for (eta_id, route, bucket), tally in pending.items()
+        ]
+        with self._flush_lock, closing(sqlite3.connect(self.path, timeout=10)) as connection, connection:
+            connection.executemany(
+                f"INSERT INTO usage (eta_id, route, bucket, {columns}) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(COUNTERS))}) "
+                f"ON CONFLICT(eta_id, route, bucket) DO UPDATE SET {updates}",
+                rows,
+            )
+
+    def report(self, *, eta_id: str | None = None, route: str | None = None,
+               since: int | None = None, until: int | None = None,
+               by_bucket: bool = False, limit: int = 500) -> list[dict]:
+        self.flush()
+        clauses, params = [], []
+        for column, op, value in (("eta_id", "=", eta_id), ("route", "=", route),
+                                  ("bucket", ">=", since), ("bucket", "<", until)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        group = ["eta_id", "route"] + (["bucket"] if by_bucket else [])
+        sums = ", ".join(f"SUM({name}) AS {name}" for name in COUNTERS)
+        query = (
+            f"SELECT {', '.join(group)}, {sums} FROM usage"
+            + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+            + f" GROUP BY {', '.join(group)} ORDER BY requests DESC, {', '.join(group)} LIMIT ?"
+        )
+        with closing(sqlite3.connect(self.path, timeout=10)) as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(query, (*params, limit))]
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Counters stay lost for this interval rather than piling up.
+                pass
+
+
+class QuotaPolicy:
+    """Fixed-window request quotas per user, checked before a route runs.
+
+    `limits` maps a route name (or "*" for every metered route) to window
+    sizes, e.g. `{"voice": {"per_minute": 6, "per_day": 200}}`. Over-budget
+    requests wait up to `max_wait` seconds for the window to roll over when
+    `mode` is "queue"; otherwise, or once that wait would be too long, they
+    are rejected. Counts are per process.
+    """
+
+    def __init__(self, limits: dict, *, mode: str = "reject",
+                 max_wait: float = DEFAULT_QUEUE_WAIT_SECONDS):
+        self.limits = {
+            scope: {window: int(value) for window, value in (rules or {}).items() if window in _WINDOWS}
+            for scope, rules in (limits or {}).items()
+        }
+        self.mode = mode
+        self.max_wait = max_wait
+        self._counts: dict[tuple[str, str, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def _retry_after(self, eta_id: str, route: str, now: float) -> float:
+        wait = 0.0
+        for scope in (route, "*"):
+            for window, limit in self.limits.get(scope, {}).items():
+                size = _WINDOWS[window]
+                index = int(now // size)
+                if self._counts.get((eta_id, scope, window, index), 0) >= limit:
+                    wait = max(wait, (index + 1) * size - now)
+        return wait
+
+    def acquire(self, eta_id: str, route: str) -> float:
+        """Count one request; returns 0, or seconds to wait if rejected."""
+        if not self.limits:
+            return 0.0
+        deadline = time.monotonic() + (self.max_wait if self.mode == "queue" else 0)
+        while True:
+            with self._lock:
+                now = time.time()
+                wait = self._retry_after(eta_id, route, now)
+                if not wait:
+                    for scope in (route, "*"):
+                        for window in self.limits.get(scope, {}):
+                            key = (eta_id, scope, window, int(now // _WINDOWS[window]))
+                            self._counts[key] = self._counts.get(key, 0) + 1
+                    self._prune(now)
+                    return 0.0
+            if time.monotonic() + wait > deadline:
+                return wait
+            time.sleep(wait)
+
+    def _prune(self, now: float):
+        if len(self._counts) < 4096:
+            return
+        self._counts = {
+            key: count for key, count in self._counts.items()
+            if key[3] >= int(now // _WINDOWS[key[2]])
+        }
+
+
+_ledger: UsageLedger | None = None
+_ledger_settings: tuple[Path, int] | None = None
+_ledger_lock = threading.Lock()
+
+
+def configure_ledger(path: Path | None, *, bucket_seconds: int = DEFAULT_BUCKET_SECONDS):
+    """Record usage in the SQLite file at `path`; None turns accounting off.
+
+    Called by `create_app`. The file and its flush thread are only created
+    when the ledger is first used, so importing the app writes nothing.
+    """
+    global _ledger, _ledger_settings
+    settings = (Path(path), bucket_seconds) if path is not None else None
+    with _ledger_lock:
+        if settings != _ledger_settings and _ledger:
+            _ledger.close()
+            _ledger = None
+        _ledger_settings = settings
+
+
+def usage_ledger() -> UsageLedger | None:
+    global _ledger
+    if _ledger is None and _ledger_settings:
+        with _ledger_lock:
+            if _ledger is None and _ledger_settings:
+                path, bucket_seconds = _ledger_settings
+                _ledger = UsageLedger(path, bucket_seconds=bucket_seconds)
+    return _ledger
+
+
+usage_quotas = QuotaPolicy(
+    json.loads(env.get("USAGE_QUOTAS") or "{}"),
+    mode=(env.get("USAGE_QUOTA_MODE") or "reject").strip().lower(),
+    max_wait=float(env.get("USAGE_QUOTA_MAX_WAIT_SECONDS") or DEFAULT_QUEUE_WAIT_SECONDS),
+)
+
+
+def request_user() -> str:
+    """The ETA id a request is for, from its JSON body, form or query.
+
+    The body is read as the views read it (`force=True`), so leaving out the
+    JSON Content-Type does not skip metering or quotas.
+    """
+    payload = None
+    if request.mimetype not in _FORM_MIMETYPES:
+        payload = request.get_json(force=True, silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    for source in (payload, request.form, request.args):
+        for field in _USER_FIELDS:
+            value = source.get(field)
+            if isinstance(value, str) and value.strip():
+                return value.strip()
+    return ""
+
+
+@contextmanager
+def usage_scope() -> Iterator[Counter]:
+    """Collect `note_usage` counters on this thread, for work done by a
+    worker on behalf of a request (e.g. one item of a batch)."""
+    previous = getattr(_scope, "usage", None)
+    _scope.usage = tally = Counter()
+    try:
+        yield tally
+    finally:
+        _scope.usage = previous
+
+
+def note_usage(**counters: int):
+    """Attribute upstream work (prompt/output chars, audio bytes, latency)
+    to the metered request or usage scope in progress. No-op outside one."""
+    tally = getattr(_scope, "usage", None)
+    if tally is None:
+        if not has_request_context() or "usage" not in g:
+            return
+        tally = g.usage
+    tally.update({name: int(value) for name, value in counters.items() if value})
+
+
+def record_usage(eta_id: str, route: str, **counters: int):
+    """Add usage observed after the response, e.g. bytes of a streamed reply."""
+    ledger = usage_ledger() if eta_id else None
+    if ledger:
+        ledger.add(eta_id, route, **counters)
+
+
+def metered(route: str):
+    """Account a route's usage per user and enforce `USAGE_QUOTAS` before
+    the view (and so any Gemini or ElevenLabs call) runs."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            eta_id = request_user()
+            if not eta_id:
+                return view(*args, **kwargs)
+
+            retry_after = usage_quotas.acquire(eta_id, route)
+            if retry_after:
+                record_usage(eta_id, route, rejected=1)
+                response = make_response(jsonify({"error": "Usage quota exceeded"}), 429)
+                response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+                return response
+
+            g.usage = Counter()
+            status = 500
+            try:
+                response: Response = make_response(view(*args, **kwargs))
+                status = response.status_code
+                return response
+            finally:
+                record_usage(eta_id, route, requests=1, errors=int(status >= 500), **g.usage)
+
+        return wrapper
+
+    return decorator
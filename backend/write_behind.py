@@ -0,0 +1,290 @@
+import copy
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WAL_PATH = Path(__file__).with_name("wal") / "chat_history.wal"
+DEFAULT_FLUSH_DELAY = 0.05
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_COMPACT_BYTES = 8 * 1024 * 1024
+DEFAULT_MAX_ATTEMPTS = 10
+# DynamoDB rejects these for the item itself (too large, bad attribute), so
+# writing the same value again can never succeed.
+NON_RETRYABLE_CODES = frozenset({
+    "ValidationException",
+    "SerializationException",
+    "ItemCollectionSizeLimitExceededException",
+})
+
+Key = tuple[str, str]
+
+
+def _error_code(exc: Exception) -> str | None:
+    # botocore's ClientError carries the service error code in `response`.
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+class WriteBehindBuffer:
+    """Coalescing, write-ahead-logged buffer for full-item history writes.
+
+    `enqueue` records the write in an fsync'd log and returns immediately.
+    A background thread flushes the newest pending value per key, retrying
+    with capped exponential backoff; a key's pending value is only dropped
+    once that exact version is stored, or given up on: a write that fails
+    with a non-retryable DynamoDB error, or `max_attempts` times in a row,
+    is dropped, logged and counted in `stats()["dropped"]`. `pending` lets the read path see
+    unflushed state so a follow-up request never builds on stale history.
+    On start-up any writes left in the log by a crash are replayed.
+
+    Every enqueue appends the key's full history, so superseded and flushed
+    records pile up while other keys stay pending. Once the log passes
+    `compact_bytes` and is more than twice the size of what is still
+    pending, it is rewritten with only the latest pending record per key.
+
+    The queue lives in one process, so only one process may own `wal_path`:
+    the buffer holds an flock on `<stem>.lock` beside it for as long as it
+    runs and refuses to start while another process holds it. Under it, a
+    second worker would read stale history and its full-item write would be
+    overwritten by this buffer's later flush.
+    """
+
+    def __init__(self, writer: Callable[[str, str, list], None], wal_path: Path, *,
+                 flush_delay: float = DEFAULT_FLUSH_DELAY,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 compact_bytes: int = DEFAULT_COMPACT_BYTES,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self._writer = writer
+        self.wal_path = Path(wal_path)
+        self._flush_delay = flush_delay
+        self._max_backoff = max_backoff
+        self._compact_bytes = compact_bytes
+        self._max_attempts = max_attempts
+        self._wal_bytes = 0
+        # Size of each pending key's latest put record in the log.
+        self._live_bytes: dict[Key, int] = {}
+        self._pending: dict[Key, tuple[int, list]] = {}
+        self._retry_at: dict[Key, float] = {}
+        self._failures: dict[Key, int] = {}
+        self._seq = 0
+        self._lock = threading.Condition()
+        self._stats = {"enqueued": 0, "coalesced": 0, "flushed": 0, "retries": 0,
+                       "dropped": 0, "compactions": 0}
+        self.wal_path.parent.mkdir(parents=True, exist_ok=True)
+        self._owner_lock = self._claim_log()
+        self._wal = self.wal_path.open("a", encoding="utf-8")
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+
+    def enqueue(self, eta_id: str, upload_date: str, chat_history: list):
+        key = (eta_id, upload_date)
+        # Snapshot: callers keep mutating their copy after the response.
+        chat_history = copy.deepcopy(chat_history)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._live_bytes[key] = self._append_wal(
+                self._put_line(seq, key, chat_history))
+            if key in self._pending:
+                self._stats["coalesced"] += 1
+            self._pending[key] = (seq, chat_history)
+            self._retry_at.pop(key, None)
+            self._failures.pop(key, None)
+            self._stats["enqueued"] += 1
+            self._maybe_compact()
+            self._lock.notify()
+
+    def pending(self, eta_id: str, upload_date: str) -> list | None:
+        with self._lock:
+            entry = self._pending.get((eta_id, upload_date))
+        return copy.deepcopy(entry[1]) if entry else None
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._retry_at.clear()
+            self._lock.notify()
+            while self._pending and time.monotonic() < deadline:
+                self._lock.wait(0.05)
+            return not self._pending
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), wal_bytes=self._wal_bytes)
+
+    @staticmethod
+    def _line(record: dict) -> str:
+        return json.dumps(record, separators=(",", ":"), default=_json_default) + "\n"
+
+    def _put_line(self, seq: int, key: Key, history: list) -> str:
+        return self._line({"op": "put", "seq": seq, "eta_id": key[0],
+                           "upload_date": key[1], "chat_history": history})
+
+    def _append_wal(self, line: str) -> int:
+        self._wal.write(line)
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        size = len(line.encode("utf-8"))
+        self._wal_bytes += size
+        return size
+
+    def _maybe_compact(self):
+        # Called under the lock.
+        if not self._pending:
+            # Nothing outstanding: start the log afresh.
+            self._compact()
+        elif (self._wal_bytes >= self._compact_bytes
+              and self._wal_bytes > 2 * sum(self._live_bytes.values())):
+            self._compact()
+
+    def _compact(self):
+        self._wal.close()
+        self._rewrite_wal()
+        self._wal = self.wal_path.open("a", encoding="utf-8")
+        self._stats["compactions"] += 1
+
+    @staticmethod
+    def _try_lock(path: Path):
+        handle = path.open("a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+        return handle
+
+    def _claim_log(self):
+        owner = self._try_lock(self.wal_path.with_suffix(".lock"))
+        if owner is None:
+            raise RuntimeError(
+                f"{self.wal_path} is in use by another process; chat write-behind "
+                "needs a single worker (set CHAT_WRITE_BEHIND=0 or run one process)")
+        # Logs named `<stem>.<pid><suffix>` were written by a release that
+        # kept one log per process; their entries are replayed here too.
+        leftovers = sorted(
+            self.wal_path.parent.glob(f"{self.wal_path.stem}.*{self.wal_path.suffix}"),
+            key=lambda path: path.stat().st_mtime)
+        # Oldest first, so where two logs hold the same key the newer wins.
+        for path in [*leftovers, self.wal_path]:
+            if not path.is_file():
+                continue
+            for key, history in self._read_log(path).items():
+                self._seq += 1
+                self._pending[key] = (self._seq, history)
+        if self._pending:
+            logger.warning("Replaying %d unflushed chat history writes", len(self._pending))
+        self._rewrite_wal()
+        for path in leftovers:
+            path.unlink(missing_ok=True)
+            path.with_name(path.name + ".lock").unlink(missing_ok=True)
+        return owner
+
+    @staticmethod
+    def _read_log(path: Path) -> dict[Key, list]:
+        """Return the newest unflushed history per key in the log at `path`."""
+        latest: dict[Key, tuple[int, list]] = {}
+        done: set[int] = set()
+        with path.open(encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write.
+                    continue
+                if record.get("op") == "done":
+                    done.add(record["seq"])
+                elif record.get("op") == "put":
+                    latest[(record["eta_id"], record["upload_date"])] = (
+                        record["seq"], record["chat_history"])
+        return {key: history for key, (seq, history) in latest.items() if seq not in done}
+
+    def _rewrite_wal(self):
+        # Called with no writers active (start-up) or under the lock.
+        temporary = self.wal_path.with_suffix(".tmp")
+        self._live_bytes = {}
+        with temporary.open("w", encoding="utf-8") as handle:
+            for key, (seq, history) in self._pending.items():
+                line = self._put_line(seq, key, history)
+                handle.write(line)
+                self._live_bytes[key] = len(line.encode("utf-8"))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, self.wal_path)
+        self._wal_bytes = sum(self._live_bytes.values())
+
+    def _next_ready(self) -> tuple[Key, int, list] | None:
+        now = time.monotonic()
+        for key, (seq, history) in self._pending.items():
+            if self._retry_at.get(key, 0) <= now:
+                return key, seq, history
+        return None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while True:
+                    ready = self._next_ready()
+                    if ready:
+                        break
+                    waits = [at - time.monotonic() for at in self._retry_at.values()]
+                    self._lock.wait(max(min(waits), 0.01) if waits else None)
+            # Give concurrent requests for the same user a moment to coalesce.
+            time.sleep(self._flush_delay)
+            with self._lock:
+                ready = self._next_ready()
+            if not ready:
+                continue
+            key, seq, history = ready
+            try:
+                self._writer(key[0], key[1], history)
+            except Exception as exc:
+                with self._lock:
+                    failures = self._failures.get(key, 0) + 1
+                    code = _error_code(exc)
+                    if code in NON_RETRYABLE_CODES or failures >= self._max_attempts:
+                        self._stats["dropped"] += 1
+                        self._finish(key, seq)
+                        logger.error(
+                            "Dropping chat history write for %s after %d attempt(s) (%s)",
+                            key[0], failures, code or type(exc).__name__, exc_info=True)
+                        continue
+                    self._failures[key] = failures
+                    self._retry_at[key] = time.monotonic() + min(
+                        self._max_backoff, 0.5 * 2 ** (failures - 1))
+                    self._stats["retries"] += 1
+                logger.warning("Chat history write for %s failed (attempt %d)",
+                               key[0], failures, exc_info=True)
+                continue
+
+            with self._lock:
+                self._stats["flushed"] += 1
+                self._finish(key, seq)
+
+    def _finish(self, key: Key, seq: int):
+        # Called under the lock once `seq` is stored or given up on. A newer
+        # value enqueued meanwhile stays pending.
+        self._failures.pop(key, None)
+        current = self._pending.get(key)
+        if current and current[0] == seq:
+            del self._pending[key]
+            self._retry_at.pop(key, None)
+            self._live_bytes.pop(key, None)
+        self._append_wal(self._line({"op": "done", "seq": seq}))
+        self._maybe_compact()
+        self._lock.notify_all()
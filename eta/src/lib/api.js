@@ -9,6 +9,37 @@ const BASE_URL = (import.meta.env.VITE_API_BASE_URL || DEFAULT_BASE_URL).replace
   ''
 );
 
+function newIdempotencyKey() {
+  if (typeof crypto !== 'undefined' && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+// Network errors, 409 "still in progress" and gateway errors are retried
+// with the same Idempotency-Key, so the server runs the action at most once.
+const IDEMPOTENT_RETRY_DELAYS_MS = [500, 1500, 3000];
+
+function isRetryable(error) {
+  return error.status === undefined || error.status === 409 || error.status >= 502;
+}
+
+async function withIdempotencyKey(idempotencyKey, send) {
+  const key = idempotencyKey || newIdempotencyKey();
+  for (let attempt = 0; ; attempt += 1) {
+    try {
+      return await send(key);
+    } catch (error) {
+      if (!isRetryable(error) || attempt >= IDEMPOTENT_RETRY_DELAYS_MS.length) {
+        throw error;
+      }
+      await new Promise((resolve) =>
+        setTimeout(resolve, IDEMPOTENT_RETRY_DELAYS_MS[attempt])
+      );
+    }
+  }
+}
+
 function buildUrl(path, searchParams) {
   const target = path.startsWith('http')
     ? new URL(path)
@@ -193,6 +224,7 @@ export async function sendChatMessage({
   chatId,
   message,
   persona,
+  idempotencyKey,
 } = {}) {
   if (!etaId || !chatId || !message) {
     throw new Error('etaId, chatId, and message are required.');
@@ -205,10 +237,13 @@ export async function sendChatMessage({
     persona,
   };
 
-  return request('/thread/add_message', {
-    method: 'POST',
-    body,
-  });
+  return withIdempotencyKey(idempotencyKey, (key) =>
+    request('/thread/add_message', {
+      method: 'POST',
+      body,
+      headers: { 'Idempotency-Key': key },
+    })
+  );
 }
 
 export async function fetchThread({ etaId, chatId } = {}) {
@@ -225,10 +260,44 @@ export async function fetchThread({ etaId, chatId } = {}) {
   });
 }
 
+export async function fetchArchivedMessages({ etaId, chatId, before, limit } = {}) {
+  if (!etaId || !chatId) {
+    throw new Error('etaId and chatId are required.');
+  }
+
+  return request('/thread/archive', {
+    method: 'GET',
+    searchParams: {
+      etaId,
+      chatId,
+      before,
+      limit,
+    },
+  });
+}
+
+export async function searchUserContent({ etaId, query, page, pageSize } = {}) {
+  if (!etaId || !query) {
+    throw new Error('etaId and query are required.');
+  }
+
+  return request('/search', {
+    method: 'GET',
+    searchParams: {
+      etaId,
+      q: query,
+      page,
+      page_size: pageSize,
+    },
+  });
+}
+
 export async function generatePracticeProblems({
   etaId,
   chatId,
   message,
+  refresh = false,
+  idempotencyKey,
 } = {}) {
   if (!etaId || !chatId) {
     throw new Error('etaId and chatId are required.');
@@ -238,15 +307,19 @@ export async function generatePracticeProblems({
     eta_id: etaId,
     chatID: chatId,
     message,
+    refresh,
   };
 
-  return request('/generate-practice-problems', {
-    method: 'POST',
-    body,
-  });
+  return withIdempotencyKey(idempotencyKey, (key) =>
+    request('/generate-practice-problems', {
+      method: 'POST',
+      body,
+      headers: { 'Idempotency-Key': key },
+    })
+  );
 }
 
-export async function generateWeeklyPlan({ etaId, chatId } = {}) {
+export async function generateWeeklyPlan({ etaId, chatId, refresh = false } = {}) {
   if (!etaId || !chatId) {
     throw new Error('etaId and chatId are required.');
   }
@@ -254,6 +327,7 @@ export async function generateWeeklyPlan({ etaId, chatId } = {}) {
   const body = {
     eta_id: etaId,
     chatID: chatId,
+    refresh,
   };
 
   return request('/generate-weekly-plan', {
@@ -283,39 +357,56 @@ export async function requestVoiceResponse({
   chatId,
   question,
   persona,
+  messageTimestamp,
+  format = 'audio/mpeg',
+  quality,
+  idempotencyKey,
 } = {}) {
   if (!etaId || !chatId) {
     throw new Error('etaId and chatId are required.');
   }
-  if (!question) {
-    throw new Error('question is required for voice synthesis.');
+  if (!question && !messageTimestamp) {
+    throw new Error('question or messageTimestamp is required for voice synthesis.');
   }
 
   const url = buildUrl('/voice-response');
-  const response = await fetch(url.toString(), {
-    method: 'POST',
-    credentials: 'include',
-    headers: {
-      Accept: 'audio/mpeg',
-      'Content-Type': 'application/json',
-    },
-    body: JSON.stringify({
-      eta_id: etaId,
-      chatID: chatId,
-      question,
-      persona,
-    }),
-  });
+  const response = await withIdempotencyKey(idempotencyKey, async (key) => {
+    const attempt = await fetch(url.toString(), {
+      method: 'POST',
+      credentials: 'include',
+      headers: {
+        Accept: format,
+        'Content-Type': 'application/json',
+        'Idempotency-Key': key,
+      },
+      body: JSON.stringify({
+        eta_id: etaId,
+        chatID: chatId,
+        question,
+        persona,
+        message_timestamp: messageTimestamp,
+        quality,
+      }),
+    });
 
-  if (!response.ok) {
-    const message = await response.text();
-    const error = new Error(message || response.statusText);
-    error.status = response.status;
-    throw error;
-  }
+    if (!attempt.ok) {
+      const message = await attempt.text();
+      const error = new Error(message || attempt.statusText);
+      error.status = attempt.status;
+      throw error;
+    }
+    return attempt;
+  });
 
   const audio = await response.arrayBuffer();
-  return { audio, animation: response.headers.get('x-animation') || null };
+  const audioPath = response.headers.get('content-location');
+  return {
+    audio,
+    animation: response.headers.get('x-animation') || null,
+    mimeType: response.headers.get('content-type') || format,
+    // Replayable with Range requests while the server keeps the clip cached.
+    audioUrl: audioPath ? buildUrl(audioPath).toString() : null,
+  };
 }
 
 export async function uploadContext({ etaId, file }) {
@@ -10,6 +10,8 @@ import {
   createThread as apiCreateThread,
   sendChatMessage as apiSendChatMessage,
   fetchThread as apiFetchThread,
+  fetchArchivedMessages as apiFetchArchivedMessages,
+  searchUserContent as apiSearchUserContent,
   generateNotes as apiGenerateNotes,
   generatePracticeProblems as apiGeneratePracticeProblems,
   requestVoiceResponse as apiRequestVoiceResponse,
@@ -189,8 +191,40 @@ function ChatSidebar({
   isSpeaking,
   isCreatingThread,
   animationOverride,
+  onSearch,
 }) {
   const [isModalOpen, setIsModalOpen] = useState(false);
+  const [searchQuery, setSearchQuery] = useState('');
+  // null while the regular session list is shown.
+  const [searchResults, setSearchResults] = useState(null);
+  const [searchError, setSearchError] = useState('');
+  const [isSearching, setIsSearching] = useState(false);
+
+  const clearSearch = () => {
+    setSearchQuery('');
+    setSearchResults(null);
+    setSearchError('');
+  };
+
+  const runSearch = async (event) => {
+    event.preventDefault();
+    const query = searchQuery.trim();
+    if (!query) {
+      clearSearch();
+      return;
+    }
+    setIsSearching(true);
+    try {
+      setSearchResults(await onSearch(query));
+      setSearchError('');
+    } catch (error) {
+      console.error('Search failed', error);
+      setSearchResults([]);
+      setSearchError(error.message || 'Search is unavailable right now.');
+    } finally {
+      setIsSearching(false);
+    }
+  };
 
   const openModal = () => {
     setIsModalOpen(true);
@@ -230,9 +264,57 @@ function ChatSidebar({
             </button>
           ) : null}
         </header>
+        {onSearch ? (
+          <form className="chat__search" onSubmit={runSearch}>
+            <input
+              type="search"
+              value={searchQuery}
+              onChange={(event) => {
+                setSearchQuery(event.target.value);
+                if (!event.target.value) clearSearch();
+              }}
+              placeholder="Search sessions and uploads…"
+              aria-label="Search sessions and uploads"
+            />
+            <button
+              type="submit"
+              className="chat__new-session"
+              disabled={isSearching}
+            >
+              {isSearching ? 'Searching…' : 'Search'}
+            </button>
+          </form>
+        ) : null}
         <div className="chat__thread-list-wrapper">
           <ul className="chat__thread-list">
-            {threads.length === 0 ? (
+            {searchResults !== null ? (
+              searchResults.length === 0 ? (
+                <li className="chat__thread-empty">
+                  {searchError || 'No matches found.'}
+                </li>
+              ) : (
+                searchResults.map((result) => (
+                  <li key={`${result.kind}-${result.ref}`}>
+                    <button
+                      type="button"
+                      className="chat__thread-card"
+                      disabled={!result.chat_id}
+                      onClick={() => {
+                        onSelectThread(result.chat_id);
+                        clearSearch();
+                      }}
+                    >
+                      <h3>
+                        {result.kind === 'context'
+                          ? 'Uploaded context'
+                          : result.title || 'Session'}
+                      </h3>
+                      <p>{result.snippet}</p>
+                    </button>
+                  </li>
+                ))
+              )
+            ) : threads.length === 0 ? (
               <li className="chat__thread-empty">
                 No sessions yet. Create one to begin.
               </li>
@@ -295,13 +377,30 @@ function MessageBubble({ role, content, onClick }) {
   );
 }
 
-function ChatMessages({ messages, onMessageClick, isLoading }) {
+function ChatMessages({
+  messages,
+  onMessageClick,
+  isLoading,
+  hasEarlier,
+  isLoadingEarlier,
+  onLoadEarlier,
+}) {
   const listRef = useRef(null);
+  const tailRef = useRef(null);
+  const heightRef = useRef(0);
 
   useEffect(() => {
-    if (listRef.current) {
-      listRef.current.scrollTop = listRef.current.scrollHeight;
+    const list = listRef.current;
+    if (!list) return;
+    const tail = messages[messages.length - 1];
+    if (tail !== tailRef.current) {
+      list.scrollTop = list.scrollHeight;
+    } else {
+      // Earlier messages were added above: keep the same message in view.
+      list.scrollTop += list.scrollHeight - heightRef.current;
     }
+    tailRef.current = tail;
+    heightRef.current = list.scrollHeight;
   }, [messages]);
 
   const visibleMessages = isLoading ? [] : messages;
@@ -311,6 +410,16 @@ function ChatMessages({ messages, onMessageClick, isLoading }) {
       {isLoading ? (
         <div className="chat__messages-status">Loading conversation…</div>
       ) : null}
+      {!isLoading && hasEarlier ? (
+        <button
+          type="button"
+          className="chat__load-earlier"
+          onClick={onLoadEarlier}
+          disabled={isLoadingEarlier}
+        >
+          {isLoadingEarlier ? 'Loading…' : 'Load earlier messages'}
+        </button>
+      ) : null}
       {visibleMessages.map((message, index) => (
         <MessageBubble
           key={
@@ -498,7 +607,7 @@ function AvatarPreview({ isSpeaking, personaLabel, animationOverride }) {
   );
 }
 
-function ExpandedMessageOverlay({ message, onClose }) {
+function ExpandedMessageOverlay({ message, onClose, onListen, isListenBusy }) {
   useEffect(() => {
     if (!message) return;
 
@@ -519,6 +628,13 @@ function ExpandedMessageOverlay({ message, onClose }) {
 
   if (!message) return null;
 
+  // Only messages stored on the server can be voiced by their timestamp.
+  const canListen =
+    typeof onListen === 'function' &&
+    message.role === 'assistant' &&
+    !!message.timestamp &&
+    !message.localOnly;
+
   const renderContent = () => {
     if (typeof message.content !== 'string') {
       return <pre>{JSON.stringify(message.content, null, 2)}</pre>;
@@ -566,6 +682,16 @@ function ExpandedMessageOverlay({ message, onClose }) {
         </div>
         <div className="message-overlay__body">{renderContent()}</div>
         <div className="message-overlay__footer">
+          {canListen ? (
+            <button
+              type="button"
+              className="cta cta--ghost"
+              onClick={() => onListen(message)}
+              disabled={isListenBusy}
+            >
+              {isListenBusy ? 'Preparing Audio…' : 'Listen'}
+            </button>
+          ) : null}
           <button
             type="button"
             className="cta cta--primary"
@@ -667,6 +793,11 @@ function hydrateThreadFromBackend(thread, index = 0) {
     createdAt: thread.CreatedAt ?? null,
     updatedAt: thread.UpdatedAt ?? null,
     summary: formatMessagePreview(previewSource),
+    archivedCount: Number(thread.ArchivedMessages) || 0,
+    // Messages paged back from /thread/archive, oldest first; `archiveCursor`
+    // is the `before` for the next page, null once there are no more.
+    earlierMessages: [],
+    archiveCursor: undefined,
     raw: thread,
   };
 }
@@ -693,6 +824,7 @@ function Chat() {
   const [isGeneratingPractice, setIsGeneratingPractice] = useState(false);
   const [isRequestingVoice, setIsRequestingVoice] = useState(false);
   const [isUploadingContext, setIsUploadingContext] = useState(false);
+  const [loadingEarlierThreadId, setLoadingEarlierThreadId] = useState(null);
   const [errorNotice, setErrorNotice] = useState('');
   const ensuredInitialThreadRef = useRef(false);
   const [selectedAction, setSelectedAction] = useState('send');
@@ -709,7 +841,16 @@ function Chat() {
     [threads, activeThreadId]
   );
 
-  const activeMessages = activeThread?.messages ?? [];
+  const activeMessages = useMemo(
+    () =>
+      activeThread
+        ? [...activeThread.earlierMessages, ...activeThread.messages]
+        : [],
+    [activeThread]
+  );
+  const hasEarlierMessages = Boolean(
+    activeThread?.archivedCount && activeThread.archiveCursor !== null
+  );
   const trimmedInput = input.trim();
 
   const applyThreadUpdate = useCallback(
@@ -731,7 +872,8 @@ function Chat() {
         if (index === -1) {
           next.push(normalized);
         } else {
-          next[index] = normalized;
+          const { earlierMessages, archiveCursor } = prev[index];
+          next[index] = { ...normalized, earlierMessages, archiveCursor };
         }
         return next;
       });
@@ -957,6 +1099,51 @@ function Chat() {
     [etaProfile?.etaId, applyThreadUpdate]
   );
 
+  const handleLoadEarlier = useCallback(async () => {
+    const thread = activeThread;
+    if (!thread || !etaProfile?.etaId || loadingEarlierThreadId) return;
+    setLoadingEarlierThreadId(thread.id);
+    try {
+      const response = await apiFetchArchivedMessages({
+        etaId: etaProfile.etaId,
+        chatId: thread.id,
+        before: thread.archiveCursor ?? undefined,
+      });
+      const earlier = normalizeMessagesFromBackend(response?.messages || []);
+      setThreads((prev) =>
+        prev.map((entry) =>
+          entry.id === thread.id
+            ? {
+                ...entry,
+                earlierMessages: [...earlier, ...entry.earlierMessages],
+                archiveCursor: response?.next_before ?? null,
+              }
+            : entry
+        )
+      );
+      setErrorNotice('');
+    } catch (error) {
+      console.error('Failed to load earlier messages', error);
+      setErrorNotice(
+        error.message || 'Unable to load earlier messages right now.'
+      );
+    } finally {
+      setLoadingEarlierThreadId(null);
+    }
+  }, [activeThread, etaProfile?.etaId, loadingEarlierThreadId]);
+
+  const handleSearch = useCallback(
+    async (query) => {
+      const response = await apiSearchUserContent({
+        etaId: etaProfile?.etaId,
+        query,
+        pageSize: 20,
+      });
+      return Array.isArray(response?.results) ? response.results : [];
+    },
+    [etaProfile?.etaId]
+  );
+
   const handleSend = useCallback(async () => {
     const trimmed = trimmedInput;
     if (!trimmed || !etaProfile?.etaId || isSendingMessage) {
@@ -1271,6 +1458,26 @@ function Chat() {
     applyThreadUpdate,
   ]);
 
+  const presentVoiceAudio = useCallback(
+    (audio) => {
+      const blob = new Blob([audio], { type: 'audio/mpeg' });
+      const audioUrl = URL.createObjectURL(blob);
+      const release = () => {
+        try {
+          URL.revokeObjectURL(audioUrl);
+        } catch {
+          /* ignore */
+        }
+        setIsAvatarSpeaking(false);
+      };
+
+      setVoiceFallback({ audioUrl, release, animation: 'talking' });
+      voiceCleanupRef.current = null;
+      setSelectedAction('voice');
+    },
+    [setSelectedAction]
+  );
+
   const handleVoiceResponse = useCallback(async () => {
     if (!etaProfile?.etaId || isRequestingVoice) {
       return;
@@ -1311,6 +1518,7 @@ function Chat() {
                     role: 'assistant',
                     content: '🔊 Voice response delivered.',
                     timestamp: new Date().toISOString(),
+                    localOnly: true,
                   },
                 ],
                 summary: 'Voice response delivered.',
@@ -1319,20 +1527,7 @@ function Chat() {
         )
       );
 
-      const blob = new Blob([audio], { type: 'audio/mpeg' });
-      const audioUrl = URL.createObjectURL(blob);
-      const release = () => {
-        try {
-          URL.revokeObjectURL(audioUrl);
-        } catch {
-          /* ignore */
-        }
-        setIsAvatarSpeaking(false);
-      };
-
-      setVoiceFallback({ audioUrl, release, animation: 'talking' });
-      voiceCleanupRef.current = null;
-      setSelectedAction('voice');
+      presentVoiceAudio(audio);
       setExpandedMessage({
         role: 'assistant',
         content: 'Voice ready. Press play below to listen.',
@@ -1351,10 +1546,48 @@ function Chat() {
     trimmedInput,
     ensureThreadId,
     persona,
-    setSelectedAction,
     clearVoiceFallback,
+    presentVoiceAudio,
   ]);
 
+  const handleListenToMessage = useCallback(
+    async (message) => {
+      if (!etaProfile?.etaId || !activeThreadId || isRequestingVoice) {
+        return;
+      }
+      clearVoiceFallback();
+      setIsRequestingVoice(true);
+      try {
+        // The stored text is spoken as is; with SPECULATIVE_TTS on the
+        // server has usually rendered it already.
+        const { audio } = await apiRequestVoiceResponse({
+          etaId: etaProfile.etaId,
+          chatId: activeThreadId,
+          messageTimestamp: message.timestamp,
+          persona,
+        });
+        setErrorNotice('');
+        presentVoiceAudio(audio);
+        setExpandedMessage(null);
+      } catch (error) {
+        console.error('Failed to voice message', error);
+        setErrorNotice(
+          error.message || 'Unable to play this message right now.'
+        );
+      } finally {
+        setIsRequestingVoice(false);
+      }
+    },
+    [
+      etaProfile?.etaId,
+      activeThreadId,
+      isRequestingVoice,
+      persona,
+      clearVoiceFallback,
+      presentVoiceAudio,
+    ]
+  );
+
   useEffect(
     () => () => {
       if (voiceCleanupRef.current) {
@@ -1459,6 +1692,7 @@ function Chat() {
         isSpeaking={isAvatarSpeaking}
         isCreatingThread={isCreatingThread}
         animationOverride={animationOverride}
+        onSearch={etaProfile?.etaId ? handleSearch : undefined}
       />
       <section className="chat__panel">
         <header className="chat__header">
@@ -1489,6 +1723,9 @@ function Chat() {
           messages={activeMessages}
           isLoading={isMessagesLoading}
           onMessageClick={handleMessageClick}
+          hasEarlier={hasEarlierMessages}
+          isLoadingEarlier={loadingEarlierThreadId === activeThreadId}
+          onLoadEarlier={handleLoadEarlier}
         />
 
         <input
@@ -1537,6 +1774,8 @@ function Chat() {
       <ExpandedMessageOverlay
         message={expandedMessage}
         onClose={handleCloseExpandedMessage}
+        onListen={handleListenToMessage}
+        isListenBusy={isRequestingVoice}
       />
     </div>
   );